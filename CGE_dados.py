@@ -1,58 +1,45 @@
 # Importa bibliotecas
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import matplotlib.ticker as mticker
-import pandas as pd
 from datetime import datetime, timezone, timedelta
-import requests
+import rede
 import pytz
 import numpy as np
-import os
-from bs4 import BeautifulSoup
-import folium
-import re
+from cge_extrator import extrair
+from armazenamento import abrir_armazem, para_dataframe, exportar_csv, estado_estacao
+from historico import abrir_historico
+from meteorologia import calcular, ponto_orvalho, DERIVADAS_CGE
+from painel import PainelSerieTemporal, PAINEL_CGE
+from feed import gravar_feed, serie_temporal
 
 # Fuso horário de Brasília
 brasilia_tz = pytz.timezone("America/Sao_Paulo")
 
+def interpretar_pagina(response):
+    # Valores publicados na página da estação ('N/D' quando ausentes), lidos em
+    # uma única passada (cge_extrator). O resultado fica no cache de rede e não
+    # é recalculado se a página não mudar.
+    response.raise_for_status()
+    dados = extrair(response.content)
+    valores = {c: 'N/D' if dados[c] is None else dados[c] for c in ('chuva', 'temperatura', 'umidade')}
+    return dict(valores, horario=dados['horario'])
+
 def obter_dados_estacao():
     url = "https://www.cgesp.org/v3/estacao.jsp?POSTO=1000842"
     timestamp = datetime.now(brasilia_tz)
 
     try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # 1. Tentar encontrar o bloco de chuva
-        chuva_atual = 'N/D'
-        chuva_element = soup.find(lambda tag: tag.name == 'td' and "Per. Atual:" in tag.text)
-        if chuva_element:
-            match = re.search(r'Per\. Atual:\s*(\d+[,.]\d+)\s*mm', chuva_element.text.replace(",", "."))
-            if match:
-                chuva_atual = float(match.group(1))
+        dados, inalterada = rede.processar(url, interpretar_pagina, timeout=15)
+        if inalterada:
+            print("Página da estação inalterada desde a última consulta.")
 
-        temperatura = 'N/D'
-        temp_element = soup.find(lambda tag: tag.name == 'td' and "Atual:" in tag.text and "°C" in tag.text)
-        if temp_element:
-            match = re.search(r'Atual:\s*(\d+[,.]\d+)\s*°C', temp_element.text.replace(",", "."))
-            if match:
-                temperatura = float(match.group(1))
-
-        # 3. Tentar encontrar a Umidade Atual
-        umidade = 'N/D'
-        umidade_element = soup.find(lambda tag: tag.name == 'td' and "Atual:" in tag.text and "%" in tag.text)
-        if umidade_element:
-            match = re.search(r'Atual:\s*(\d+[,.]\d+)\s*%', umidade_element.text.replace(",", "."))
-            if match:
-                umidade = float(match.group(1))
+        # Horário da observação publicado na página (se não houver, fica o do relógio)
+        if dados['horario']:
+            timestamp = brasilia_tz.localize(datetime.strptime(dados['horario'], "%d/%m/%Y %H:%M"))
+        temperatura, umidade, chuva_atual = dados['temperatura'], dados['umidade'], dados['chuva']
 
         # Cálculo do Dew Point (apenas se tivermos temperatura e umidade)
         dew_point = None
-        if temperatura is not None and umidade is not None:
-            # Fórmula de Magnus-Tetens
-            gamma = np.log(umidade/100) + (17.625 * temperatura) / (243.04 + temperatura)
-            dew_point = (243.04 * gamma) / (17.625 - gamma)
+        if temperatura != 'N/D' and umidade != 'N/D':
+            dew_point = float(ponto_orvalho(temperatura, umidade))
 
         return temperatura, dew_point, chuva_atual, umidade, timestamp
 
@@ -63,253 +50,83 @@ def obter_dados_estacao():
 
 
 
-# Caminho do arquivo CSV
+# Caminho do arquivo CSV (exportado para o site) e do armazém de observações
 csv_file = 'CGE_weather_data.csv'
+COLUNAS = ['Temperature', 'Humidity', 'Rain', 'Dew Point']
 
-# Verificar se o arquivo existe
-if os.path.exists(csv_file):
-    # Ler os dados existentes
-    df = pd.read_csv(csv_file, parse_dates=['Timestamp'])
-    # Filtrar para manter apenas os dados das últimas 24 horas
-    now = datetime.now(brasilia_tz)
-    df = df[df['Timestamp'] >= now - pd.Timedelta(hours=24)]
-else:
-    # Criar um DataFrame vazio
-    df = pd.DataFrame(columns=['Timestamp', 'Temperature', 'Humidity', 'Rain', 'Dew Point'])
+# Abre o armazém (na primeira execução importa o CSV antigo)
+armazem = abrir_armazem('dados/cge_butanta', COLUNAS, csv_legado=csv_file)
+
+# Histórico de longo prazo: partições diárias e agregados horários/diários
+historico = abrir_historico('cge_butanta', COLUNAS, brasilia_tz, coluna_chuva='Rain')
+# Registra nos agregados o que ainda não entrou (na primeira vez, inclusive o CSV migrado)
+historico.sincronizar(armazem.ultimos())
 
 # Obter os dados atuais
 temp, dew_point, rain, humidity, timestamp = obter_dados_estacao()
 
-# Limites do eixo x: de timestamp - 25h até timestamp + 1h
-start_time = timestamp - timedelta(hours=25)
-end_time = timestamp + timedelta(hours=1)
+# Limites do eixo x: de agora - 25h até agora + 1h
+agora = datetime.now(brasilia_tz)
+start_time = agora - timedelta(hours=25)
+end_time = agora + timedelta(hours=1)
 
 
 
 
 
 
-if temp == 'N/D':
+if temp is None or temp == 'N/D':
     temp = np.nan
-if rain == 'N/D':
+if rain is None or rain == 'N/D':
     rain = np.nan
-if humidity == 'N/D':
+if humidity is None or humidity == 'N/D':
     humidity = np.nan
 
 if temp is not np.nan and rain is not np.nan and humidity is not np.nan:
-    # Verificar se o timestamp já existe no DataFrame
-    if timestamp not in df['Timestamp'].values:
-        # Criar um DataFrame com o novo dado
-        new_data = pd.DataFrame({
-            'Timestamp': [timestamp],
-            'Temperature': [temp],
-            'Humidity': [humidity],
-            'Rain': [rain],
-            'Dew Point': [dew_point]
-        })
-
-        # Concatenar com o DataFrame existente
-        df = pd.concat([df, new_data], ignore_index=True)
-
-        # Filtrar para manter apenas os dados das últimas 24 horas
-        now = datetime.now(brasilia_tz)
-        df = df[df['Timestamp'] >= now - pd.Timedelta(hours=24)]
-
-        # Salvar no arquivo CSV
-        df.to_csv(csv_file, index=False)
-        #Estacao On/Off
-        estadoEstacao = 'Online'
+    # Anexar a nova amostra ao armazém, indexada pelo horário da observação.
+    # Uma observação repetida (página sem atualizar) é recusada em O(1).
+    novo_dado = {
+        'Temperature': temp,
+        'Humidity': humidity,
+        'Rain': rain,
+        'Dew Point': dew_point
+    }
+    if armazem.anexar(timestamp, novo_dado):
+        # Reler a janela das últimas 24 horas e exportar o CSV do site
+        janela = armazem.janela(24 * 3600)
+        exportar_csv(janela, COLUNAS, csv_file, brasilia_tz, derivadas=calcular(janela, brasilia_tz, DERIVADAS_CGE))
+        # Atualizar os agregados e arquivar o que saiu da janela de 24 horas
+        historico.sincronizar(armazem.ultimos())
+        historico.arquivar(armazem.ultimos(), armazem.ultimo_ts() - 24 * 3600)
     else:
-        print("Dados já existentes para o timestamp:", timestamp)
-        #Estacao On/Off
-        estadoEstacao = 'Offline'
-
-    # Configurar subplots
-    fig, axs = plt.subplots(3, 1, figsize=(10, 11), sharex=True)
-    fig.suptitle("Tempo nas últimas 24 horas")
-
-    # Definir o colormap baseado na temperatura - NÃO ALTERAR O COLORMAP
-    c1 = plt.cm.Purples(np.linspace(0, 1, 50))
-    c2 = plt.cm.turbo(np.linspace(0, 1, 176))
-    c3 = plt.cm.get_cmap('PuRd_r')(np.linspace(0, 1, 50))
-    col = np.vstack((c1, c2, c3))
-    cmap = plt.cm.colors.ListedColormap(col)
-    cmap_hum = plt.cm.colors.ListedColormap(plt.cm.coolwarm(np.linspace(1, 0, 100)))
-    cmap_rad = plt.cm.colors.ListedColormap(plt.cm.Blues(np.linspace(0, 1, 50)))
-    temp_norm = (temp + 10) / 55  # Normaliza a temperatura dos limites [-10, 45]ºC para o intervalo [0, 1]
-    temp_norm = np.clip(temp_norm, 0, 1)  # Garante que o valor esteja entre 0 e 1
-    state_color = 'red' if estadoEstacao == "Offline" else 'green'
-    temp_color = cmap(temp_norm)
-    hum_color = cmap_hum(humidity / 100)
-    precip_color = cmap_rad(rain / 50)
-
-    hora_atual = f"{timestamp.hour:02d}"
-    minuto_atual = f"{timestamp.minute:02d}"
-    dia_atual = f"{timestamp.day:02d}"
-    mes_atual = f"{timestamp.month:02d}"
-    ano_atual = f"{timestamp.year}"
-    fig.text(0.5, 0.99, estadoEstacao, color=state_color, fontsize=16, ha='center')
-    # Exibir a temperatura, umidade, P.O. e pressão acima dos plots
-    plt.figtext(0.5, 1.15, f"Condições meteorológicas atuais na USP (Poli) - Atualizado {dia_atual}/{mes_atual}/{ano_atual} às {hora_atual}:{minuto_atual}", fontsize=18, ha='center')
-    
-    quadrado = plt.Rectangle((0.15, 1.03), 0.22, 0.10, transform=fig.transFigure, color=temp_color, lw=0)
-    fig.patches.append(quadrado)
-    # Definir a cor do texto com base na temperatura
-    text_color = 'white' if (temp >= 32 or temp < 8) else 'black'
-    # Usar o texto com a cor definida
-    plt.figtext(0.26, 1.055, f"Temperatura:\n {temp:.1f} °C", fontsize=20, ha='center', color=text_color)
-    plt.figtext(0.26, 1.00, f"Ponto de orvalho: {dew_point:.1f} °C", fontsize=12, ha='center', color='black')
-
-    quadrado = plt.Rectangle((0.39, 1.03), 0.22, 0.10, transform=fig.transFigure, color=hum_color, lw=0)
-    fig.patches.append(quadrado)
-    text_color = 'white' if (humidity >= 90) else 'black'
-    plt.figtext(0.50, 1.055, f"Umidade:\n {humidity:.0f} %", fontsize=20, ha='center', color=text_color)
-
-    quadrado = plt.Rectangle((0.63, 1.03), 0.22, 0.10, transform=fig.transFigure, color=precip_color, lw=0)
-    fig.patches.append(quadrado)
-    text_color = 'white' if (rain >= 30) else 'black'
-    plt.figtext(0.74, 1.055, f"Chuva acum.:\n {rain:.1f} mm", fontsize=20, ha='center', color=text_color)
-
-    
- 
-    
-    # Temperatura
-    axs[0].plot(df['Timestamp'], df['Temperature'], label="Temperatura", color='red', marker='o')
-    axs[0].plot(df['Timestamp'], df['Dew Point'], label="Ponto de orvalho", color="green", linestyle="--", marker='o',markersize=3)
-    axs[0].set_ylabel("Temperatura (°C)",fontsize=14)
-    axs[0].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x}"))
-    axs[0].legend(loc="upper left")
-    axs[0].grid(True)
-    for label in axs[0].get_yticklabels(): #Tamanho dos rótulos
-        label.set_fontsize(14)
-
-    # Umidade
-    axs[1].plot(df['Timestamp'], df['Humidity'], color='blue', marker='o')
-    axs[1].set_ylabel("Umidade relativa (%)",fontsize=14)
-    axs[1].set_ylim([0, 102]) 
-    axs[1].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.0f}"))
-    axs[1].grid(True)
-    for label in axs[1].get_yticklabels(): #Tamanho dos rótulos
-        label.set_fontsize(14)
+        print("Observação já registrada:", timestamp)
 
-    # Chuva
-    precip_diff = df['Rain'].diff().fillna(0).clip(lower=0)
-    axs[2].bar(df['Timestamp'], precip_diff, color='skyblue', label='Taxa de precipitação', width=0.02)
-    axs[2].set_ylabel("Chuva (mm)",fontsize=14)
-    axs[2].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.1f}"))
-    axs[2].grid(True)
-    for label in axs[2].get_yticklabels(): #Tamanho dos rótulos
-        label.set_fontsize(14)
-
-    # Formatação do eixo X
-    axs[2].xaxis.set_major_formatter(mdates.DateFormatter('%H:%M', tz=brasilia_tz))
-    axs[2].xaxis.set_major_locator(mdates.HourLocator(interval=2))
-    axs[2].set_xlim([start_time, end_time])
-    for label in axs[2].get_xticklabels():
-        label.set_fontsize(14)
-    plt.xlabel("Hora local",fontsize=14)
-    plt.gcf().autofmt_xdate()
-
-    # Configurar limites para cada eixo Y em cada subplot
-    axs[0].set_ylim(df['Dew Point'].min()-2, df['Temperature'].max()+2)
-    #axs[1].set_ylim(max(df['Humidity'].min()-10, 0), 101)
-    axs[2].set_ylim(0, precip_diff.max()+5)
-
-    # Salvar o gráfico em um arquivo
-    plt.tight_layout()
-    plt.savefig('graph_cge.png', bbox_inches='tight')
-    plt.close(fig)
+    #Estacao On/Off pela idade da observação
+    estadoEstacao = estado_estacao(timestamp)
 
 else:
     print("Dados não foram obtidos.")
     estadoEstacao = 'Offline'
-
-    # Configurar subplots
-    fig, axs = plt.subplots(3, 1, figsize=(10, 11), sharex=True)
-    fig.suptitle("Tempo e Extremos nas últimas 24 horas")
-
-    # Definir o colormap baseado na temperatura - NÃO ALTERAR O COLORMAP
-    c1 = plt.cm.Purples(np.linspace(0, 1, 50))
-    c2 = plt.cm.turbo(np.linspace(0, 1, 176))
-    c3 = plt.cm.get_cmap('PuRd_r')(np.linspace(0, 1, 50))
-    col = np.vstack((c1, c2, c3))
-    cmap = plt.cm.colors.ListedColormap(col)
-    cmap_hum = plt.cm.colors.ListedColormap(plt.cm.coolwarm(np.linspace(1, 0, 100)))
-    cmap_rad = plt.cm.colors.ListedColormap(plt.cm.Blues(np.linspace(0, 1, 50)))
-    state_color = 'red' if estadoEstacao == "Offline" else 'green'
-    temp_color = cmap_hum(0.5)
-    hum_color = cmap_hum(0.5)
-    precip_color = cmap_hum(0.5)
-    
-
-    hora_atual = f"{timestamp.hour:02d}"
-    minuto_atual = f"{timestamp.minute:02d}"
-    dia_atual = f"{timestamp.day:02d}"
-    mes_atual = f"{timestamp.month:02d}"
-    ano_atual = f"{timestamp.year}"
-    fig.text(0.5, 0.99, estadoEstacao, color=state_color, fontsize=16, ha='center')
-    # Exibir a temperatura, umidade, P.O. e pressão acima dos plots
-    plt.figtext(0.5, 1.15, f"Condições meteorológicas atuais na USP (Poli) - Atualizado {dia_atual}/{mes_atual}/{ano_atual} às {hora_atual}:{minuto_atual}", fontsize=18, ha='center')
-    
-    quadrado = plt.Rectangle((0.15, 1.03), 0.22, 0.10, transform=fig.transFigure, color=temp_color, lw=0)
-    fig.patches.append(quadrado)
-    text_color = 'black'
-    # Usar o texto com a cor definida
-    plt.figtext(0.26, 1.055, f"Temperatura:\n NaN °C", fontsize=20, ha='center', color=text_color)
-    plt.figtext(0.26, 1.00, f"Ponto de orvalho: NaN °C", fontsize=12, ha='center', color='black')
-
-    quadrado = plt.Rectangle((0.39, 1.03), 0.22, 0.10, transform=fig.transFigure, color=hum_color, lw=0)
-    fig.patches.append(quadrado)
-    plt.figtext(0.50, 1.055, f"Umidade:\n NaN %", fontsize=20, ha='center', color='black')
-
-    quadrado = plt.Rectangle((0.63, 1.03), 0.22, 0.10, transform=fig.transFigure, color=precip_color, lw=0)
-    fig.patches.append(quadrado)
-    plt.figtext(0.74, 1.055, f"Chuva acum.:\n NaN mm", fontsize=20, ha='center', color='black')
-  
-
-    # Temperatura
-    axs[0].plot(df['Timestamp'], df['Temperature'], label="Temperatura", color='red', marker='o')
-    axs[0].plot(df['Timestamp'], df['Dew Point'], label="Ponto de orvalho", color="green", linestyle="--", marker='o',markersize=3)
-    axs[0].set_ylabel("Temperatura (°C)",fontsize=14)
-    axs[0].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x}"))
-    axs[0].legend(loc="upper left")
-    axs[0].grid(True)
-    for label in axs[0].get_yticklabels(): #Tamanho dos rótulos
-        label.set_fontsize(14)
-
-    # Umidade
-    axs[1].plot(df['Timestamp'], df['Humidity'], color='blue', marker='o')
-    axs[1].set_ylabel("Umidade relativa (%)",fontsize=14)
-    axs[1].set_ylim([0, 110]) 
-    axs[1].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.0f}"))
-    axs[1].grid(True)
-    for label in axs[1].get_yticklabels(): #Tamanho dos rótulos
-        label.set_fontsize(14)
-
-    # Chuva
-    precip_diff = df['Rain'].diff().fillna(0).clip(lower=0)
-    axs[2].bar(df['Timestamp'], precip_diff, color='skyblue', label='Taxa de precipitação', width=0.02)
-    axs[2].set_ylabel("Chuva (mm)",fontsize=14)
-    axs[2].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.1f}"))
-    axs[2].grid(True)
-    for label in axs[2].get_yticklabels(): #Tamanho dos rótulos
-        label.set_fontsize(14)
-
-    # Formatação do eixo X
-    axs[2].xaxis.set_major_formatter(mdates.DateFormatter('%H:%M', tz=brasilia_tz))
-    axs[2].xaxis.set_major_locator(mdates.HourLocator(interval=2))
-    axs[2].set_xlim([start_time, end_time])
-    for label in axs[2].get_xticklabels():
-        label.set_fontsize(14)
-    plt.xlabel("Hora local",fontsize=14)
-    plt.gcf().autofmt_xdate()
-
-    # Configurar limites para cada eixo Y em cada subplot
-    axs[0].set_ylim(df['Dew Point'].min()-2, df['Temperature'].max()+2)
-    #axs[1].set_ylim(max(df['Humidity'].min()-10, 0), 101)
-    axs[2].set_ylim(0, df['Rain'].max()+5)
-
-    # Salvar o gráfico em um arquivo
-    plt.tight_layout()
-    plt.savefig('graph_cge.png', bbox_inches='tight')
-    plt.close(fig)
+    novo_dado = None
+
+# Janela das últimas 24 horas com as grandezas derivadas (taxa de chuva com
+# zeramento diário, índice de calor etc.), já calculadas se o CSV foi exportado
+janela = armazem.janela(24 * 3600)
+derivadas = calcular(janela, brasilia_tz, DERIVADAS_CGE)
+df = para_dataframe(janela, COLUNAS, brasilia_tz, derivadas)
+
+# Desenhar o painel e salvar o gráfico em um arquivo
+painel = PainelSerieTemporal(PAINEL_CGE, brasilia_tz)
+painel.desenhar(df, novo_dado, estadoEstacao, timestamp, start_time, end_time)
+painel.salvar('graph_cge.png')
+painel.fechar()
+
+# Feed JSON com os valores atuais e a série das últimas 24 horas (graph_cge.json)
+gravar_feed('graph_cge.json', 'cge_butanta', {
+    'estacao': 1000842,
+    'fuso': str(brasilia_tz),
+    'estado': estadoEstacao,
+    'observado_em': int(timestamp.timestamp()) if novo_dado is not None else armazem.ultimo_ts(),
+    'atual': novo_dado,
+    'serie': serie_temporal(janela['ts'], dict({c: janela[c] for c in COLUNAS}, **derivadas)),
+})
@@ -1,4 +1,5 @@
 import requests
+import rede
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
@@ -8,80 +9,44 @@ import matplotlib.colors as mcolors
 import numpy as np
 import pytz
 import json
-import geopandas as gpd
-import contextily as ctx
 from datetime import datetime, timezone, timedelta
 import os
-from bs4 import BeautifulSoup
-import folium
-import re
-
-# --- 3. Lista de Estações (Com POSTO ID e Coordenadas) ---
-# Estrutura: [('Nome da Estação', POSTO_ID, Latitude, Longitude)]
-estacoes_cge = [
-    ("Penha", 1000887, -23.530763, -46.528744),
-    ("Perus", 504, -23.40716, -46.75264),
-    ("Pirituba", 515, -23.489, -46.727),
-    ("Fregues. do Ó", 509, -23.47706, -46.66537),
-    ("Santana", 510, -23.51064, -46.61746),
-    ("Tremembé", 1000944, -23.459841, -46.585572),
-    #("S. Miguel", 1000862, -23.491511, -46.46361),
-    ("Itaim Paul.", 1000882, -23.49067, -46.43599),
-    ("S. Mateus", 1000844, -23.594199, -46.465567),
-    ("Sé", 503, -23.553, -46.656),
-    ("Butantã", 1000842, -23.5545389, -46.7259528),
-    ("Ipiranga", 1000840, -23.632978, -46.583518),
-    ("Santo Amaro", 1000852, -23.634789, -46.667657),
-    ("MBoi Mirim", 1000850, -23.671486, -46.727305),
-    ("Cidade Ademar", 592, -23.6675, -46.675),
-    ("Parelheiros", 507, -23.8678, -46.6522),
-    ("Marsilac", 1000300, -23.916332, -46.727397),
-    ("Lapa", 1000848, -23.52556, -46.75083),
-    ("Campo Limpo", 1000854, -23.65818, -46.76749),
-    ("Cap. Socorro Sub", 846, -23.723035, -46.699263),
-    ("Cap. Socorro", 1000857, -23.781133, -46.725217),
-    ("Vila Formosa", 1000859, -23.56403, -46.508234),
-    ("Mooca", 1000860, -23.530444, -46.595059),
-    ("Itaquera", 1000864, -23.552301, -46.44611),
-    ("Vila Prudente", 524, -23.583219, -46.560179),
-    ("Vila Maria", 540, -23.501611, -46.591534),
-    #("Vila Mariana", 495, -23.58472, -46.63556),
-    ("Riacho Grande", 400, -23.752079, -46.532528),
-    ("Mauá", 1000876, -23.667, -46.465),
-    ("S. de Parnaíba", 1000880, -23.43794, -46.90945),
-    ("Jabaquara", 634, -23.650814, -46.646581),
-    ("Pinheiros", 1000635, -23.551871, -46.695939)
-]
-
-def obter_dados_estacao(posto_id):
+from cge_extrator import extrair
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from imagens import salvar_variantes
+from feed import gravar_feed
+from mosaicos import adicionar_mapa_base
+import registro_estacoes
+from camadas import ComposicaoEstatica, chave_camadas
+from interpolacao import CampoIDW
+from matriz_estacoes import abrir_matriz
+from rotulos import posicionar_no_eixo
+import mapa_interativo
+
+# --- 3. Lista de Estações (postos ativos do CGE no cadastro estacoes.json) ---
+estacoes_cge = registro_estacoes.estacoes('cge')
+
+def interpretar_pagina(response):
+    # Leitura da página de uma estação em uma única passada (cge_extrator);
+    # guardada no cache de rede, então uma página que não mudou desde a última
+    # execução não é interpretada de novo
+    response.raise_for_status()
+    dados = extrair(response.content)
+    dados_tempo_real = {
+        "Temperatura": np.nan if dados['temperatura'] is None else dados['temperatura'],
+        "Chuva_Atual": np.nan if dados['chuva'] is None else dados['chuva'],
+    }
+
+    return dados_tempo_real
+
+def obter_dados_estacao(posto_id, prazo=None):
     url = f"https://www.cgesp.org/v3/estacao.jsp?POSTO={posto_id}"
 
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # 1. Tentar encontrar o bloco de chuva
-        chuva_atual = np.nan
-        chuva_element = soup.find(lambda tag: tag.name == 'td' and "Per. Atual:" in tag.text)
-        if chuva_element:
-            match = re.search(r'Per\. Atual:\s*(\d+[,.]\d+)\s*mm', chuva_element.text.replace(",", "."))
-            if match:
-                chuva_atual = float(match.group(1))
-
-        # 2. Tentar encontrar a Temperatura Atual
-        temperatura = np.nan
-        temp_element = soup.find(lambda tag: tag.name == 'td' and "Atual:" in tag.text and "°C" in tag.text)
-        if temp_element:
-            match = re.search(r'Atual:\s*(\d+[,.]\d+)\s*°C', temp_element.text.replace(",", "."))
-            if match:
-                temperatura = float(match.group(1))
-
-        dados_tempo_real = {
-            "Temperatura": temperatura,
-            "Chuva_Atual": chuva_atual,
-        }
-
+        # Com prazo: tempo limite até o prazo e sem novas tentativas (rede.py)
+        dados_tempo_real, _ = rede.processar(url, interpretar_pagina, timeout=10, prazo=prazo,
+                                             repetir=prazo is None)
         return dados_tempo_real
 
     except (requests.exceptions.RequestException, Exception) as e:
@@ -92,19 +57,47 @@ def obter_dados_estacao(posto_id):
         }
         return dados_tempo_real
 
+# Coleta concorrente: todas as estações são consultadas em paralelo (o limite
+# por host fica em rede.py) e o mapa não espera além do prazo total; cada
+# requisição só tem o tempo que falta até o prazo, sem novas tentativas, e
+# estações que não responderem a tempo entram como ausentes (NaN)
+MAX_CONSULTAS = 8
+PRAZO_COLETA = 45  # segundos
+
+inicio_coleta = time.monotonic()
+fim_coleta = inicio_coleta + PRAZO_COLETA
+executor = ThreadPoolExecutor(max_workers=MAX_CONSULTAS)
+consultas = {executor.submit(obter_dados_estacao, e['codigo'], fim_coleta): e['codigo'] for e in estacoes_cge}
+concluidas, pendentes = wait(consultas, timeout=PRAZO_COLETA)
+executor.shutdown(wait=False, cancel_futures=True)
+resultados = {consultas[f]: f.result() for f in concluidas}
+
 dados_para_plotagem = []
-for nome, posto_id, lat, lon in estacoes_cge:
-    dados_reais = obter_dados_estacao(posto_id)
+ausentes = []
+for estacao in estacoes_cge:
+    nome, posto_id = estacao['nome'], estacao['codigo']
+    if posto_id in resultados:
+        dados_reais = resultados[posto_id]
+    else:
+        ausentes.append(nome)
+        dados_reais = {"Temperatura": np.nan, "Chuva_Atual": np.nan}
     print(f" -> Coletando dados para {nome} (ID: {posto_id})... ---- Temperatura = {dados_reais['Temperatura']}")
 
     # Adiciona os dados coletados ou os NaNs retornados em caso de erro
     dados_reais.update({
         'Estacao': nome,
-        'Latitude': lat,
-        'Longitude': lon
+        'Latitude': estacao['lat'],
+        'Longitude': estacao['lon'],
+        'x': estacao['x'],  # Web Mercator (EPSG:3857), já projetado no cadastro
+        'y': estacao['y'],
+        'Rotulo_dy': estacao['deslocamento_rotulo'][1],
     })
     dados_para_plotagem.append(dados_reais)
 
+print(f"Coleta: {len(resultados)}/{len(estacoes_cge)} estações em {time.monotonic() - inicio_coleta:.1f} s")
+if ausentes:
+    print(f"Sem resposta dentro do prazo de {PRAZO_COLETA} s:", ", ".join(ausentes))
+
 df = pd.DataFrame(dados_para_plotagem)
 
 # Código de hora/fuso horário no final (não usado para filtro nesta versão):
@@ -113,6 +106,13 @@ agora_utc = datetime.now(pytz.utc)
 agora_sp = agora_utc.astimezone(fuso_sp)
 horario_formatado = agora_sp.strftime("%d/%b/%Y %H:%M")
 
+# Histórico de toda a rede (matriz estação x tempo em historico/cge_rede),
+# com as leituras das estações que responderam nesta coleta
+historico_rede = abrir_matriz('cge_rede', ['Temperatura', 'Chuva'])
+historico_rede.registrar(int(agora_utc.timestamp()), {
+    posto_id: {'Temperatura': r['Temperatura'], 'Chuva': r['Chuva_Atual']} for posto_id, r in resultados.items()
+})
+
 # 1. DEFINIÇÃO DO COLORMAP CUSTOMIZADO
 c1_mpl = np.flipud(plt.cm.gray(np.linspace(0, 1, 50)))
 c2_mpl = plt.cm.turbo(np.linspace(0, 1, 176))
@@ -128,104 +128,91 @@ new_cmap = mcolors.LinearSegmentedColormap.from_list(
 
 df = df.dropna(subset=['Chuva_Atual'])
 
-# Cria e projeta o GeoDataFrame
-gdf = gpd.GeoDataFrame(
-    df,
-    geometry=gpd.points_from_xy(df.Longitude, df.Latitude),
-    crs="EPSG:4326"
-)
-gdf_web_mercator = gdf.to_crs(epsg=3857)
-gdf_plot = gdf_web_mercator[gdf_web_mercator['Temperatura'].notna()]
-
+df_plot = df[df['Temperatura'].notna()].copy()
 
-# 3. Cria o objeto de figura e eixos do Matplotlib
-fig, ax = plt.subplots(figsize=(10, 10))
+TAMANHO_MARCADOR = 858  # área (pt²) dos marcadores
+RAIO_MARCADOR = np.sqrt(TAMANHO_MARCADOR) / 2
 
 
-# 4. Desenhar o Scatter Plot (Temperatura)
-if not gdf_plot.empty:
-    sc = gdf_plot.plot(
-        ax=ax,
-        column='Temperatura',
-        cmap=new_cmap,
-        vmin=-10,
-        vmax=45,
-        markersize=858,
-        alpha=0.8,
-        edgecolors='black',
-        legend=False
-    )
-
-
-# 5. Adicionar o Fundo Geográfico (CartoDB Positron)
-ctx.add_basemap(
-    ax,
-    source=ctx.providers.CartoDB.Positron,
-    crs=gdf_web_mercator.crs
-)
+def desenhar_fundo(fig, ax):
+    # Camada estática de baixo: limites das estações, mapa de fundo e título
+    ax.scatter(df_plot['x'], df_plot['y'], visible=False)  # só define os limites, como o scatter dos marcadores
+    ax.set_aspect('equal')
 
-# 6. Personalização (Eixos e Título)
-ax.set_title("Temperaturas em São Paulo (CGE-SP)", fontsize=16)
-ax.set_axis_off()
+    # 5. Adicionar o Fundo Geográfico (CartoDB Positron, lido do cache de mosaicos)
+    adicionar_mapa_base(ax, provedor='positron')
 
+    # 6. Personalização (Eixos e Título)
+    ax.set_title("Temperaturas em São Paulo (CGE-SP)", fontsize=16)
+    ax.set_axis_off()
 
-# 7. Adicionar a Barra de Cores (Temperatura)
-sm = plt.cm.ScalarMappable(cmap=new_cmap, norm=plt.Normalize(vmin=-10, vmax=45))
-sm.set_array([])
-
-
-
-
-# 8. Adicionar Barras de Chuva e Rótulos <--- MUDANÇA PRINCIPAL AQUI
-estacoes_acima = ["Jabaquara", "Campo Limpo", "MBoi Mirim", "S. Miguel", "Vila Maria", "Santana", "Marsilac", "Pinheiros", "S. de Parnaíba", "Parelheiros", "Tremembé", "Fregues. do Ó"]
-deslocamento_nome = 1600    # Deslocamento do nome (para longe da barra)
 
+def desenhar_nomes(fig, ax):
+    # Camada estática de cima: nomes das estações, em posições escolhidas pelo
+    # posicionador automático (sem sobrepor marcadores nem outros nomes); o
+    # lado do cadastro (acima/abaixo) é tentado primeiro
+    preferidos = [1 if dy > 0 else 0 for dy in df_plot['Rotulo_dy']]
+    posicoes = posicionar_no_eixo(ax, df_plot['x'], df_plot['y'], list(df_plot['Estacao']),
+                                  RAIO_MARCADOR, 10, preferidos)
+    for row, (dx, dy, ha, va) in zip(df_plot.itertuples(), posicoes):
+        ax.annotate(
+            row.Estacao,
+            (row.x, row.y),
+            xytext=(dx, dy),
+            textcoords='offset points',
+            fontsize=10,
+            ha=ha,
+            va=va,
+            color='black',
+            zorder=12
+        )
 
-for index, row in gdf_plot.iterrows():
-    temp_num = row['Temperatura']
-    x = row.geometry.x
-    y = row.geometry.y
-    nome_estacao = row['Estacao']
 
-    if not pd.isna(temp_num):
+# 3. Camadas estáticas (mapa de fundo, título e nomes), renderizadas só quando
+# a lista de estações plotadas muda; cada execução desenha só os marcadores e valores
+chave = chave_camadas('positron', (10, 10), df_plot[['Estacao', 'x', 'y', 'Rotulo_dy']].values.tolist())
+camadas = ComposicaoEstatica('mapa_cge', chave, figsize=(10, 10)).preparar(desenhar_fundo, desenhar_nomes)
+print("Camadas estáticas:", "do cache" if camadas.do_cache else "renderizadas")
+fig, ax, ax_valores = camadas.figura()
+
+
+# 4. Campo de temperatura interpolado (IDW) sob os marcadores. A grade e os
+# pesos usam todas as estações da lista (ficam em cache enquanto ela não
+# mudar); as que estão sem leitura são ignoradas na média
+campo_idw = CampoIDW(*registro_estacoes.coordenadas(estacoes_cge))
+grade_temperatura = campo_idw.campo([d['Temperatura'] for d in dados_para_plotagem])
+ax.imshow(grade_temperatura, extent=campo_idw.extensao, cmap=new_cmap, vmin=-10, vmax=45,
+          alpha=0.45, interpolation='bilinear', aspect='auto', zorder=0.5)
+
+# Desenhar o Scatter Plot (Temperatura)
+if not df_plot.empty:
+    sc = ax.scatter(
+        df_plot['x'],
+        df_plot['y'],
+        c=df_plot['Temperatura'],
+        cmap=new_cmap,
+        vmin=-10,
+        vmax=45,
+        s=TAMANHO_MARCADOR,
+        alpha=0.8,
+        edgecolors='black'
+    )
 
-        # --- 2. PLOTAGEM DO RÓTULO DE TEMPERATURA (DENTRO) ---
-        text_color = 'white'
-        if 8 <= temp_num <= 32:
-            text_color = 'black'
 
-        ax.annotate(
-            f"{temp_num:.1f}",
-            (x, y),
-            fontsize=12,
-            color=text_color,
-            ha='center',
-            va='center',
-            fontweight='bold',
-            zorder=12
-        )
+# --- PLOTAGEM DO RÓTULO DE TEMPERATURA (DENTRO) ---
+for row in df_plot.itertuples():
+    text_color = 'white'
+    if 8 <= row.Temperatura <= 32:
+        text_color = 'black'
 
-    # --- 3. PLOTAGEM DO NOME DA ESTAÇÃO ---
-    if nome_estacao in estacoes_acima:
-        # Desloca o nome para longe da barra (e.g., para a esquerda)
-        x_pos = x
-        vertical_pos = y + deslocamento_nome
-        alinhamento_horizontal = 'right' # Alinha à direita do ponto
-        alinhamento_vertical = 'bottom'
-    else:
-        # Mantém à esquerda do ponto (longe da barra)
-        x_pos = x
-        vertical_pos = y - deslocamento_nome
-        alinhamento_horizontal = 'right'
-        alinhamento_vertical = 'top'
-
-    ax.annotate(
-        nome_estacao,
-        (x_pos, vertical_pos),
-        fontsize=10,
+    ax_valores.annotate(
+        f"{row.Temperatura:.1f}",
+        (row.x, row.y),
+        fontsize=12,
+        color=text_color,
         ha='center',
-        va=alinhamento_vertical,
-        color='black',
+        va='center',
+        fontweight='bold',
         zorder=12
     )
 
@@ -234,7 +221,7 @@ for index, row in gdf_plot.iterrows():
 texto_horario = f"Última Atualização (BRT):\n{horario_formatado}"
 box_props = dict(boxstyle="round,pad=0.5", fc="white", alpha=0.7, ec="black", lw=1)
 
-ax.annotate(
+ax_valores.annotate(
     texto_horario,
     xy=(0.60, 0.07),
     xycoords='axes fraction',
@@ -245,7 +232,30 @@ ax.annotate(
 )
 
 
-# Salvar o gráfico em um arquivo
-plt.tight_layout()
-plt.savefig('mapa_cge.png', bbox_inches='tight')
+# Salvar o gráfico em um arquivo (a figura já tem o recorte 'tight' das camadas estáticas)
+salvar_variantes(fig, 'mapa_cge.png')
 plt.close(fig)
+
+# Feed JSON com a leitura de cada estação (mapa_cge.json)
+gravar_feed('mapa_cge.json', 'mapa_cge', {
+    'atualizado_em': int(agora_utc.timestamp()),
+    'estacoes': [{'nome': d['Estacao'], 'posto': posto_id, 'lat': d['Latitude'], 'lon': d['Longitude'],
+                  'temperatura': d['Temperatura'], 'chuva': d['Chuva_Atual']}
+                 for d, posto_id in zip(dados_para_plotagem, [e['codigo'] for e in estacoes_cge])],
+    'ausentes': ausentes,
+})
+
+# Mapa interativo (mapa_cge.html): a casca só muda com a lista de estações; a
+# cada execução é regravado só o GeoJSON, com a série horária das últimas 24 h
+# de cada posto tirada do histórico da rede
+_, postos_serie, serie_rede = historico_rede.ultimas('Temperatura', agora=agora_utc.timestamp(),
+                                                     estacoes=[e['codigo'] for e in estacoes_cge])
+cores = mapa_interativo.cor_hex([d['Temperatura'] for d in dados_para_plotagem], new_cmap, -10, 45)
+tamanho = mapa_interativo.gravar_estacoes('mapa_cge.geojson', [
+    {'posto': e['codigo'], 'nome': d['Estacao'], 'lat': e['lat'], 'lon': e['lon'], 'temperatura': d['Temperatura'],
+     'chuva': d['Chuva_Atual'], 'cor': cor, 'serie_24h': serie_rede[::4, i]}
+    for i, (e, d, cor) in enumerate(zip(estacoes_cge, dados_para_plotagem, cores))
+], gerado_em=agora_utc.timestamp())
+casca_nova = mapa_interativo.gerar_casca('mapa_cge.html', 'mapa_cge.geojson', [e['lat'] for e in estacoes_cge],
+                                         [e['lon'] for e in estacoes_cge], "Temperaturas em São Paulo (CGE-SP)")
+print(f"mapa_cge.geojson: {tamanho / 1024:.1f} kB" + ("; mapa_cge.html regerado" if casca_nova else ""))
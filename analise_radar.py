@@ -0,0 +1,161 @@
+# Números tirados das imagens de radar em volta do IFUSP
+#
+# As cores da imagem do RainViewer são convertidas de volta em refletividade
+# (dBZ) pela tabela de cores publicada pelo RainViewer. Como a imagem é
+# suavizada (opção 1_1), nem todo pixel tem exatamente uma cor da tabela: o
+# espaço RGB é dividido em 32 níveis por canal e cada célula recebe o dBZ da
+# cor mais próxima da tabela (ou NaN, se nenhuma estiver perto). Decodificar
+# um quadro é então uma indexação dessa tabela 32x32x32, que só muda com as
+# cores publicadas e fica em .cache/radar/inversa_<chave>.npy.
+#
+# Para cada quadro (já reprojetado em lon/lat, ver quadros_radar.py) saem:
+# fração com chuva dentro do raio de 30 km, dBZ máximo no raio e no mapa,
+# chuva estimada (Marshall-Palmer) e distância/direção do eco significativo
+# mais próximo. Os números vão para um armazém (dados/radar_ifusp) e para radar.json.
+import csv
+import io
+import os
+
+import numpy as np
+
+import rede
+from feed import chave_cache, gravacao_atomica
+
+URL_TABELA_CORES = "https://www.rainviewer.com/files/rainviewer_api_colors_table.csv"
+NIVEIS = 32  # níveis por canal na tabela inversa
+DISTANCIA_MAXIMA_COR = 40  # distância RGB máxima até uma cor da tabela
+ALFA_MINIMO = 32  # pixels mais transparentes que isso não têm eco
+RAIO_ANEL = 30  # km
+DBZ_CHUVA = 20  # a partir daqui o pixel conta como chuva
+DBZ_SIGNIFICATIVO = 35  # eco significativo (chuva forte / convecção)
+RAIO_TERRA_KM = 6371.0
+DIRETORIO_TABELAS = os.path.join('.cache', 'radar')
+
+COLUNAS = ['Fracao chuva 30km', 'dBZ max 30km', 'dBZ max mapa', 'Chuva max 30km',
+           'Distancia eco', 'Direcao eco']
+
+
+def _interpretar_tabela(resposta):
+    # Tabela CSV: primeira coluna dBZ, depois uma coluna de cor (#rrggbb[aa]) por
+    # esquema, na ordem dos índices da API (0, 1, 2, ...)
+    resposta.raise_for_status()
+    linhas = list(csv.reader(io.StringIO(resposta.text)))
+    tabela = []
+    for linha in linhas[1:]:
+        try:
+            tabela.append([float(linha[0])] + [c.strip() for c in linha[1:]])
+        except (ValueError, IndexError):
+            continue
+    return tabela
+
+
+def _rgba(cor):
+    cor = cor.lstrip('#')
+    if len(cor) not in (6, 8):
+        return None
+    return [int(cor[i:i + 2], 16) for i in range(0, len(cor), 2)] + ([] if len(cor) == 8 else [255])
+
+
+def paleta(esquema, offline=False):
+    # (dBZ, RGB) das cores visíveis do esquema, pela tabela publicada (via cache
+    # de rede); offline, pela última cópia em cache, de qualquer idade
+    if offline:
+        resposta = rede.copia_em_cache(URL_TABELA_CORES)
+        if resposta is None:
+            raise ValueError("Tabela de cores do RainViewer não está no cache.")
+        tabela = _interpretar_tabela(resposta)
+    else:
+        tabela, _ = rede.processar(URL_TABELA_CORES, _interpretar_tabela, aceitar_vencida=True)
+    dbz, cores = [], []
+    for linha in tabela:
+        if esquema + 1 >= len(linha):
+            continue
+        rgba = _rgba(linha[esquema + 1])
+        if rgba is not None and rgba[3] > 0:
+            dbz.append(linha[0])
+            cores.append(rgba[:3])
+    return np.array(dbz, dtype=np.float32), np.array(cores, dtype=np.float32)
+
+
+def tabela_inversa(dbz, cores, diretorio=DIRETORIO_TABELAS):
+    # dBZ da cor mais próxima para cada célula do cubo RGB (NIVEIS³), NaN se
+    # longe demais. Calculada só quando a paleta muda: a chave é o conteúdo da
+    # paleta (vinda do CSV de cores) e os parâmetros da tabela
+    chave = chave_cache(np.asarray(dbz).tolist(), np.asarray(cores).tolist(), NIVEIS, DISTANCIA_MAXIMA_COR)
+    arquivo = os.path.join(diretorio, f'inversa_{chave}.npy')
+    if os.path.exists(arquivo):
+        return np.load(arquivo)
+
+    centros = (np.arange(NIVEIS) + 0.5) * 256 / NIVEIS
+    cubo = np.stack(np.meshgrid(centros, centros, centros, indexing='ij'), axis=-1).reshape(-1, 1, 3)
+    distancias = np.linalg.norm(cubo - cores[None, :, :], axis=2)
+    mais_proxima = distancias.argmin(axis=1)
+    inversa = dbz[mais_proxima]
+    inversa[distancias[np.arange(len(mais_proxima)), mais_proxima] > DISTANCIA_MAXIMA_COR] = np.nan
+    inversa = inversa.reshape(NIVEIS, NIVEIS, NIVEIS)
+
+    os.makedirs(diretorio, exist_ok=True)
+    with gravacao_atomica(arquivo, 'wb') as f:
+        np.save(f, inversa)
+    return inversa
+
+
+def decodificar(quadro, inversa):
+    # Quadro RGBA (uint8) -> dBZ (float32), NaN onde não há eco
+    passo = 256 // NIVEIS
+    r, g, b = (quadro[..., i] // passo for i in range(3))
+    dbz = inversa[r, g, b]
+    dbz[quadro[..., 3] < ALFA_MINIMO] = np.nan
+    return dbz
+
+
+def geometria(extensao, forma, lat, lon):
+    # Distância (km) e direção (graus a partir do norte) do centro a cada pixel
+    # de uma grade regular em lon/lat (linha 0 ao norte)
+    oeste, leste, sul, norte = extensao
+    linhas, colunas = forma
+    lons = np.radians(oeste + (np.arange(colunas) + 0.5) * (leste - oeste) / colunas)[None, :]
+    lats = np.radians(norte - (np.arange(linhas) + 0.5) * (norte - sul) / linhas)[:, None]
+    lat0, lon0 = np.radians(lat), np.radians(lon)
+    dlon = lons - lon0
+    a = np.sin((lats - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    distancia = 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(a))
+    direcao = np.degrees(np.arctan2(np.sin(dlon) * np.cos(lats),
+                                    np.cos(lat0) * np.sin(lats) - np.sin(lat0) * np.cos(lats) * np.cos(dlon))) % 360
+    return distancia.astype(np.float32), direcao.astype(np.float32)
+
+
+def km_por_pixel(extensao, forma, lat):
+    # Tamanho (km por linha, km por coluna) dos pixels de uma grade lon/lat perto da latitude dada
+    oeste, leste, sul, norte = extensao
+    km_por_grau = np.pi / 180 * RAIO_TERRA_KM
+    return ((norte - sul) / forma[0] * km_por_grau,
+            (leste - oeste) / forma[1] * km_por_grau * np.cos(np.radians(lat)))
+
+
+def chuva_marshall_palmer(dbz):
+    # Taxa de chuva (mm/h) pela relação Z = 200 R^1,6
+    return (10 ** (np.asarray(dbz, dtype=float) / 10) / 200) ** (1 / 1.6)
+
+
+def metricas(dbz, distancia, direcao):
+    # Números de um quadro decodificado; sem eco, máximos e distância ficam NaN
+    anel = distancia <= RAIO_ANEL
+    no_anel = dbz[anel]
+    com_eco = np.isfinite(no_anel)
+    maximo_anel = float(no_anel[com_eco].max()) if com_eco.any() else np.nan
+    finitos = np.isfinite(dbz)
+    significativos = finitos & (np.where(finitos, dbz, -np.inf) >= DBZ_SIGNIFICATIVO)
+    if significativos.any():
+        i = np.argmin(np.where(significativos, distancia, np.inf))
+        distancia_eco, direcao_eco = float(distancia.flat[i]), float(direcao.flat[i])
+    else:
+        distancia_eco = direcao_eco = np.nan
+    return {
+        'Fracao chuva 30km': float((no_anel[com_eco] >= DBZ_CHUVA).sum() / max(anel.sum(), 1)),
+        'dBZ max 30km': maximo_anel,
+        'dBZ max mapa': float(dbz[finitos].max()) if finitos.any() else np.nan,
+        'Chuva max 30km': float(chuva_marshall_palmer(maximo_anel)) if np.isfinite(maximo_anel) else np.nan,
+        'Distancia eco': distancia_eco,
+        'Direcao eco': direcao_eco,
+    }
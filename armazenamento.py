@@ -0,0 +1,199 @@
+# Armazenamento das observações em um buffer circular mapeado em memória
+#
+# Cada estação tem um arquivo binário de esquema fixo: timestamp em segundos
+# desde a época (int64, UTC) seguido de uma coluna float32 por grandeza.
+# O buffer é "espelhado": cada registro é gravado na posição i e na posição
+# i + capacidade, de modo que qualquer janela de até `capacidade` registros é
+# uma fatia contígua do arquivo e pode ser lida sem cópia (np.memmap).
+# Anexar uma amostra custa O(1): duas escritas de um registro e do cabeçalho.
+# O armazém em si só usa NumPy (radar.py roda sem pandas); o pandas só é
+# importado para migrar CSVs e montar DataFrames.
+import json
+import os
+import time
+
+import numpy as np
+
+from feed import gravacao_atomica
+
+MAGICO = b'IFUSPRB1'
+VERSAO = 1
+TAMANHO_CABECALHO = 64
+
+dtype_cabecalho = np.dtype([
+    ('magico', 'S8'),
+    ('versao', '<u4'),
+    ('capacidade', '<u4'),
+    ('ncolunas', '<u4'),
+    ('reservado', '<u4'),
+    ('total', '<u8'),
+    ('extra', 'V32'),
+])
+
+
+def dtype_registro(colunas):
+    return np.dtype([('ts', '<i8')] + [(c, '<f4') for c in colunas])
+
+
+class ArmazemCircular:
+    def __init__(self, caminho, colunas, capacidade=1024):
+        self.caminho = caminho
+        self.arquivo = caminho + '.bin'
+        self.arquivo_esquema = caminho + '.json'
+        self.colunas = list(colunas)
+        self.dtype = dtype_registro(self.colunas)
+
+        if os.path.exists(self.arquivo):
+            self._abrir()
+        else:
+            self._criar(capacidade)
+
+    def _criar(self, capacidade):
+        os.makedirs(os.path.dirname(self.arquivo) or '.', exist_ok=True)
+        tamanho = TAMANHO_CABECALHO + 2 * capacidade * self.dtype.itemsize
+        with open(self.arquivo, 'wb') as f:
+            f.truncate(tamanho)
+        cab = np.memmap(self.arquivo, dtype=dtype_cabecalho, mode='r+', shape=(1,))
+        cab['magico'] = MAGICO
+        cab['versao'] = VERSAO
+        cab['capacidade'] = capacidade
+        cab['ncolunas'] = len(self.colunas)
+        cab['total'] = 0
+        cab.flush()
+        del cab
+        with open(self.arquivo_esquema, 'w') as f:
+            json.dump({'versao': VERSAO, 'capacidade': capacidade, 'colunas': self.colunas}, f, indent=1)
+        self._abrir()
+
+    def _abrir(self):
+        self.cabecalho = np.memmap(self.arquivo, dtype=dtype_cabecalho, mode='r+', shape=(1,))
+        if self.cabecalho['magico'][0] != MAGICO:
+            raise ValueError(f"Arquivo {self.arquivo} não é um armazém de observações.")
+        if os.path.exists(self.arquivo_esquema):
+            with open(self.arquivo_esquema) as f:
+                colunas = json.load(f)['colunas']
+            if colunas != self.colunas:
+                raise ValueError(f"Esquema de {self.arquivo} difere do esperado: {colunas}")
+        self.capacidade = int(self.cabecalho['capacidade'][0])
+        self.registros = np.memmap(self.arquivo, dtype=self.dtype, mode='r+',
+                                   offset=TAMANHO_CABECALHO, shape=(2 * self.capacidade,))
+
+    @property
+    def total(self):
+        return int(self.cabecalho['total'][0])
+
+    def __len__(self):
+        return min(self.total, self.capacidade)
+
+    def ultimos(self, n=None):
+        # Últimos n registros, em ordem cronológica, como uma fatia sem cópia
+        n = len(self) if n is None else min(n, len(self))
+        inicio = (self.total - n) % self.capacidade
+        return self.registros[inicio:inicio + n]
+
+    def ultimo_ts(self):
+        if self.total == 0:
+            return None
+        return int(self.registros['ts'][(self.total - 1) % self.capacidade])
+
+    def anexar(self, ts, valores):
+        # ts é o horário da observação, em segundos UTC (int) ou datetime com fuso;
+        # valores é um dict coluna -> número. Observações já registradas ou mais
+        # antigas que a última são recusadas (use mesclar para essas)
+        ts = para_epoch(ts)
+        ultimo = self.ultimo_ts()
+        if ultimo is not None and ts <= ultimo:
+            return False
+
+        registro = np.zeros((), dtype=self.dtype)
+        registro['ts'] = ts
+        for c in self.colunas:
+            v = valores.get(c)
+            registro[c] = np.nan if v is None else v
+
+        posicao = self.total % self.capacidade
+        self.registros[posicao] = registro
+        self.registros[posicao + self.capacidade] = registro
+        self.cabecalho['total'] = self.total + 1
+        self.registros.flush()
+        self.cabecalho.flush()
+        return True
+
+    def mesclar(self, novos):
+        # Insere amostras antigas (ex.: preenchimento de lacunas) fora de ordem.
+        # Caminho raro: regrava o buffer ordenado por ts, mantendo os registros
+        # existentes quando o mesmo ts aparece nos dois lados.
+        novos = np.asarray(novos, dtype=self.dtype)
+        if len(novos) == 0:
+            return 0
+        atuais = np.array(self.ultimos())
+        inseridos = int(np.isin(np.unique(novos['ts']), atuais['ts'], invert=True).sum())
+        todos = np.concatenate([atuais, novos])
+        _, indices = np.unique(todos['ts'], return_index=True)
+        todos = todos[indices][-self.capacidade:]
+
+        n = len(todos)
+        self.registros[:n] = todos
+        self.registros[self.capacidade:self.capacidade + n] = todos
+        self.cabecalho['total'] = n
+        self.registros.flush()
+        self.cabecalho.flush()
+        return inseridos
+
+    def janela(self, segundos, agora=None):
+        # Registros com ts >= agora - segundos (leitura sem cópia)
+        agora = para_epoch(agora) if agora is not None else int(time.time())
+        registros = self.ultimos()
+        inicio = np.searchsorted(registros['ts'], agora - segundos, side='left')
+        return registros[inicio:]
+
+    def importar_csv(self, caminho_csv):
+        # Migração única dos CSVs antigos para o armazém
+        import pandas as pd
+
+        antigo = pd.read_csv(caminho_csv)
+        tempos = pd.to_datetime(antigo['Timestamp'], utc=True, format='ISO8601')
+        antigo = antigo.assign(ts=(tempos - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).sort_values('ts')
+        for _, linha in antigo.iterrows():
+            self.anexar(int(linha['ts']), {c: linha.get(c) for c in self.colunas})
+
+
+def para_epoch(ts):
+    if isinstance(ts, (int, np.integer)):
+        return int(ts)
+    import pandas as pd
+
+    return int(pd.Timestamp(ts).timestamp())
+
+
+def estado_estacao(ts_observacao, idade_maxima=30 * 60, agora=None):
+    # Online/Offline pela idade da última observação da estação
+    agora = para_epoch(agora) if agora is not None else int(time.time())
+    return 'Online' if agora - para_epoch(ts_observacao) <= idade_maxima else 'Offline'
+
+
+def abrir_armazem(caminho, colunas, capacidade=1024, csv_legado=None):
+    novo = not os.path.exists(caminho + '.bin')
+    armazem = ArmazemCircular(caminho, colunas, capacidade)
+    if novo and csv_legado and os.path.exists(csv_legado):
+        armazem.importar_csv(csv_legado)
+    return armazem
+
+
+def para_dataframe(registros, colunas, fuso, derivadas=None):
+    # Converte uma janela do armazém no DataFrame usado pelos gráficos;
+    # derivadas ({nome: array}, ver meteorologia.py) entram como colunas extras
+    import pandas as pd
+
+    df = pd.DataFrame({c: registros[c] for c in colunas})
+    df.insert(0, 'Timestamp', pd.to_datetime(registros['ts'], unit='s', utc=True).tz_convert(fuso))
+    if derivadas:
+        df = df.assign(**derivadas)
+    return df
+
+
+def exportar_csv(registros, colunas, caminho_csv, fuso, date_format='%Y-%m-%d %H:%M:%S%z', derivadas=None):
+    # Exporta a janela em CSV (usado pelo site), com escrita atômica
+    df = para_dataframe(registros, colunas, fuso, derivadas)
+    with gravacao_atomica(caminho_csv) as f:
+        df.to_csv(f, index=False, date_format=date_format, float_format='%.6g')
@@ -0,0 +1,81 @@
+# Benchmark da leitura das páginas de estação do CGE
+#
+# Compara a leitura antiga (BeautifulSoup + soup.find(lambda ...) por campo)
+# com o extrator de uma passada (cge_extrator.extrair) e confere que os dois
+# leem os mesmos valores.
+# Uso: python benchmarks/bench_cge_extrator.py [pagina.html ...] [-n repeticoes]
+# Sem páginas, usa uma página sintética com a estrutura de tabelas aninhadas
+# do CGE. Para salvar páginas reais:
+#   curl -o posto_1000842.html "https://www.cgesp.org/v3/estacao.jsp?POSTO=1000842"
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from cge_extrator import extrair
+
+
+def extrair_bs4(conteudo):
+    # Leitura como era feita em CGE_dados.py / CGE_mapa.py
+    soup = BeautifulSoup(conteudo, 'html.parser')
+    dados = {'chuva': None, 'temperatura': None, 'umidade': None}
+    chuva_element = soup.find(lambda tag: tag.name == 'td' and "Per. Atual:" in tag.text)
+    if chuva_element:
+        match = re.search(r'Per\. Atual:\s*(\d+[,.]\d+)\s*mm', chuva_element.text.replace(",", "."))
+        if match:
+            dados['chuva'] = float(match.group(1))
+    temp_element = soup.find(lambda tag: tag.name == 'td' and "Atual:" in tag.text and "°C" in tag.text)
+    if temp_element:
+        match = re.search(r'Atual:\s*(\d+[,.]\d+)\s*°C', temp_element.text.replace(",", "."))
+        if match:
+            dados['temperatura'] = float(match.group(1))
+    umidade_element = soup.find(lambda tag: tag.name == 'td' and "Atual:" in tag.text and "%" in tag.text)
+    if umidade_element:
+        match = re.search(r'Atual:\s*(\d+[,.]\d+)\s*%', umidade_element.text.replace(",", "."))
+        if match:
+            dados['umidade'] = float(match.group(1))
+    return dados
+
+
+def pagina_sintetica(linhas_menu=120, profundidade=6):
+    # Layout em tabelas aninhadas, menus e scripts, com os blocos de dados no fim
+    menu = "".join(f"<tr><td><a href='estacao.jsp?POSTO={i}'>Posto {i}</a></td><td>Região {i % 7}</td></tr>"
+                   for i in range(linhas_menu))
+    dados = ("<table><tr><td><b>Chuva</b><br>Per. Atual: 1,4 mm<br>Acum. mês: 88,2 mm</td></tr>"
+             "<tr><td><b>Temperatura</b><br>Atual: 23,7 &deg;C<br>Máx.: 27,1 &deg;C<br>Mín.: 18,0 &deg;C</td></tr>"
+             "<tr><td><b>Umidade</b><br>Atual: 71,0 %<br>Máx.: 93,0 %</td></tr>"
+             "<tr><td><b>Pressão</b><br>Atual: 925,3 hPa</td></tr>"
+             "<tr><td>Atualizado em 18/10/2026 às 14:20</td></tr></table>")
+    corpo = f"<table>{menu}</table>" + dados
+    for _ in range(profundidade):
+        corpo = f"<table><tr><td>{corpo}</td></tr></table>"
+    return ("<html><head><meta charset='utf-8'><script>var x = '<td>Atual: 0,0 °C</td>';</script>"
+            f"<style>td {{ color: red }}</style></head><body>{corpo}</body></html>").encode('utf-8')
+
+
+def medir(funcao, conteudo, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao(conteudo)
+    return (time.perf_counter() - inicio) / repeticoes, resultado
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    repeticoes = 20
+    if '-n' in argumentos:
+        i = argumentos.index('-n')
+        repeticoes = int(argumentos[i + 1])
+        del argumentos[i:i + 2]
+    paginas = {os.path.basename(p): open(p, 'rb').read() for p in argumentos} or {'sintética': pagina_sintetica()}
+
+    for nome, conteudo in paginas.items():
+        t_antigo, antigo = medir(extrair_bs4, conteudo, repeticoes)
+        t_novo, novo = medir(extrair, conteudo, repeticoes)
+        iguais = all(antigo[c] == novo[c] for c in antigo if antigo[c] is not None)
+        print(f"{nome} ({len(conteudo)} bytes): BeautifulSoup {t_antigo * 1000:.2f} ms, "
+              f"uma passada {t_novo * 1000:.2f} ms ({t_antigo / t_novo:.0f}x), mesmos valores: {iguais}")
+        print(f"  {novo}")
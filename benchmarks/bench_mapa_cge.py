@@ -0,0 +1,174 @@
+# Benchmark do mapa do CGE (mapa_cge.png)
+#
+# Compara o desenho completo a cada execução (mapa de fundo, título, nomes,
+# marcadores e valores) com a composição sobre as camadas estáticas em cache
+# (camadas.py), usando mosaicos sintéticos em um diretório temporário, e
+# compara as duas imagens pixel a pixel.
+# Uso: python benchmarks/bench_mapa_cge.py [repeticoes]
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import mosaicos
+from camadas import ComposicaoEstatica, chave_camadas
+
+rng = np.random.default_rng(0)
+N = 30
+lon = rng.uniform(-46.92, -46.43, N)
+lat = rng.uniform(-23.92, -23.40, N)
+x, y = mosaicos.lonlat_para_mercator(lon, lat)
+nomes = [f"Estação {i}" for i in range(N)]
+temperaturas = rng.uniform(12, 30, N)
+
+
+def semear_mosaicos(diretorio):
+    # Mosaicos sintéticos cobrindo a área, para medir sem rede
+    cache = mosaicos.CacheMosaicos(diretorio=diretorio)
+    margem = 5000
+    area = (x.min() - margem, x.max() + margem, y.min() - margem, y.max() + margem)
+    for z in range(mosaicos.zoom_automatico(*area) - 1, mosaicos.zoom_automatico(*area) + 2):
+        for tx, ty in mosaicos.mosaicos_da_area(*area, z):
+            caminho = cache._caminho(z, tx, ty)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            # Fundo claro liso com algumas "ruas", como os mosaicos do Positron
+            mosaico = np.full((256, 256, 3), 242, dtype=np.uint8)
+            for _ in range(6):
+                i, j = rng.integers(0, 256, 2)
+                mosaico[i:i + 2, :] = 255
+                mosaico[:, j:j + 2] = 225
+            Image.fromarray(mosaico).save(caminho)
+    return cache
+
+
+def fundo(fig, ax, cache):
+    ax.scatter(x, y, visible=False)
+    ax.set_aspect('equal')
+    mosaicos.adicionar_mapa_base(ax, cache=cache)
+    ax.set_title("Temperaturas em São Paulo (CGE-SP)", fontsize=16)
+    ax.set_axis_off()
+
+
+def nomes_estacoes(fig, ax):
+    for nome, xi, yi in zip(nomes, x, y):
+        ax.annotate(nome, (xi, yi - 1600), fontsize=10, ha='center', va='top', zorder=12)
+
+
+def dinamico(ax, ax_valores):
+    ax.scatter(x, y, c=temperaturas, cmap='turbo', vmin=-10, vmax=45, s=858, alpha=0.8, edgecolors='black')
+    for t, xi, yi in zip(temperaturas, x, y):
+        ax_valores.annotate(f"{t:.1f}", (xi, yi), fontsize=12, ha='center', va='center', fontweight='bold', zorder=12)
+    ax_valores.annotate("Última Atualização (BRT):\n18/Oct/2026 14:20", xy=(0.60, 0.07), xycoords='axes fraction',
+                        fontsize=14, ha='left', va='top',
+                        bbox=dict(boxstyle="round,pad=0.5", fc="white", alpha=0.7, ec="black", lw=1))
+
+
+def figura_completa(cache, com_dinamico=True):
+    fig, ax = plt.subplots(figsize=(10, 10))
+    if com_dinamico:
+        dinamico(ax, ax)
+    fundo(fig, ax, cache)
+    nomes_estacoes(fig, ax)
+    fig.tight_layout()
+    return fig
+
+
+def preparar_camadas(cache, diretorio):
+    camadas = ComposicaoEstatica('bench', chave_camadas(nomes), figsize=(10, 10), diretorio=diretorio)
+    return camadas.preparar(lambda fig, ax: fundo(fig, ax, cache), nomes_estacoes)
+
+
+def figura_composta(cache, diretorio, com_dinamico=True):
+    fig, ax, ax_valores = preparar_camadas(cache, diretorio).figura()
+    if com_dinamico:
+        dinamico(ax, ax_valores)
+    return fig
+
+
+def completo(cache):
+    salvar(figura_completa(cache), bbox_inches='tight')
+
+
+def composto(cache, diretorio):
+    salvar(figura_composta(cache, diretorio))
+
+
+def salvar(fig, **opcoes):
+    # Desenho (Agg) e codificação do PNG são medidos separadamente
+    inicio = time.perf_counter()
+    fig.savefig(io.BytesIO(), format='raw', **opcoes)
+    meio = time.perf_counter()
+    fig.savefig(io.BytesIO(), format='png', **opcoes)
+    tempos_desenho.append(meio - inicio)
+    plt.close(fig)
+
+
+def pixels(fig, **opcoes):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', **opcoes)
+    plt.close(fig)
+    return np.asarray(Image.open(buffer).convert('RGB')).astype(np.int16)
+
+
+def comparar(cache, diretorio):
+    # PNG composto x PNG completo salvo com o mesmo recorte (o 'tight'
+    # arredondado para pixels inteiros): com e sem marcadores e valores.
+    # Com eles, sobra só a ordem de empilhamento da composição (um nome de
+    # estação sob a caixa do horário fica abaixo dela). Camadas deslocadas
+    # em relação aos marcadores dão dezenas de % de pixels diferentes.
+    # Retorna {caso: % dos pixels diferentes, diferença máxima}
+    recorte = preparar_camadas(cache, diretorio).recorte
+    resultado = {}
+    for caso, com_dinamico in (('camadas estáticas', False), ('mapa completo', True)):
+        a = pixels(figura_completa(cache, com_dinamico), bbox_inches=recorte)
+        b = pixels(figura_composta(cache, diretorio, com_dinamico))
+        assert a.shape == b.shape, (a.shape, b.shape)
+        diferenca = np.abs(a - b).max(axis=2)
+        resultado[caso] = (diferenca > 0).mean() * 100, int(diferenca.max())
+    return resultado
+
+
+tempos_desenho = []
+
+
+def medir(funcao, repeticoes):
+    tempos, picos = [], []
+    for _ in range(repeticoes):
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+        picos.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return np.median(tempos) * 1000, np.median(picos) / 2 ** 20
+
+
+if __name__ == '__main__':
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as diretorio:
+        cache = semear_mosaicos(os.path.join(diretorio, 'mosaicos'))
+        camadas = os.path.join(diretorio, 'camadas')
+        composto(cache, camadas)  # primeira execução: renderiza e guarda as camadas
+        equivalencia = comparar(cache, camadas)
+        tempos_desenho.clear()
+        t_completo, m_completo = medir(lambda: completo(cache), repeticoes)
+        d_completo = np.median(tempos_desenho) * 1000
+        tempos_desenho.clear()
+        t_composto, m_composto = medir(lambda: composto(cache, camadas), repeticoes)
+        d_composto = np.median(tempos_desenho) * 1000
+    # O total inclui um desenho a mais (o savefig 'raw' usado para medir só o desenho)
+    print(f"desenho completo: {d_completo:.0f} ms de desenho, {t_completo:.0f} ms no total, pico {m_completo:.1f} MiB")
+    print(f"camadas em cache: {d_composto:.0f} ms de desenho, {t_composto:.0f} ms no total, pico {m_composto:.1f} MiB")
+    print(f"desenho {d_completo / d_composto:.1f}x mais rápido")
+    for caso, (diferentes, maxima) in equivalencia.items():
+        print(f"composto x completo ({caso}): {diferentes:.3f}% dos pixels diferentes, diferença máxima {maxima}")
+
@@ -0,0 +1,235 @@
+# Benchmark do painel de séries temporais (graph.png e graph_cge.png)
+#
+# Compara uma renderização completa (figura montada, desenhada e salva, como
+# em cada execução de atualizaCSV.py e CGE_dados.py) pelo painel.py com o
+# código de desenho que os scripts tinham antes dele, copiado abaixo (ramo da
+# estação online; plt.cm.get_cmap trocado por plt.get_cmap, que não existe
+# mais nas versões atuais do matplotlib).
+# Antes de medir, confere que as duas versões geram o mesmo PNG, pixel a pixel.
+# Uso: python benchmarks/bench_painel.py [repeticoes]
+import io
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import matplotlib.ticker as mticker
+import numpy as np
+import pandas as pd
+import pytz
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from painel import PainelSerieTemporal, PAINEL_PELLETRON, PAINEL_CGE
+
+brasilia_tz = pytz.timezone("America/Sao_Paulo")
+
+
+def janela_sintetica(n=96, semente=0):
+    # 24 h de amostras a cada 15 min com todas as colunas dos dois painéis
+    rng = np.random.default_rng(semente)
+    agora = pd.Timestamp.now(tz=brasilia_tz).floor('min')
+    tempos = pd.date_range(end=agora, periods=n, freq='15min')
+    temp = 20 + 5 * np.sin(np.linspace(0, 2 * np.pi, n)) + rng.normal(0, 0.3, n)
+    chuva = np.cumsum(rng.exponential(0.1, n))
+    df = pd.DataFrame({
+        'Timestamp': tempos, 'Temperature': temp, 'Dew Point': temp - 5,
+        'Humidity': rng.uniform(40, 95, n), 'Precip': chuva, 'Rain': chuva,
+        'Radiation': rng.uniform(0, 1000, n), 'UV Index': rng.integers(0, 11, n),
+        'Wind Speed': rng.uniform(0, 15, n), 'Wind Gust': rng.uniform(5, 30, n),
+    })
+    df['Taxa de chuva'] = df['Precip'].diff().fillna(0)
+    return df, df.iloc[-1].to_dict(), agora
+
+
+def _cores_antigas():
+    c1 = plt.cm.Purples(np.linspace(0, 1, 50))
+    c2 = plt.cm.turbo(np.linspace(0, 1, 176))
+    c3 = plt.get_cmap('PuRd_r')(np.linspace(0, 1, 50))
+    cmap = plt.cm.colors.ListedColormap(np.vstack((c1, c2, c3)))
+    cmap_hum = plt.cm.colors.ListedColormap(plt.cm.coolwarm(np.linspace(1, 0, 100)))
+    cmap_rad = plt.cm.colors.ListedColormap(plt.cm.Blues(np.linspace(0, 1, 50)))
+    return cmap, cmap_hum, cmap_rad
+
+
+def antigo_pelletron(df, atual, estadoEstacao, timestamp, start_time, end_time, destino):
+    # Desenho de graph.png em atualizaCSV.py antes de painel.py
+    temp, humidity, dew_point = atual['Temperature'], atual['Humidity'], atual['Dew Point']
+    precip_total, solar_rad, uv_index = atual['Precip'], atual['Radiation'], atual['UV Index']
+    fig, axs = plt.subplots(5, 1, figsize=(10, 12), sharex=True)
+    fig.suptitle("Tempo nas últimas 24 horas", fontsize=18)
+    cmap, cmap_hum, cmap_rad = _cores_antigas()
+    temp_color = cmap(np.clip((temp + 10) / 55, 0, 1))
+    hum_color = cmap_hum(humidity / 100)
+    precip_color = cmap_rad(precip_total / 50)
+    state_color = 'red' if estadoEstacao == "Offline" else 'green'
+    fig.text(0.5, 1.00, estadoEstacao, color=state_color, fontsize=16, ha='center')
+    plt.figtext(0.5, 1.15, f"Condições meteorológicas atuais no IFUSP (Pelletron) - Atualizado {timestamp:%d/%m/%Y} às {timestamp:%H:%M}", fontsize=16, ha='center')
+    fig.patches.append(plt.Rectangle((0.15, 1.06), 0.22, 0.07, transform=fig.transFigure, color=temp_color, lw=0))
+    text_color = 'white' if (temp >= 32 or temp < 8) else 'black'
+    plt.figtext(0.26, 1.075, f"Temperatura:\n {temp:.1f} °C", fontsize=18, ha='center', color=text_color)
+    plt.figtext(0.26, 1.03, f"Ponto de orvalho: {dew_point:.1f} °C", fontsize=11, ha='center', color='black')
+    fig.patches.append(plt.Rectangle((0.39, 1.06), 0.22, 0.07, transform=fig.transFigure, color=hum_color, lw=0))
+    text_color = 'white' if (humidity >= 90) else 'black'
+    plt.figtext(0.50, 1.075, f"Umidade:\n {humidity:.0f} %", fontsize=18, ha='center', color=text_color)
+    plt.figtext(0.50, 1.03, f"Radiação solar: {solar_rad:.0f} W/m²", fontsize=11, ha='center', color='black')
+    fig.patches.append(plt.Rectangle((0.63, 1.06), 0.22, 0.07, transform=fig.transFigure, color=precip_color, lw=0))
+    text_color = 'white' if (precip_total >= 30) else 'black'
+    plt.figtext(0.74, 1.075, f"Chuva acum.:\n {precip_total:.1f} mm", fontsize=18, ha='center', color=text_color)
+    plt.figtext(0.74, 1.03, f"Índice UV: {uv_index:.0f}", fontsize=11, ha='center', color='black')
+
+    axs[0].plot(df['Timestamp'], df['Temperature'], label="Temperatura", color='red', marker='o')
+    axs[0].plot(df['Timestamp'], df['Dew Point'], label="Ponto de orvalho", color="green", linestyle="--", marker='o', markersize=3)
+    axs[0].set_ylabel("Temperatura (°C)", fontsize=14)
+    axs[0].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.1f}"))
+    axs[0].legend(loc="best")
+    axs[0].grid(True)
+    for label in axs[0].get_yticklabels():
+        label.set_fontsize(14)
+    precip_diff = df['Precip'].diff().fillna(0)
+    axs[1].bar(df['Timestamp'], precip_diff, color='skyblue', label='Taxa de precipitação', width=0.02)
+    axs[1].set_ylabel("Precipitação (mm)", fontsize=14)
+    axs[1].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.1f}"))
+    axs[1].grid(True)
+    for label in axs[1].get_yticklabels():
+        label.set_fontsize(14)
+    axs[2].plot(df['Timestamp'], df['Humidity'], color='blue', marker='o')
+    axs[2].set_ylabel("Umidade relativa (%)", fontsize=14)
+    axs[2].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.0f}"))
+    axs[2].grid(True)
+    for label in axs[2].get_yticklabels():
+        label.set_fontsize(14)
+    axs[3].plot(df['Timestamp'], df['Wind Speed'], color='navy', label='Vento', marker='o')
+    axs[3].scatter(df['Timestamp'], df['Wind Gust'], color='orange', label='Rajadas', alpha=0.7)
+    axs[3].set_ylabel("Vento (km/h)", fontsize=14)
+    axs[3].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.1f}"))
+    axs[3].grid(True)
+    axs[3].legend(loc="best")
+    for label in axs[3].get_yticklabels():
+        label.set_fontsize(14)
+    axs[4].plot(df['Timestamp'], df['Radiation'], color='orange', marker='o')
+    axs[4].set_ylabel("Radiação solar (W/m²)", fontsize=14)
+    axs[4].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.0f}"))
+    axs[4].grid(True)
+    for label in axs[4].get_yticklabels():
+        label.set_fontsize(14)
+    axs[4].xaxis.set_major_formatter(mdates.DateFormatter('%H:%M', tz=brasilia_tz))
+    axs[4].xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    axs[4].set_xlim([start_time, end_time])
+    for label in axs[4].get_xticklabels():
+        label.set_fontsize(14)
+    plt.xlabel("Hora local", fontsize=14)
+    plt.gcf().autofmt_xdate()
+    axs[0].set_ylim(df['Dew Point'].min() - 2, df['Temperature'].max() + 2)
+    axs[1].set_ylim(0, precip_diff.max() + 5)
+    axs[2].set_ylim([0, 103])
+    axs[3].set_ylim(0, df['Wind Gust'].max() + 3)
+    axs[4].set_ylim([0, 1350])
+    plt.tight_layout()
+    plt.savefig(destino, bbox_inches='tight')
+    plt.close(fig)
+
+
+def antigo_cge(df, atual, estadoEstacao, timestamp, start_time, end_time, destino):
+    # Desenho de graph_cge.png em CGE_dados.py antes de painel.py
+    temp, humidity, dew_point, rain = atual['Temperature'], atual['Humidity'], atual['Dew Point'], atual['Rain']
+    fig, axs = plt.subplots(3, 1, figsize=(10, 11), sharex=True)
+    fig.suptitle("Tempo nas últimas 24 horas")
+    cmap, cmap_hum, cmap_rad = _cores_antigas()
+    temp_color = cmap(np.clip((temp + 10) / 55, 0, 1))
+    hum_color = cmap_hum(humidity / 100)
+    precip_color = cmap_rad(rain / 50)
+    state_color = 'red' if estadoEstacao == "Offline" else 'green'
+    fig.text(0.5, 0.99, estadoEstacao, color=state_color, fontsize=16, ha='center')
+    plt.figtext(0.5, 1.15, f"Condições meteorológicas atuais na USP (Poli) - Atualizado {timestamp:%d/%m/%Y} às {timestamp:%H:%M}", fontsize=18, ha='center')
+    fig.patches.append(plt.Rectangle((0.15, 1.03), 0.22, 0.10, transform=fig.transFigure, color=temp_color, lw=0))
+    text_color = 'white' if (temp >= 32 or temp < 8) else 'black'
+    plt.figtext(0.26, 1.055, f"Temperatura:\n {temp:.1f} °C", fontsize=20, ha='center', color=text_color)
+    plt.figtext(0.26, 1.00, f"Ponto de orvalho: {dew_point:.1f} °C", fontsize=12, ha='center', color='black')
+    fig.patches.append(plt.Rectangle((0.39, 1.03), 0.22, 0.10, transform=fig.transFigure, color=hum_color, lw=0))
+    text_color = 'white' if (humidity >= 90) else 'black'
+    plt.figtext(0.50, 1.055, f"Umidade:\n {humidity:.0f} %", fontsize=20, ha='center', color=text_color)
+    fig.patches.append(plt.Rectangle((0.63, 1.03), 0.22, 0.10, transform=fig.transFigure, color=precip_color, lw=0))
+    text_color = 'white' if (rain >= 30) else 'black'
+    plt.figtext(0.74, 1.055, f"Chuva acum.:\n {rain:.1f} mm", fontsize=20, ha='center', color=text_color)
+
+    axs[0].plot(df['Timestamp'], df['Temperature'], label="Temperatura", color='red', marker='o')
+    axs[0].plot(df['Timestamp'], df['Dew Point'], label="Ponto de orvalho", color="green", linestyle="--", marker='o', markersize=3)
+    axs[0].set_ylabel("Temperatura (°C)", fontsize=14)
+    axs[0].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x}"))
+    axs[0].legend(loc="upper left")
+    axs[0].grid(True)
+    for label in axs[0].get_yticklabels():
+        label.set_fontsize(14)
+    axs[1].plot(df['Timestamp'], df['Humidity'], color='blue', marker='o')
+    axs[1].set_ylabel("Umidade relativa (%)", fontsize=14)
+    axs[1].set_ylim([0, 102])
+    axs[1].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.0f}"))
+    axs[1].grid(True)
+    for label in axs[1].get_yticklabels():
+        label.set_fontsize(14)
+    precip_diff = df['Rain'].diff().fillna(0).clip(lower=0)
+    axs[2].bar(df['Timestamp'], precip_diff, color='skyblue', label='Taxa de precipitação', width=0.02)
+    axs[2].set_ylabel("Chuva (mm)", fontsize=14)
+    axs[2].yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f"{x:.1f}"))
+    axs[2].grid(True)
+    for label in axs[2].get_yticklabels():
+        label.set_fontsize(14)
+    axs[2].xaxis.set_major_formatter(mdates.DateFormatter('%H:%M', tz=brasilia_tz))
+    axs[2].xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    axs[2].set_xlim([start_time, end_time])
+    for label in axs[2].get_xticklabels():
+        label.set_fontsize(14)
+    plt.xlabel("Hora local", fontsize=14)
+    plt.gcf().autofmt_xdate()
+    axs[0].set_ylim(df['Dew Point'].min() - 2, df['Temperature'].max() + 2)
+    axs[2].set_ylim(0, precip_diff.max() + 5)
+    plt.tight_layout()
+    plt.savefig(destino, bbox_inches='tight')
+    plt.close(fig)
+
+
+def novo(spec):
+    def desenhar(df, atual, estado, horario, inicio, fim, destino):
+        painel = PainelSerieTemporal(spec, brasilia_tz)
+        painel.desenhar(df, atual, estado, horario, inicio, fim)
+        painel.salvar(destino, variantes=False)
+        painel.fechar()
+    return desenhar
+
+
+def pixels_diferentes(antigo, desenhar):
+    # Fração de pixels diferentes entre as duas versões (1.0 se os tamanhos diferem)
+    df, atual, agora = janela_sintetica()
+    inicio, fim = agora - pd.Timedelta(hours=25), agora + pd.Timedelta(hours=1)
+    imagens = []
+    for f in (antigo, desenhar):
+        buffer = io.BytesIO()
+        f(df, atual, 'Online', agora, inicio, fim, buffer)
+        imagens.append(np.asarray(Image.open(io.BytesIO(buffer.getvalue()))))
+    a, b = imagens
+    return 1.0 if a.shape != b.shape else float((a != b).any(axis=-1).mean())
+
+
+def medir(desenhar, repeticoes):
+    df, atual, agora = janela_sintetica()
+    inicio, fim = agora - pd.Timedelta(hours=25), agora + pd.Timedelta(hours=1)
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        desenhar(df, atual, 'Online', agora, inicio, fim, io.BytesIO())
+        tempos.append(time.perf_counter() - t0)
+    return np.median(tempos) * 1000
+
+
+if __name__ == '__main__':
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for nome, antigo, spec in (('graph.png', antigo_pelletron, PAINEL_PELLETRON), ('graph_cge.png', antigo_cge, PAINEL_CGE)):
+        diferenca = pixels_diferentes(antigo, novo(spec))
+        t_antigo = medir(antigo, repeticoes)
+        t_novo = medir(novo(spec), repeticoes)
+        print(f"{nome:14s} código anterior: {t_antigo:7.1f} ms   painel.py: {t_novo:7.1f} ms   "
+              f"({t_novo / t_antigo:.2f}x)   pixels diferentes: {100 * diferenca:.2f}%")
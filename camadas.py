@@ -0,0 +1,122 @@
+# Composição de mapas com camadas estáticas pré-renderizadas
+#
+# Nos mapas, quase tudo é igual de uma execução para outra (mapa de fundo,
+# título, nomes das estações); só os marcadores e os valores mudam. As
+# camadas estáticas são desenhadas uma vez, guardadas como raster RGBA em
+# .cache/camadas/<nome>_<chave>.npz (a chave identifica a lista de estações e
+# a extensão) e, nas execuções seguintes, coladas na figura com figimage. A
+# ordem de empilhamento é preservada com duas camadas:
+#   fundo (opaca) < eixo de baixo (marcadores) < frente (transparente) < eixo de cima (valores)
+#
+# figimage não acompanha o bbox_inches do savefig, então os rasters já são
+# guardados recortados (o recorte 'tight', arredondado para pixels inteiros)
+# e figura() devolve uma figura do tamanho do recorte, salva sem bbox_inches.
+import glob
+import math
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.transforms import Affine2D, Bbox
+
+from feed import chave_cache, gravacao_atomica
+
+DIRETORIO_CAMADAS = os.path.join('.cache', 'camadas')
+MAXIMO_POR_NOME = 8  # composições guardadas por mapa (as mais antigas são apagadas)
+VERSAO = 2
+
+
+def chave_camadas(*partes):
+    # Identificador estável das camadas a partir de dados serializáveis em JSON
+    return chave_cache(VERSAO, partes)
+
+
+def _raster(fig):
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+
+class ComposicaoEstatica:
+    def __init__(self, nome, chave, figsize, dpi=100, diretorio=DIRETORIO_CAMADAS):
+        self.figsize = figsize
+        self.dpi = dpi
+        self.diretorio = diretorio
+        self.nome = nome
+        self.arquivo = os.path.join(diretorio, f'{nome}_{chave}.npz')
+        self.do_cache = False
+
+    def preparar(self, desenhar_fundo, desenhar_frente=None):
+        # Carrega as camadas do cache ou as renderiza. desenhar_fundo(fig, ax)
+        # define os limites e o layout do eixo; desenhar_frente(fig, ax) recebe
+        # um eixo transparente na mesma posição e com os mesmos limites.
+        if os.path.exists(self.arquivo):
+            with np.load(self.arquivo) as dados:
+                self.fundo, self.frente = dados['fundo'], dados['frente']
+                self.posicao, self.limites = dados['posicao'], dados['limites']
+                self.recorte = Bbox(dados['recorte'])
+            os.utime(self.arquivo)
+            self.do_cache = True
+            return self
+
+        fig, ax = plt.subplots(figsize=self.figsize, dpi=self.dpi)
+        desenhar_fundo(fig, ax)
+        fig.tight_layout()
+        self.fundo = _raster(fig)
+        self.posicao = np.array(ax.get_position().bounds)
+        self.limites = np.array(ax.axis())
+        recortes = [fig.get_tightbbox(fig.canvas.get_renderer())]
+        plt.close(fig)
+
+        fig, ax = self._figura_vazia(transparente=True)
+        if desenhar_frente is not None:
+            desenhar_frente(fig, ax)
+        self.frente = _raster(fig)
+        recortes.append(fig.get_tightbbox(fig.canvas.get_renderer()))
+        plt.close(fig)
+
+        # Mesmo recorte que bbox_inches='tight' (margem padrão de 0,1 pol.), em
+        # pixels inteiros; os rasters e a posição do eixo passam a ser do recorte
+        (x0, y0), (x1, y1) = Bbox.union(recortes).padded(0.1).get_points() * self.dpi
+        altura, largura = self.fundo.shape[:2]
+        x0, y0 = max(math.floor(x0), 0), max(math.floor(y0), 0)
+        x1, y1 = min(math.ceil(x1), largura), min(math.ceil(y1), altura)
+        self.fundo = self.fundo[altura - y1:altura - y0, x0:x1]
+        self.frente = self.frente[altura - y1:altura - y0, x0:x1]
+        px, py, pl, pa = self.posicao * [largura, altura, largura, altura]
+        self.posicao = np.array([px - x0, py - y0, pl, pa]) / [x1 - x0, y1 - y0, x1 - x0, y1 - y0]
+        self.recorte = Bbox([[x0, y0], [x1, y1]]).transformed(Affine2D().scale(1 / self.dpi))
+        os.makedirs(self.diretorio, exist_ok=True)
+        with gravacao_atomica(self.arquivo, 'wb') as f:
+            np.savez_compressed(f, fundo=self.fundo, frente=self.frente, posicao=self.posicao,
+                                limites=self.limites, recorte=self.recorte.get_points())
+        self._limpar()
+        return self
+
+    def _figura_vazia(self, transparente=False):
+        fig = plt.figure(figsize=self.figsize, dpi=self.dpi)
+        ax = self._eixo(fig)
+        if transparente:
+            fig.patch.set_alpha(0)
+        return fig, ax
+
+    def _eixo(self, fig, zorder=0):
+        ax = fig.add_axes(self.posicao, zorder=zorder)
+        ax.set_axis_off()
+        ax.axis(self.limites)
+        return ax
+
+    def figura(self):
+        # Figura recortada com as camadas estáticas (salvar sem bbox_inches);
+        # retorna (fig, eixo de baixo, eixo de cima)
+        altura, largura = self.fundo.shape[:2]
+        fig = plt.figure(figsize=(largura / self.dpi, altura / self.dpi), dpi=self.dpi)
+        fig.figimage(self.fundo, zorder=-1)
+        abaixo = self._eixo(fig, zorder=0)
+        fig.figimage(self.frente, zorder=0.5)
+        acima = self._eixo(fig, zorder=1)
+        return fig, abaixo, acima
+
+    def _limpar(self):
+        arquivos = sorted(glob.glob(os.path.join(self.diretorio, f'{self.nome}_*.npz')), key=os.path.getmtime)
+        for antigo in arquivos[:-MAXIMO_POR_NOME]:
+            os.remove(antigo)
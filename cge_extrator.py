@@ -0,0 +1,65 @@
+# Extração dos valores das páginas de estação do CGE (estacao.jsp?POSTO=...)
+#
+# Em vez de montar a árvore do BeautifulSoup e varrer todos os <td> com
+# soup.find(lambda ...) (cada chamada a tag.text percorre a subárvore inteira,
+# o que é quadrático nas tabelas aninhadas da página), o HTML é reduzido a
+# texto uma única vez e todos os campos são lidos em uma só passada de uma
+# expressão regular pré-compilada.
+import html
+import re
+
+# Trechos sem texto visível e marcação
+_RE_INVISIVEL = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->', re.S | re.I)
+_RE_TAG = re.compile(r'<[^>]*>')
+_RE_ESPACOS = re.compile(r'\s+')
+
+_NUMERO = r'-?\d+(?:[,.]\d+)?'
+
+# Campos principais, na ordem em que a página costuma apresentá-los; vale a
+# primeira ocorrência de cada um
+_RE_CAMPOS = re.compile(
+    r'(?P<horario>(?P<data>\d{2}/\d{2}/\d{4})\s*(?:às|-)?\s*(?P<hora>\d{2}:\d{2}))'
+    r'|Per\.\s*Atual:\s*(?P<chuva>' + _NUMERO + r')\s*mm'
+    r'|Atual:\s*(?P<temperatura>' + _NUMERO + r')\s*°\s*C'
+    r'|Atual:\s*(?P<umidade>' + _NUMERO + r')\s*%',
+    re.I)
+
+# Demais pares "Rótulo: valor unidade" publicados (máximas, mínimas, pressão, vento...)
+_RE_ROTULADOS = re.compile(r'([A-Za-zÀ-ÿ][A-Za-zÀ-ÿ.\s]{0,30}?):\s*(' + _NUMERO + r')\s*(°\s*C|%|mm|hPa|km/h|m/s)')
+
+
+def texto_da_pagina(conteudo):
+    # Texto visível da página, com entidades resolvidas e espaços normalizados
+    if isinstance(conteudo, bytes):
+        try:
+            conteudo = conteudo.decode('utf-8')
+        except UnicodeDecodeError:
+            conteudo = conteudo.decode('latin-1')
+    conteudo = _RE_INVISIVEL.sub(' ', conteudo)
+    conteudo = _RE_TAG.sub(' ', conteudo)
+    return _RE_ESPACOS.sub(' ', html.unescape(conteudo))
+
+
+def _numero(texto):
+    return float(texto.replace(',', '.'))
+
+
+def extrair(conteudo):
+    # Todos os campos da página de uma vez:
+    #   {'horario': 'dd/mm/aaaa HH:MM' ou None, 'chuva', 'temperatura', 'umidade'
+    #    (float ou None), 'campos': [(rótulo, valor, unidade), ...]}
+    texto = texto_da_pagina(conteudo)
+    dados = {'horario': None, 'chuva': None, 'temperatura': None, 'umidade': None}
+    for m in _RE_CAMPOS.finditer(texto):
+        campo = m.lastgroup if m.lastgroup != 'hora' else 'horario'
+        if dados[campo] is not None:
+            continue
+        if campo == 'horario':
+            dados['horario'] = f"{m.group('data')} {m.group('hora')}"
+        else:
+            dados[campo] = _numero(m.group(campo))
+        if all(v is not None for v in dados.values()):
+            break
+    dados['campos'] = [(rotulo.strip(), _numero(valor), unidade.replace(' ', ''))
+                       for rotulo, valor, unidade in _RE_ROTULADOS.findall(texto)]
+    return dados
@@ -0,0 +1,104 @@
+# Feeds JSON publicados ao lado de cada imagem
+#
+# Cada script grava, na mesma execução da imagem, um <produto>.json com os
+# valores atuais e as séries recentes, para que o site e o telão possam
+# consultar alguns kilobytes em vez de baixar os PNGs. Formato:
+#   {"versao": 1, "produto": ..., "gerado_em": <epoch UTC>, ...dados}
+# Horários são segundos UTC desde a época; séries são colunares
+# ({"ts": [...], "valores": {nome: [...]}}) e valores ausentes viram null.
+#
+# Aqui ficam também os dois utilitários de arquivo usados pelos outros
+# módulos: gravacao_atomica (escrita em .tmp + os.replace) e chave_cache
+# (nome estável de um arquivo de cache a partir dos parâmetros que o definem).
+import hashlib
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+VERSAO_FEED = 1
+CASAS_DECIMAIS = 2
+
+
+def _limpar(valor, casas=CASAS_DECIMAIS):
+    # Converte tipos do NumPy para JSON; NaN/inf viram null e floats são arredondados
+    if isinstance(valor, dict):
+        return {str(k): _limpar(v, casas) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple, np.ndarray)):
+        return [_limpar(v, casas) for v in valor]
+    if isinstance(valor, (bool, np.bool_)):
+        return bool(valor)
+    if isinstance(valor, (int, np.integer)):
+        return int(valor)
+    if isinstance(valor, (float, np.floating)):
+        valor = float(valor)
+        return round(valor, casas) if math.isfinite(valor) else None
+    return valor
+
+
+def serie_temporal(ts, colunas, casas=CASAS_DECIMAIS):
+    # Série colunar: ts em segundos UTC e uma lista por grandeza
+    return {
+        'ts': np.asarray(ts, dtype='i8').tolist(),
+        'valores': {nome: _limpar(np.asarray(v, dtype='f8').round(casas), casas) for nome, v in colunas.items()},
+    }
+
+
+def gravar_feed(caminho, produto, dados, gerado_em=None):
+    # Grava o feed de forma atômica (o site nunca lê um arquivo pela metade)
+    documento = {
+        'versao': VERSAO_FEED,
+        'produto': produto,
+        'gerado_em': int(time.time() if gerado_em is None else gerado_em),
+    }
+    documento.update(_limpar(dados))
+    return _gravar(caminho, documento)
+
+
+def gravar_geojson(caminho, produto, features, gerado_em=None):
+    # FeatureCollection GeoJSON (RFC 7946), com versão, produto e horário como
+    # membros extras; features: [(lon, lat, propriedades), ...]
+    documento = {
+        'type': 'FeatureCollection',
+        'versao': VERSAO_FEED,
+        'produto': produto,
+        'gerado_em': int(time.time() if gerado_em is None else gerado_em),
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(float(lon), 6), round(float(lat), 6)]},
+            'properties': _limpar(propriedades),
+        } for lon, lat, propriedades in features],
+    }
+    return _gravar(caminho, documento)
+
+
+def _gravar(caminho, documento):
+    conteudo = json.dumps(documento, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+    with gravacao_atomica(caminho) as f:
+        f.write(conteudo)
+    return len(conteudo)
+
+
+@contextmanager
+def gravacao_atomica(caminho, modo='w'):
+    # Arquivo temporário ao lado de `caminho` que o substitui de uma vez ao
+    # fim do bloco (quem lê nunca vê um arquivo pela metade); com erro no
+    # bloco, o temporário é apagado e o original fica intacto
+    temporario = caminho + '.tmp'
+    try:
+        with open(temporario, modo, **({} if 'b' in modo else {'encoding': 'utf-8'})) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, caminho)
+
+
+def chave_cache(*partes):
+    # Identificador estável (16 hex) de dados serializáveis em JSON
+    texto = json.dumps(partes, sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode()).hexdigest()[:16]
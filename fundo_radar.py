@@ -0,0 +1,163 @@
+# Camadas do Natural Earth pré-recortadas para o fundo do mapa de radar
+#
+# O radar cobre sempre a mesma região em volta de São Paulo, mas o cartopy lê
+# os shapefiles globais de 10 m a cada execução (continentes, oceano, costa,
+# fronteiras, estados, estradas, áreas urbanas) e radar.py percorria todos os
+# registros de populated_places em Python. Aqui cada camada é recortada uma
+# vez à extensão do mapa (com uma pequena margem), simplificada abaixo da
+# resolução da figura e guardada como um Path do matplotlib (vértices float32
+# e códigos uint8) em .cache/natural_earth/<chave>.npz, junto com a lista de
+# cidades. As execuções seguintes só carregam esse arquivo.
+#
+# Pré-cálculo (opcional; a primeira execução de radar.py faz o mesmo), com a
+# extensão do radar em graus (oeste, leste, sul, norte; vale até a 3ª casa):
+#   python fundo_radar.py --extensao -47.911 -45.549 -24.741 -22.379
+import argparse
+import os
+
+import numpy as np
+from matplotlib.path import Path
+
+from feed import chave_cache, gravacao_atomica
+
+DIRETORIO_NATURAL_EARTH = os.path.join('.cache', 'natural_earth')
+RESOLUCAO = '10m'
+TOLERANCIA = 0.001  # graus (~100 m, bem abaixo de um pixel do mapa)
+MARGEM = 0.05  # fração da extensão incluída além da borda
+POPULACAO_MINIMA = 100000
+MARGEM_CIDADES = 0.1  # graus: cidades muito perto da borda ficam de fora
+VERSAO = 1
+
+# nome: (categoria, nome no Natural Earth)
+CAMADAS = {
+    'continentes': ('physical', 'land'),
+    'oceano': ('physical', 'ocean'),
+    'costa': ('physical', 'coastline'),
+    'fronteiras': ('cultural', 'admin_0_boundary_lines_land'),
+    'estados': ('cultural', 'admin_1_states_provinces_lines'),
+    'estradas': ('cultural', 'roads'),
+    'areas_urbanas': ('cultural', 'urban_areas'),
+}
+
+
+def _partes(geometria):
+    # Polígonos e linhas simples de qualquer geometria (multi ou coleção)
+    if geometria.is_empty:
+        return
+    if hasattr(geometria, 'geoms'):
+        for g in geometria.geoms:
+            yield from _partes(g)
+    elif geometria.geom_type in ('Polygon', 'LineString', 'LinearRing'):
+        yield geometria
+
+
+def _para_path(geometrias):
+    # Um Path composto com todas as geometrias; anéis internos com orientação
+    # oposta, para que a regra de preenchimento abra os buracos
+    from shapely.geometry.polygon import orient
+
+    vertices, codigos = [], []
+    for geometria in geometrias:
+        for parte in _partes(geometria):
+            if parte.geom_type == 'Polygon':
+                parte = orient(parte)
+                aneis, fechado = [parte.exterior, *parte.interiors], True
+            else:
+                aneis, fechado = [parte], False
+            for anel in aneis:
+                xy = np.asarray(anel.coords, dtype=np.float32)[:, :2]
+                if len(xy) < 2:
+                    continue
+                c = np.full(len(xy), Path.LINETO, dtype=np.uint8)
+                c[0] = Path.MOVETO
+                if fechado:
+                    c[-1] = Path.CLOSEPOLY
+                vertices.append(xy)
+                codigos.append(c)
+    if not vertices:
+        return np.zeros((0, 2), np.float32), np.zeros(0, np.uint8)
+    return np.concatenate(vertices), np.concatenate(codigos)
+
+
+def _recortar(categoria, nome, caixa):
+    import cartopy.io.shapereader as shpreader
+
+    leitor = shpreader.Reader(shpreader.natural_earth(resolution=RESOLUCAO, category=categoria, name=nome))
+    x0, y0, x1, y1 = caixa.bounds
+    recortes = []
+    for geometria in leitor.geometries():
+        gx0, gy0, gx1, gy1 = geometria.bounds
+        if gx1 < x0 or gx0 > x1 or gy1 < y0 or gy0 > y1:
+            continue
+        recorte = geometria.intersection(caixa).simplify(TOLERANCIA, preserve_topology=True)
+        if not recorte.is_empty:
+            recortes.append(recorte)
+    return recortes
+
+
+def _cidades(extensao):
+    import cartopy.io.shapereader as shpreader
+
+    leitor = shpreader.Reader(shpreader.natural_earth(resolution=RESOLUCAO, category='cultural', name='populated_places'))
+    oeste, leste, sul, norte = extensao
+    cidades = []
+    for cidade in leitor.records():
+        lon, lat = cidade.geometry.x, cidade.geometry.y
+        if (sul + MARGEM_CIDADES <= lat <= norte - MARGEM_CIDADES and oeste + MARGEM_CIDADES <= lon <= leste - MARGEM_CIDADES
+                and cidade.attributes['POP_MAX'] > POPULACAO_MINIMA):
+            cidades.append((cidade.attributes['NAME'], lon, lat))
+    return cidades
+
+
+def _normalizar(extensao):
+    # Extensão arredondada (~100 m), para que a chave não dependa de ruído de ponto flutuante
+    return [round(float(v), 3) for v in extensao]
+
+
+def _arquivo(extensao, diretorio):
+    chave = chave_cache(VERSAO, RESOLUCAO, TOLERANCIA, MARGEM, POPULACAO_MINIMA, MARGEM_CIDADES,
+                        _normalizar(extensao), sorted(CAMADAS.items()))
+    return os.path.join(diretorio, chave + '.npz')
+
+
+def preparar(extensao, diretorio=DIRETORIO_NATURAL_EARTH):
+    # Recorta as camadas e a lista de cidades para a extensão (oeste, leste, sul, norte)
+    from shapely.geometry import box
+
+    extensao = _normalizar(extensao)
+    oeste, leste, sul, norte = extensao
+    mx, my = (leste - oeste) * MARGEM, (norte - sul) * MARGEM
+    caixa = box(oeste - mx, sul - my, leste + mx, norte + my)
+    dados = {}
+    for nome, (categoria, nome_ne) in CAMADAS.items():
+        dados[f'{nome}_vertices'], dados[f'{nome}_codigos'] = _para_path(_recortar(categoria, nome_ne, caixa))
+    cidades = _cidades(extensao)
+    dados['cidades_nomes'] = np.array([c[0] for c in cidades], dtype=str)
+    dados['cidades_lonlat'] = np.array([c[1:] for c in cidades], dtype=np.float32).reshape(-1, 2)
+
+    arquivo = _arquivo(extensao, diretorio)
+    os.makedirs(diretorio, exist_ok=True)
+    with gravacao_atomica(arquivo, 'wb') as f:
+        np.savez_compressed(f, **dados)
+    return arquivo
+
+
+def carregar(extensao, diretorio=DIRETORIO_NATURAL_EARTH):
+    # ({nome: Path}, [(nome da cidade, lon, lat), ...]), preparando na primeira vez
+    arquivo = _arquivo(extensao, diretorio)
+    if not os.path.exists(arquivo):
+        print("Recortando as camadas do Natural Earth para a extensão do radar...")
+        preparar(extensao, diretorio)
+    with np.load(arquivo) as dados:
+        camadas = {nome: Path(dados[f'{nome}_vertices'], dados[f'{nome}_codigos']) for nome in CAMADAS}
+        cidades = [(str(n), float(lon), float(lat)) for n, (lon, lat) in zip(dados['cidades_nomes'], dados['cidades_lonlat'])]
+    return camadas, cidades
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recorta as camadas do Natural Earth para a extensão do radar.")
+    parser.add_argument('--extensao', nargs=4, type=float, required=True, metavar=('OESTE', 'LESTE', 'SUL', 'NORTE'))
+    args = parser.parse_args()
+
+    arquivo = preparar(args.extensao)
+    print(f"{arquivo}: {os.path.getsize(arquivo) / 1024:.1f} kB")
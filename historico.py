@@ -0,0 +1,266 @@
+# Arquivo de longo prazo das observações
+#
+# O armazém (armazenamento.py) guarda só a janela recente. Aqui as amostras que
+# saem da janela de 24 h vão para partições diárias comprimidas
+# (historico/<estacao>/brutos/AAAA/AAAA-MM-DD.npz) e, a cada ingestão, são
+# atualizados agregados horários (um arquivo por mês) e diários (um por ano)
+# com contagem, soma, mínimo e máximo de cada grandeza, além do total de chuva.
+# Os agregados ficam em .npy abertos com mmap, então consultar um ano inteiro
+# lê no máximo algumas centenas de linhas, sem tocar nas amostras brutas.
+#
+# sincronizar() registra em lote, em ordem, tudo o que o armazém tem depois da
+# última amostra registrada. Na primeira vez (ex.: logo depois da migração do
+# CSV antigo para o armazém) os agregados são reconstruídos a partir das
+# partições e do armazém, para que o período migrado não fique sem agregados.
+import calendar
+import glob
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from feed import gravacao_atomica
+
+# Índices das estatísticas no último eixo dos agregados
+CONTAGEM, SOMA, MINIMO, MAXIMO = range(4)
+COLUNA_CHUVA = 'Chuva'
+
+
+class Historico:
+    def __init__(self, diretorio, colunas, fuso, coluna_chuva=None):
+        self.diretorio = diretorio
+        self.colunas = list(colunas)
+        self.fuso = fuso
+        self.coluna_chuva = coluna_chuva
+        # Grandezas agregadas: as colunas do armazém e, se houver, a chuva do período
+        self.variaveis = self.colunas + ([COLUNA_CHUVA] if coluna_chuva else [])
+        self.arquivo_estado = os.path.join(diretorio, 'estado.json')
+        os.makedirs(diretorio, exist_ok=True)
+        if os.path.exists(self.arquivo_estado):
+            with open(self.arquivo_estado) as f:
+                self.estado = json.load(f)
+        else:
+            self.estado = {'arquivado_ate': None, 'ultimo_ts': None, 'ultima_chuva': None}
+        self.estado.setdefault('agregados_completos', False)
+
+    def _salvar_estado(self):
+        with gravacao_atomica(self.arquivo_estado) as f:
+            json.dump(self.estado, f, indent=1)
+
+    def _agregado(self, nome, nslots, modo='r+'):
+        # Abre (ou cria) um arquivo de agregados com shape (slots, variáveis, 4)
+        caminho = os.path.join(self.diretorio, nome)
+        if not os.path.exists(caminho):
+            if modo == 'r':
+                return None
+            vazio = np.zeros((nslots, len(self.variaveis), 4), dtype='<f4')
+            vazio[..., MINIMO] = np.nan
+            vazio[..., MAXIMO] = np.nan
+            np.save(caminho, vazio)
+        return np.load(caminho, mmap_mode=modo)
+
+    def _chuva_incremento(self, local, chuva):
+        # A chuva das estações é acumulada no dia e zera à meia-noite local
+        anterior_ts, anterior = self.estado['ultimo_ts'], self.estado['ultima_chuva']
+        if chuva is None or np.isnan(chuva):
+            return np.nan
+        if anterior is None or anterior_ts is None:
+            return 0.0
+        if datetime.fromtimestamp(anterior_ts, self.fuso).date() != local.date() or chuva < anterior:
+            return chuva
+        return chuva - anterior
+
+    def _acumular(self, locais, linhas):
+        # Soma as linhas (amostras x variáveis) nos agregados horário e diário
+        # dos horários locais correspondentes, um arquivo de cada vez
+        locais = pd.DatetimeIndex(locais)
+        meses = locais.year * 100 + locais.month
+        for mes in np.unique(meses):
+            sel = np.asarray(meses == mes)
+            ano, m = divmod(int(mes), 100)
+            horario = self._agregado(f'horario_{ano:04d}-{m:02d}.npy', calendar.monthrange(ano, m)[1] * 24)
+            self._somar(horario, np.asarray((locais.day[sel] - 1) * 24 + locais.hour[sel]), linhas[sel])
+        for ano in np.unique(locais.year):
+            sel = np.asarray(locais.year == ano)
+            diario = self._agregado(f'diario_{int(ano):04d}.npy', 366)
+            self._somar(diario, np.asarray(locais.dayofyear[sel] - 1), linhas[sel])
+
+    @staticmethod
+    def _somar(agregado, slots, linhas):
+        # Acumula (com repetição de slots) só os valores válidos de cada variável
+        for i in range(linhas.shape[1]):
+            valido = ~np.isnan(linhas[:, i])
+            s, v = slots[valido], linhas[valido, i]
+            np.add.at(agregado[:, i, CONTAGEM], s, 1)
+            np.add.at(agregado[:, i, SOMA], s, v)
+            np.fmin.at(agregado[:, i, MINIMO], s, v)
+            np.fmax.at(agregado[:, i, MAXIMO], s, v)
+        agregado.flush()
+
+    def registrar(self, ts, valores, em_ordem=True):
+        # Atualiza incrementalmente os agregados horário e diário com uma amostra.
+        # Amostras fora de ordem (preenchimento de lacunas) não entram no total de
+        # chuva, que depende da amostra anterior.
+        local = datetime.fromtimestamp(ts, self.fuso)
+        linha = np.array([np.nan if valores.get(c) is None else valores.get(c) for c in self.colunas], dtype='f4')
+        if self.coluna_chuva:
+            chuva = valores.get(self.coluna_chuva)
+            incremento = self._chuva_incremento(local, chuva) if em_ordem else np.nan
+            linha = np.append(linha, np.float32(incremento))
+            if em_ordem and chuva is not None and not np.isnan(chuva):
+                self.estado['ultima_chuva'] = float(chuva)
+
+        self._acumular([local.replace(tzinfo=None)], linha[None, :])
+
+        if em_ordem:
+            self.estado['ultimo_ts'] = int(ts)
+            self._salvar_estado()
+
+    def registrar_lote(self, registros):
+        # Registra em ordem os registros (do armazém) posteriores à última
+        # amostra registrada; mesmo resultado de chamar registrar() em cada um
+        registros = np.sort(np.asarray(registros), order='ts')
+        if self.estado['ultimo_ts'] is not None:
+            registros = registros[registros['ts'] > self.estado['ultimo_ts']]
+        if len(registros) == 0:
+            return 0
+        locais = pd.to_datetime(registros['ts'], unit='s', utc=True).tz_convert(self.fuso).tz_localize(None)
+        linhas = np.stack([np.asarray(registros[c], dtype='f4') for c in self.colunas], axis=1)
+        if self.coluna_chuva:
+            chuva = np.asarray(registros[self.coluna_chuva], dtype=float)
+            # Amostra anterior (para a data) e último acumulado válido antes de cada uma
+            anterior_ts = np.concatenate([[self.estado['ultimo_ts'] or 0], registros['ts'][:-1]])
+            inicial = np.nan if self.estado['ultima_chuva'] is None else self.estado['ultima_chuva']
+            anterior = pd.Series(np.concatenate([[inicial], chuva[:-1]])).ffill().to_numpy()
+            mesmo_dia = np.asarray(pd.to_datetime(anterior_ts, unit='s', utc=True).tz_convert(self.fuso).date
+                                   == locais.date)
+            incremento = np.where(mesmo_dia & (chuva >= anterior), chuva - anterior, chuva)
+            incremento[np.isnan(anterior)] = 0.0
+            if self.estado['ultimo_ts'] is None:
+                incremento[0] = 0.0
+            incremento[np.isnan(chuva)] = np.nan
+            linhas = np.concatenate([linhas, incremento.astype('f4')[:, None]], axis=1)
+            validas = chuva[~np.isnan(chuva)]
+            if len(validas):
+                self.estado['ultima_chuva'] = float(validas[-1])
+
+        self._acumular(locais, linhas)
+        self.estado['ultimo_ts'] = int(registros['ts'][-1])
+        self._salvar_estado()
+        return len(registros)
+
+    def sincronizar(self, registros):
+        # Registra o que o armazém tem de novo. Na primeira chamada reconstrói os
+        # agregados com as partições e o armazém (cobre o CSV migrado)
+        if self.estado['agregados_completos']:
+            return self.registrar_lote(registros)
+        for arquivo in glob.glob(os.path.join(self.diretorio, 'horario_*.npy')) + \
+                glob.glob(os.path.join(self.diretorio, 'diario_*.npy')):
+            os.remove(arquivo)
+        partes = [np.asarray(registros)]
+        for arquivo in sorted(glob.glob(os.path.join(self.diretorio, 'brutos', '*', '*.npz'))):
+            with np.load(arquivo) as dados:
+                parte = np.zeros(len(dados['ts']), dtype=partes[0].dtype)
+                for c in ['ts'] + self.colunas:
+                    parte[c] = dados[c]
+                partes.append(parte)
+        todos = np.concatenate(partes)
+        _, indices = np.unique(todos['ts'], return_index=True)
+        self.estado.update(ultimo_ts=None, ultima_chuva=None, agregados_completos=True)
+        registrados = self.registrar_lote(todos[indices])
+        self._salvar_estado()
+        return registrados
+
+    def arquivar(self, registros, limite):
+        # Move para as partições diárias os registros com arquivado_ate < ts <= limite
+        inicio = self.estado['arquivado_ate'] or -1
+        ts = registros['ts']
+        selecao = registros[(ts > inicio) & (ts <= limite)]
+        if len(selecao) == 0:
+            return 0
+
+        dias = pd.to_datetime(selecao['ts'], unit='s', utc=True).tz_convert(self.fuso).strftime('%Y-%m-%d')
+        for dia in np.unique(dias):
+            self._gravar_particao(dia, selecao[np.asarray(dias == dia)])
+
+        self.estado['arquivado_ate'] = int(selecao['ts'][-1])
+        self._salvar_estado()
+        return len(selecao)
+
+    def _caminho_particao(self, dia):
+        return os.path.join(self.diretorio, 'brutos', dia[:4], f'{dia}.npz')
+
+    def _gravar_particao(self, dia, registros):
+        caminho = self._caminho_particao(dia)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        novos = {c: np.asarray(registros[c]) for c in ['ts'] + self.colunas}
+        if os.path.exists(caminho):
+            with np.load(caminho) as antigos:
+                novos = {c: np.concatenate([antigos[c], novos[c]]) for c in novos}
+        # Ordena e remove duplicatas pelo horário da observação
+        _, indices = np.unique(novos['ts'], return_index=True)
+        novos = {c: v[indices] for c, v in novos.items()}
+        with gravacao_atomica(caminho, 'wb') as f:
+            np.savez_compressed(f, **novos)
+
+    def brutos(self, dia):
+        # Amostras brutas de um dia ('AAAA-MM-DD') arquivado
+        caminho = self._caminho_particao(dia)
+        if not os.path.exists(caminho):
+            return None
+        with np.load(caminho) as dados:
+            return {c: dados[c] for c in dados.files}
+
+    def _hora_local(self, t):
+        # Horário local sem fuso, no mesmo referencial dos slots dos agregados
+        t = pd.Timestamp(t)
+        return t if t.tzinfo is None else t.tz_convert(self.fuso).tz_localize(None)
+
+    def consultar(self, inicio, fim, resolucao='dia'):
+        # Série agregada ('hora' ou 'dia') entre duas datas locais, lida só dos agregados
+        inicio, fim = self._hora_local(inicio), self._hora_local(fim)
+        blocos, tempos = [], []
+        if resolucao == 'hora':
+            mes = pd.Timestamp(inicio.year, inicio.month, 1)
+            while mes <= fim:
+                agregado = self._agregado(f'horario_{mes.year:04d}-{mes.month:02d}.npy', 0, modo='r')
+                if agregado is not None:
+                    horas = pd.date_range(mes, periods=agregado.shape[0], freq='h')
+                    sel = (horas >= inicio.floor('h')) & (horas <= fim)
+                    blocos.append(agregado[sel])
+                    tempos.append(horas[sel])
+                mes = mes + pd.offsets.MonthBegin(1)
+        else:
+            for ano in range(inicio.year, fim.year + 1):
+                agregado = self._agregado(f'diario_{ano:04d}.npy', 0, modo='r')
+                if agregado is None:
+                    continue
+                dias = pd.date_range(f'{ano}-01-01', f'{ano}-12-31', freq='D')
+                sel = (dias >= inicio.floor('D')) & (dias <= fim)
+                blocos.append(agregado[:len(dias)][sel])
+                tempos.append(dias[sel])
+
+        if not blocos:
+            return pd.DataFrame(columns=['Timestamp'])
+        estat = np.concatenate(blocos)
+        contagem = estat[..., CONTAGEM]
+        tem_dados = contagem.sum(axis=1) > 0
+        estat, contagem = estat[tem_dados], contagem[tem_dados]
+        resultado = {'Timestamp': pd.DatetimeIndex(np.concatenate([t.values for t in tempos]))[tem_dados].tz_localize(self.fuso)}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            media = estat[..., SOMA] / contagem
+        for i, c in enumerate(self.variaveis):
+            if c == COLUNA_CHUVA:
+                resultado[f'{c} total'] = estat[:, i, SOMA]
+                continue
+            resultado[f'{c} media'] = media[:, i]
+            resultado[f'{c} min'] = estat[:, i, MINIMO]
+            resultado[f'{c} max'] = estat[:, i, MAXIMO]
+            resultado[f'{c} soma'] = estat[:, i, SOMA]
+        return pd.DataFrame(resultado)
+
+
+def abrir_historico(estacao, colunas, fuso, coluna_chuva=None, base='historico'):
+    return Historico(os.path.join(base, estacao), colunas, fuso, coluna_chuva)
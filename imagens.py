@@ -0,0 +1,101 @@
+# Saída das imagens em várias resoluções e formatos a partir de um único desenho
+#
+# A figura é renderizada uma vez pelo Agg; a partir desse resultado são
+# gerados, sem redesenhar, o PNG original e as variantes servidas ao telão e
+# aos celulares:
+#   <nome>.png         original (o mesmo de sempre)
+#   <nome>_tv.png      largura do telão (indexTV.html), PNG com paleta de 256 cores;
+#                      não é gerado se o original já cabe no telão (seria
+#                      idêntico ao _q.png, que o telão usa nesse caso)
+#   <nome>_mobile.png  largura de celular, PNG com paleta de 256 cores
+#   <nome>.webp        WebP sem perdas, resolução original
+#   <nome>_q.png       PNG com paleta de 256 cores, resolução original
+import io
+import os
+
+from PIL import Image
+
+from feed import gravacao_atomica
+
+LARGURA_TV = 700
+LARGURA_MOBILE = 480
+
+
+def _gravar(caminho, conteudo):
+    with gravacao_atomica(caminho, 'wb') as f:
+        f.write(conteudo)
+    return len(conteudo)
+
+
+def _codificar(imagem, formato, **opcoes):
+    buffer = io.BytesIO()
+    imagem.save(buffer, format=formato, **opcoes)
+    return buffer.getvalue()
+
+
+def _reduzir(imagem, largura):
+    if imagem.width <= largura:
+        return imagem
+    altura = round(imagem.height * largura / imagem.width)
+    return imagem.resize((largura, altura), Image.LANCZOS)
+
+
+def _paleta(imagem):
+    # Quantização para 256 cores preservando a transparência
+    return imagem.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+
+def salvar_variantes(fig, caminho, largura_tv=LARGURA_TV, **opcoes_savefig):
+    # Renderiza a figura uma única vez e grava o PNG original e as variantes.
+    # Retorna {arquivo: bytes} e imprime quanto cada variante economiza.
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', **opcoes_savefig)
+    original = buffer.getvalue()
+    imagem = Image.open(io.BytesIO(original)).convert('RGBA')
+
+    base, _ = os.path.splitext(caminho)
+    variantes = {}
+    if imagem.width > largura_tv:
+        variantes[f'{base}_tv.png'] = lambda: _codificar(_paleta(_reduzir(imagem, largura_tv)), 'PNG', optimize=True)
+    elif os.path.exists(f'{base}_tv.png'):
+        os.remove(f'{base}_tv.png')  # cópia antiga, de quando o original era mais largo
+    variantes.update({
+        f'{base}_mobile.png': lambda: _codificar(_paleta(_reduzir(imagem, LARGURA_MOBILE)), 'PNG', optimize=True),
+        f'{base}.webp': lambda: _codificar(imagem, 'WEBP', lossless=True, method=4),
+        f'{base}_q.png': lambda: _codificar(_paleta(imagem), 'PNG', optimize=True),
+    })
+
+    tamanhos = {caminho: _gravar(caminho, original)}
+    for arquivo, codificar in variantes.items():
+        tamanhos[arquivo] = _gravar(arquivo, codificar())
+
+    relatorio = [f"{os.path.basename(caminho)}: {tamanhos[caminho]} bytes ({imagem.width}x{imagem.height})"]
+    for arquivo in variantes:
+        economia = tamanhos[caminho] - tamanhos[arquivo]
+        relatorio.append(f"  {os.path.basename(arquivo)}: {tamanhos[arquivo]} bytes, "
+                         f"{economia} bytes economizados ({100 * economia / tamanhos[caminho]:.0f}%)")
+    print("\n".join(relatorio))
+    return tamanhos
+
+
+def salvar_animacao(quadros, caminho, duracao=500, pausa_final=1500, largura=None):
+    # Grava uma sequência de quadros RGBA (arrays ou imagens PIL) como WebP
+    # animado (<nome>.webp) e GIF (<nome>.gif); o último quadro fica mais tempo
+    # na tela. Retorna {arquivo: bytes}.
+    imagens = [q if isinstance(q, Image.Image) else Image.fromarray(q) for q in quadros]
+    imagens = [_reduzir(i.convert('RGBA'), largura) if largura else i.convert('RGBA') for i in imagens]
+    duracoes = [duracao] * (len(imagens) - 1) + [pausa_final]
+    base, _ = os.path.splitext(caminho)
+
+    webp = _codificar(imagens[0], 'WEBP', save_all=True, append_images=imagens[1:], duration=duracoes,
+                      loop=0, quality=80, method=4)
+    # GIF: paleta por quadro, sem transparência (fundo branco)
+    opacos = [Image.alpha_composite(Image.new('RGBA', i.size, 'white'), i).convert('RGB') for i in imagens]
+    paletas = [_paleta(i) for i in opacos]
+    gif = _codificar(paletas[0], 'GIF', save_all=True, append_images=paletas[1:], duration=duracoes,
+                     loop=0, optimize=True, disposal=1)
+
+    tamanhos = {f'{base}.webp': _gravar(f'{base}.webp', webp), f'{base}.gif': _gravar(f'{base}.gif', gif)}
+    print(", ".join(f"{os.path.basename(a)}: {t} bytes" for a, t in tamanhos.items()),
+          f"({len(imagens)} quadros, {imagens[0].width}x{imagens[0].height})")
+    return tamanhos
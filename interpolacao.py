@@ -0,0 +1,102 @@
+# Campo interpolado (IDW) a partir das estações do CGE
+#
+# As posições das estações quase nunca mudam, então a matriz de pesos
+# estação -> grade (inverso da distância elevado a POTENCIA) é calculada uma
+# vez e guardada em .cache/interpolacao/<chave>.npz. A cada atualização o campo
+# sai de dois produtos matriz-vetor, o que permite ignorar estações sem leitura
+# (NaN) sem recalcular os pesos:
+#   campo = W @ (valores com NaN -> 0) / W @ (1 onde há leitura)
+# O campo é recortado pelo contorno das estações (fecho convexo), para não
+# extrapolar além da área coberta.
+import os
+
+import numpy as np
+from matplotlib.path import Path
+
+from feed import chave_cache, gravacao_atomica
+
+DIRETORIO_INTERPOLACAO = os.path.join('.cache', 'interpolacao')
+POTENCIA = 2
+RESOLUCAO = 250  # metros (EPSG:3857) por célula
+DISTANCIA_MINIMA = 1.0  # evita divisão por zero em cima de uma estação
+MINIMO_ESTACOES = 3
+
+
+def fecho_convexo(x, y):
+    # Fecho convexo (cadeia monótona de Andrew), em sentido anti-horário
+    pontos = sorted(set(zip(np.asarray(x, dtype=float), np.asarray(y, dtype=float))))
+    if len(pontos) < 3:
+        return np.array(pontos)
+
+    def cadeia(sequencia):
+        casca = []
+        for p in sequencia:
+            while len(casca) >= 2:
+                (ax, ay), (bx, by) = casca[-2], casca[-1]
+                if (bx - ax) * (p[1] - ay) - (by - ay) * (p[0] - ax) > 0:
+                    break
+                casca.pop()
+            casca.append(p)
+        return casca
+
+    inferior, superior = cadeia(pontos), cadeia(reversed(pontos))
+    return np.array(inferior[:-1] + superior[:-1])
+
+
+class CampoIDW:
+    def __init__(self, x, y, resolucao=RESOLUCAO, potencia=POTENCIA, diretorio=DIRETORIO_INTERPOLACAO):
+        # x, y: posições das estações em EPSG:3857 (a ordem define a ordem dos valores)
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.resolucao = resolucao
+        self.potencia = potencia
+        chave = chave_cache(np.round(self.x, 1).tolist(), np.round(self.y, 1).tolist(), resolucao, potencia)
+        self.arquivo = os.path.join(diretorio, chave + '.npz')
+        self.do_cache = False
+        self._carregar_ou_calcular()
+
+    def _carregar_ou_calcular(self):
+        if os.path.exists(self.arquivo):
+            with np.load(self.arquivo) as dados:
+                self.pesos, self.dentro = dados['pesos'], dados['dentro']
+                self.extensao = tuple(dados['extensao'])
+            self.do_cache = True
+            return
+
+        # Grade regular sobre a área das estações (centros das células)
+        x_min, x_max = self.x.min(), self.x.max()
+        y_min, y_max = self.y.min(), self.y.max()
+        colunas = int(np.ceil((x_max - x_min) / self.resolucao)) + 1
+        linhas = int(np.ceil((y_max - y_min) / self.resolucao)) + 1
+        gx = x_min + np.arange(colunas) * self.resolucao
+        gy = y_max - np.arange(linhas) * self.resolucao
+        malha_x, malha_y = np.meshgrid(gx, gy)
+        celulas = np.column_stack([malha_x.ravel(), malha_y.ravel()])
+
+        contorno = Path(fecho_convexo(self.x, self.y))
+        dentro = contorno.contains_points(celulas, radius=self.resolucao)
+
+        # Pesos só das células dentro do contorno: (células, estações)
+        dx = celulas[dentro, 0, None] - self.x[None, :]
+        dy = celulas[dentro, 1, None] - self.y[None, :]
+        distancia = np.maximum(np.hypot(dx, dy), DISTANCIA_MINIMA)
+        self.pesos = (distancia ** -self.potencia).astype(np.float32)
+        self.dentro = dentro.reshape(linhas, colunas)
+        meia = self.resolucao / 2
+        self.extensao = (gx[0] - meia, gx[-1] + meia, gy[-1] - meia, gy[0] + meia)
+
+        os.makedirs(os.path.dirname(self.arquivo), exist_ok=True)
+        with gravacao_atomica(self.arquivo, 'wb') as f:
+            np.savez(f, pesos=self.pesos, dentro=self.dentro, extensao=np.array(self.extensao))
+
+    def campo(self, valores):
+        # Grade (linhas, colunas) com o campo interpolado; NaN fora do contorno
+        # ou se houver menos de MINIMO_ESTACOES leituras válidas
+        valores = np.asarray(valores, dtype=np.float32)
+        validos = np.isfinite(valores)
+        grade = np.full(self.dentro.shape, np.nan, dtype=np.float32)
+        if validos.sum() < MINIMO_ESTACOES:
+            return grade
+        soma = self.pesos @ np.where(validos, valores, 0)
+        grade[self.dentro] = soma / (self.pesos @ validos.astype(np.float32))
+        return grade
@@ -0,0 +1,127 @@
+# Mapa interativo (Leaflet, via folium) das estações do CGE
+#
+# A página mapa_cge.html é só uma casca: mapa de fundo, enquadramento e um
+# script que baixa mapa_cge.geojson e desenha as estações (cor, valor,
+# popup com a série das últimas 24 h e link para a página do posto). A cada
+# execução só o GeoJSON, de poucos kilobytes, é regravado; a casca só é
+# gerada de novo quando a lista de estações (o enquadramento) muda.
+import os
+
+import folium
+import matplotlib.colors as mcolors
+import numpy as np
+
+from feed import chave_cache, gravacao_atomica, gravar_geojson
+
+URL_POSTO = "https://www.cgesp.org/v3/estacao.jsp?POSTO={}"
+INTERVALO_ATUALIZACAO = 10 * 60  # segundos entre releituras do GeoJSON na página
+
+_SCRIPT = """
+(function () {
+    var mapa = %(mapa)s;
+    var camada = null;
+
+    function grafico(serie) {
+        // Linha das últimas 24 h em SVG (valores nulos interrompem a linha)
+        var validos = serie.filter(function (v) { return v !== null; });
+        if (validos.length < 2) { return ''; }
+        var min = Math.min.apply(null, validos), max = Math.max.apply(null, validos);
+        var escala = max > min ? 36 / (max - min) : 0, caminho = '', novo = true;
+        serie.forEach(function (v, i) {
+            if (v === null) { novo = true; return; }
+            caminho += (novo ? 'M' : 'L') + (i * 160 / (serie.length - 1)).toFixed(1) + ',' + (38 - (v - min) * escala).toFixed(1);
+            novo = false;
+        });
+        return '<svg width="160" height="40"><path d="' + caminho + '" fill="none" stroke="#c0392b" stroke-width="1.5"/></svg>' +
+            '<div style="font-size:11px">24 h: ' + min.toFixed(1) + ' a ' + max.toFixed(1) + ' °C</div>';
+    }
+
+    function popup(p) {
+        return '<b>' + p.nome + '</b><br>' +
+            'Temperatura: ' + (p.temperatura === null ? '—' : p.temperatura.toFixed(1) + ' °C') + '<br>' +
+            'Chuva: ' + (p.chuva === null ? '—' : p.chuva.toFixed(1) + ' mm') + '<br>' +
+            grafico(p.serie_24h || []) +
+            '<a href="' + p.link + '" target="_blank" rel="noopener">Página do posto no CGE</a>';
+    }
+
+    function carregar() {
+        fetch('%(geojson)s?t=' + Date.now()).then(function (r) { return r.json(); }).then(function (dados) {
+            if (camada) { mapa.removeLayer(camada); }
+            camada = L.geoJSON(dados, {
+                pointToLayer: function (f, ll) {
+                    var p = f.properties;
+                    var marcador = L.circleMarker(ll, {radius: 14, color: '#000', weight: 1,
+                                                       fillColor: p.cor || '#999', fillOpacity: 0.8});
+                    if (p.temperatura !== null) {
+                        marcador.bindTooltip(p.temperatura.toFixed(1), {permanent: true, direction: 'center',
+                                                                      className: 'valor-cge', opacity: 1});
+                    }
+                    return marcador.bindPopup(popup(p));
+                }
+            }).addTo(mapa);
+            var horario = new Date(dados.gerado_em * 1000);
+            document.getElementById('horario-cge').textContent = 'Atualizado em ' + horario.toLocaleString('pt-BR');
+        });
+    }
+
+    carregar();
+    setInterval(carregar, %(intervalo)d);
+})();
+"""
+
+_ESTILO = """
+<style>
+.valor-cge { background: transparent; border: none; box-shadow: none; font-weight: bold; font-size: 12px; }
+.valor-cge::before { display: none; }
+#horario-cge { position: fixed; bottom: 24px; left: 10px; z-index: 1000; background: rgba(255,255,255,0.8);
+               padding: 4px 8px; border: 1px solid #000; border-radius: 4px; font: 14px sans-serif; }
+</style>
+<div id="horario-cge"></div>
+"""
+
+
+def cor_hex(valores, cmap, vmin, vmax):
+    # Cor de cada valor no colormap (None para NaN)
+    valores = np.asarray(valores, dtype=float)
+    cores = cmap(mcolors.Normalize(vmin=vmin, vmax=vmax)(valores))
+    return [None if np.isnan(v) else mcolors.to_hex(c) for v, c in zip(valores, cores)]
+
+
+def gerar_casca(caminho, caminho_geojson, lats, lons, titulo):
+    # Gera a página só se o enquadramento mudou; retorna True se regravou
+    limites = [[float(np.min(lats)), float(np.min(lons))], [float(np.max(lats)), float(np.max(lons))]]
+    chave = chave_cache(limites, caminho_geojson, titulo, _SCRIPT, _ESTILO)
+    marca = f'<!-- casca {chave} -->'
+    if os.path.exists(caminho):
+        with open(caminho, encoding='utf-8') as f:
+            if marca in f.read():
+                return False
+
+    mapa = folium.Map(tiles='CartoDB positron', control_scale=True)
+    mapa.fit_bounds(limites, padding=(20, 20))
+    raiz = mapa.get_root()
+    raiz.header.add_child(folium.Element(f'<title>{titulo}</title>'))
+    raiz.html.add_child(folium.Element(_ESTILO + marca))
+    raiz.script.add_child(folium.Element(_SCRIPT % {
+        'mapa': mapa.get_name(),
+        'geojson': os.path.basename(caminho_geojson),
+        'intervalo': INTERVALO_ATUALIZACAO * 1000,
+    }))
+    with gravacao_atomica(caminho, 'wb') as f:
+        mapa.save(f, close_file=False)
+    return True
+
+
+def gravar_estacoes(caminho_geojson, estacoes, gerado_em=None):
+    # estacoes: dicionários com posto, nome, lat, lon, temperatura, chuva, cor
+    # e serie_24h (lista de temperaturas horárias)
+    features = [(e['lon'], e['lat'], {
+        'posto': e['posto'],
+        'nome': e['nome'],
+        'temperatura': e['temperatura'],
+        'chuva': e['chuva'],
+        'cor': e['cor'],
+        'serie_24h': e['serie_24h'],
+        'link': URL_POSTO.format(e['posto']),
+    }) for e in estacoes]
+    return gravar_geojson(caminho_geojson, 'mapa_cge', features, gerado_em)
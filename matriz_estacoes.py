@@ -0,0 +1,128 @@
+# Histórico conjunto de todas as estações de uma rede (estação x tempo)
+#
+# O Historico (historico.py) guarda uma estação por diretório. Para a rede do
+# CGE, com ~30 postos lidos juntos a cada execução do mapa, as leituras vão
+# para uma matriz por grandeza e por mês (UTC):
+#   <diretorio>/<grandeza>_AAAA-MM.npy, float32, shape (slots do mês, estações)
+# com um slot a cada PASSO segundos (NaN onde não houve leitura). A ordem das
+# colunas está em <diretorio>/estacoes.json e só cresce: um posto novo ganha a
+# próxima coluna e os meses antigos, mais estreitos, são lidos com NaN.
+# Os arquivos são abertos com mmap, então "últimas 24 h de todas as estações"
+# lê só as linhas do período e "um posto no mês" lê só uma coluna.
+import calendar
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from feed import gravacao_atomica
+
+PASSO = 15 * 60  # segundos por slot
+
+
+def _inicio_mes(ano, mes):
+    return int(datetime(ano, mes, 1, tzinfo=timezone.utc).timestamp())
+
+
+def _meses(inicio, fim):
+    # (ano, mês) UTC que cobrem [inicio, fim]
+    atual = datetime.fromtimestamp(inicio, timezone.utc)
+    ano, mes = atual.year, atual.month
+    while _inicio_mes(ano, mes) <= fim:
+        yield ano, mes
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+class MatrizEstacoes:
+    def __init__(self, diretorio, grandezas, passo=PASSO):
+        self.diretorio = diretorio
+        self.grandezas = list(grandezas)
+        self.passo = passo
+        self.arquivo_estacoes = os.path.join(diretorio, 'estacoes.json')
+        os.makedirs(diretorio, exist_ok=True)
+        if os.path.exists(self.arquivo_estacoes):
+            with open(self.arquivo_estacoes) as f:
+                self.estacoes = json.load(f)['estacoes']
+        else:
+            self.estacoes = []
+        self.coluna = {e: i for i, e in enumerate(self.estacoes)}
+
+    def _salvar_estacoes(self):
+        with gravacao_atomica(self.arquivo_estacoes) as f:
+            json.dump({'passo': self.passo, 'estacoes': self.estacoes}, f, indent=1, ensure_ascii=False)
+
+    def _caminho(self, grandeza, ano, mes):
+        return os.path.join(self.diretorio, f'{grandeza}_{ano:04d}-{mes:02d}.npy')
+
+    def _slots_mes(self, ano, mes):
+        return calendar.monthrange(ano, mes)[1] * 86400 // self.passo
+
+    def _segmento(self, grandeza, ano, mes, modo='r'):
+        # Matriz mapeada do mês; na escrita, criada ou alargada até o número atual de estações
+        caminho = self._caminho(grandeza, ano, mes)
+        if not os.path.exists(caminho):
+            if modo == 'r':
+                return None
+            vazio = np.full((self._slots_mes(ano, mes), len(self.estacoes)), np.nan, dtype='<f4')
+            np.save(caminho, vazio)
+        segmento = np.load(caminho, mmap_mode=modo)
+        if modo != 'r' and segmento.shape[1] < len(self.estacoes):
+            # Posto novo: reescreve o mês com colunas extras (raro)
+            largo = np.full((segmento.shape[0], len(self.estacoes)), np.nan, dtype='<f4')
+            largo[:, :segmento.shape[1]] = segmento
+            del segmento
+            with gravacao_atomica(caminho, 'wb') as f:
+                np.save(f, largo)
+            segmento = np.load(caminho, mmap_mode=modo)
+        return segmento
+
+    def registrar(self, ts, leituras):
+        # Grava as leituras de um instante: {estação: {grandeza: valor}}
+        novas = [e for e in leituras if e not in self.coluna]
+        for estacao in novas:
+            self.coluna[estacao] = len(self.estacoes)
+            self.estacoes.append(estacao)
+        if novas:
+            self._salvar_estacoes()
+
+        momento = datetime.fromtimestamp(ts, timezone.utc)
+        slot = (int(ts) - _inicio_mes(momento.year, momento.month)) // self.passo
+        colunas = [self.coluna[e] for e in leituras]
+        for grandeza in self.grandezas:
+            valores = [np.nan if v.get(grandeza) is None else v[grandeza] for v in leituras.values()]
+            segmento = self._segmento(grandeza, momento.year, momento.month, modo='r+')
+            segmento[slot, colunas] = valores
+            segmento.flush()
+
+    def consultar(self, grandeza, inicio, fim, estacoes=None):
+        # (tempos, estações, matriz) entre dois instantes (segundos UTC), com uma
+        # linha por slot e uma coluna por estação pedida (todas, se None)
+        estacoes = self.estacoes if estacoes is None else list(estacoes)
+        colunas = np.array([self.coluna.get(e, -1) for e in estacoes], dtype=int)
+        primeiro = int(inicio) // self.passo * self.passo
+        tempos = np.arange(primeiro, int(fim) + 1, self.passo, dtype=np.int64)
+        matriz = np.full((len(tempos), len(estacoes)), np.nan, dtype='f4')
+        for ano, mes in _meses(primeiro, int(fim)):
+            segmento = self._segmento(grandeza, ano, mes)
+            if segmento is None:
+                continue
+            base = _inicio_mes(ano, mes)
+            slots = (tempos - base) // self.passo
+            linhas = (slots >= 0) & (slots < segmento.shape[0])
+            presentes = (colunas >= 0) & (colunas < segmento.shape[1])
+            if not linhas.any() or not presentes.any():
+                continue
+            a, b = slots[linhas][0], slots[linhas][-1] + 1
+            bloco = segmento[a:b]
+            matriz[np.ix_(linhas, presentes)] = bloco[:, colunas[presentes]]
+        return tempos, estacoes, matriz
+
+    def ultimas(self, grandeza, segundos=24 * 3600, agora=None, estacoes=None):
+        # Atalho: as últimas `segundos` de todas as estações
+        agora = datetime.now(timezone.utc).timestamp() if agora is None else agora
+        return self.consultar(grandeza, agora - segundos, agora, estacoes)
+
+
+def abrir_matriz(rede, grandezas, base='historico'):
+    return MatrizEstacoes(os.path.join(base, rede), grandezas)
@@ -0,0 +1,173 @@
+# Grandezas derivadas calculadas sobre a janela do armazém
+#
+# Todas as contas são vetorizadas com NumPy e feitas de uma vez sobre a janela
+# inteira (arrays estruturados de armazenamento.py): taxa de chuva com
+# detecção do zeramento diário do acumulado, chuva acumulada por período,
+# índice de calor, sensação térmica pelo vento, ponto de orvalho, pressão de
+# vapor e mínimas/máximas móveis. O resultado fica em cache por janela, então
+# o painel, o CSV e os demais consumidores da mesma execução usam os mesmos
+# arrays já calculados.
+import numpy as np
+import pandas as pd
+
+# Constantes de Magnus (Alduchov & Eskridge), as mesmas já usadas no CGE_dados.py
+MAGNUS_A = 17.625
+MAGNUS_B = 243.04
+MAGNUS_E0 = 6.1094  # hPa
+
+# Mapeamento das grandezas de cada estação para as colunas do armazém
+DERIVADAS_PELLETRON = {'temperatura': 'Temperature', 'umidade': 'Humidity', 'chuva': 'Precip', 'vento': 'Wind Speed'}
+DERIVADAS_CGE = {'temperatura': 'Temperature', 'umidade': 'Humidity', 'chuva': 'Rain'}
+
+# Janela das mínimas/máximas móveis e dos acumulados de chuva (segundos)
+JANELA_EXTREMOS = 24 * 3600
+PERIODOS_CHUVA = {'Chuva 1h': 3600, 'Chuva 24h': 24 * 3600}
+
+_cache = {}
+
+
+def pressao_saturacao(temperatura):
+    # Pressão de saturação do vapor (hPa) pela fórmula de Magnus
+    t = np.asarray(temperatura, dtype='f8')
+    return MAGNUS_E0 * np.exp(MAGNUS_A * t / (MAGNUS_B + t))
+
+
+def pressao_vapor(temperatura, umidade):
+    # Pressão parcial do vapor (hPa)
+    return np.asarray(umidade, dtype='f8') / 100 * pressao_saturacao(temperatura)
+
+
+def ponto_orvalho(temperatura, umidade):
+    # Fórmula de Magnus-Tetens; umidade nula ou inválida resulta em NaN
+    t = np.asarray(temperatura, dtype='f8')
+    h = np.asarray(umidade, dtype='f8')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(np.where(h > 0, h, np.nan) / 100) + MAGNUS_A * t / (MAGNUS_B + t)
+        return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+def indice_calor(temperatura, umidade):
+    # Índice de calor do NWS (regressão de Rothfusz com os ajustes usuais).
+    # Abaixo de ~27 °C vale a fórmula simplificada de Steadman.
+    t = np.asarray(temperatura, dtype='f8') * 9 / 5 + 32
+    h = np.asarray(umidade, dtype='f8')
+    simples = 0.5 * (t + 61 + (t - 68) * 1.2 + h * 0.094)
+    rothfusz = (-42.379 + 2.04901523 * t + 10.14333127 * h - 0.22475541 * t * h
+                - 6.83783e-3 * t ** 2 - 5.481717e-2 * h ** 2 + 1.22874e-3 * t ** 2 * h
+                + 8.5282e-4 * t * h ** 2 - 1.99e-6 * t ** 2 * h ** 2)
+    with np.errstate(invalid='ignore'):
+        seco = (h < 13) & (t >= 80) & (t <= 112)
+        rothfusz = np.where(seco, rothfusz - (13 - h) / 4 * np.sqrt(np.clip(17 - np.abs(t - 95), 0, None) / 17), rothfusz)
+        umido = (h > 85) & (t >= 80) & (t <= 87)
+        rothfusz = np.where(umido, rothfusz + (h - 85) / 10 * (87 - t) / 5, rothfusz)
+        f = np.where((simples + t) / 2 >= 80, rothfusz, simples)
+    return (f - 32) * 5 / 9
+
+
+def sensacao_termica(temperatura, vento):
+    # Sensação térmica pelo vento (fórmula canadense/NWS, vento em km/h).
+    # Fora da faixa de validade (T > 10 °C ou vento <= 4,8 km/h) vale a temperatura.
+    t = np.asarray(temperatura, dtype='f8')
+    v = np.asarray(vento, dtype='f8')
+    with np.errstate(invalid='ignore'):
+        v016 = np.power(np.clip(v, 0, None), 0.16)
+        resfriamento = 13.12 + 0.6215 * t - 11.37 * v016 + 0.3965 * t * v016
+        return np.where((t <= 10) & (v > 4.8), resfriamento, t)
+
+
+def dias_locais(ts, fuso):
+    # Dia local (datetime64[D]) de cada timestamp em segundos UTC
+    tempos = pd.to_datetime(np.asarray(ts, dtype='i8'), unit='s', utc=True).tz_convert(fuso).tz_localize(None)
+    return tempos.values.astype('datetime64[D]')
+
+
+def incrementos_chuva(ts, acumulada, fuso):
+    # Chuva caída entre amostras consecutivas a partir do acumulado do dia.
+    # O acumulado das estações zera à meia-noite local (ou quando a estação
+    # reinicia): em uma troca de dia ou queda do acumulado, o incremento é o
+    # próprio valor lido. Amostras sem leitura valem 0 e a comparação seguinte
+    # é feita com a última leitura válida.
+    acumulada = np.asarray(acumulada, dtype='f8')
+    incrementos = np.zeros(len(acumulada))
+    validas = np.flatnonzero(~np.isnan(acumulada))
+    if len(validas) < 2:
+        return incrementos
+    valores = acumulada[validas]
+    dias = dias_locais(np.asarray(ts)[validas], fuso)
+    delta = np.diff(valores)
+    zerou = (dias[1:] != dias[:-1]) | (delta < 0)
+    incrementos[validas[1:]] = np.where(zerou, valores[1:], delta)
+    return incrementos
+
+
+def somas_moveis(ts, valores, segundos):
+    # Soma de `valores` nas amostras com ts em (t - segundos, t], para cada t
+    ts = np.asarray(ts, dtype='i8')
+    acumulado = np.concatenate([[0.0], np.cumsum(np.nan_to_num(valores))])
+    inicio = np.searchsorted(ts, ts - segundos, side='right')
+    return acumulado[1:] - acumulado[inicio]
+
+
+def acumulado_diario(ts, incrementos, fuso):
+    # Chuva acumulada desde a meia-noite local, reconstruída dos incrementos
+    total = np.cumsum(incrementos)
+    if len(total) == 0:
+        return total
+    dias = dias_locais(ts, fuso)
+    inicio_dia = np.flatnonzero(np.concatenate([[True], dias[1:] != dias[:-1]]))
+    base = np.concatenate([[0.0], total])[inicio_dia]
+    return total - np.repeat(base, np.diff(np.append(inicio_dia, len(total))))
+
+
+def extremos_moveis(ts, valores, segundos):
+    # Mínimo e máximo de `valores` nas amostras com ts em (t - segundos, t].
+    # Cada janela é um intervalo [inicio, i] do array ordenado; um único
+    # reduceat com os pares (inicio, i + 1) calcula todas elas em C.
+    ts = np.asarray(ts, dtype='i8')
+    valores = np.asarray(valores, dtype='f8')
+    n = len(valores)
+    if n == 0:
+        return valores.copy(), valores.copy()
+    inicio = np.searchsorted(ts, ts - segundos, side='right')
+    indices = np.column_stack([inicio, np.arange(1, n + 1)]).ravel()
+    estendido = np.append(valores, np.nan)  # o último fim (n) precisa ser um índice válido
+    with np.errstate(invalid='ignore'):
+        minimos = np.fmin.reduceat(estendido, indices)[::2]
+        maximos = np.fmax.reduceat(estendido, indices)[::2]
+    return minimos, maximos
+
+
+def calcular(registros, fuso, spec):
+    # Todas as grandezas derivadas da janela, como {nome: array} alinhado aos
+    # registros. A mesma janela (mesmos ts inicial e final e tamanho) não é
+    # recalculada.
+    ts = np.asarray(registros['ts'])
+    chave = (tuple(sorted(spec.items())), str(fuso), len(ts),
+             int(ts[0]) if len(ts) else None, int(ts[-1]) if len(ts) else None)
+    if chave in _cache:
+        return _cache[chave]
+
+    derivadas = {}
+    t = np.asarray(registros[spec['temperatura']], dtype='f8')
+    h = np.asarray(registros[spec['umidade']], dtype='f8')
+    derivadas['Ponto de orvalho'] = ponto_orvalho(t, h)
+    derivadas['Pressão de saturação'] = pressao_saturacao(t)
+    derivadas['Pressão de vapor'] = pressao_vapor(t, h)
+    derivadas['Índice de calor'] = indice_calor(t, h)
+    if 'vento' in spec:
+        derivadas['Sensação térmica'] = sensacao_termica(t, registros[spec['vento']])
+    derivadas['Temperatura mínima 24h'], derivadas['Temperatura máxima 24h'] = extremos_moveis(ts, t, JANELA_EXTREMOS)
+    derivadas['Umidade mínima 24h'], derivadas['Umidade máxima 24h'] = extremos_moveis(ts, h, JANELA_EXTREMOS)
+
+    if 'chuva' in spec:
+        incrementos = incrementos_chuva(ts, registros[spec['chuva']], fuso)
+        derivadas['Taxa de chuva'] = incrementos
+        derivadas['Chuva do dia'] = acumulado_diario(ts, incrementos, fuso)
+        for nome, segundos in PERIODOS_CHUVA.items():
+            derivadas[nome] = somas_moveis(ts, incrementos, segundos)
+
+    # Só a janela mais recente de cada estação fica em memória
+    for antiga in [k for k in _cache if k[:2] == chave[:2]]:
+        del _cache[antiga]
+    _cache[chave] = derivadas
+    return derivadas
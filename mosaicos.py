@@ -0,0 +1,207 @@
+# Cache local dos mosaicos (tiles XYZ) do mapa de fundo
+#
+# CGE_mapa.py e mapa_estacoes.py desenham sempre a mesma região sobre o
+# CartoDB Positron. Em vez de baixar os mosaicos a cada execução pelo
+# contextily, eles são lidos de .cache/mosaicos/<provedor>/<z>/<x>/<y>.png e só
+# os que faltam são baixados (em paralelo, pelo cliente de rede.py). O cache
+# tem tamanho limitado e descarta primeiro os mosaicos usados há mais tempo
+# (a data de modificação é atualizada a cada leitura). Sem rede, o mapa é
+# montado só com o que estiver no cache.
+#
+# Pré-carregamento de uma região (ex.: a cidade de São Paulo, zooms 10 a 12):
+#   python mosaicos.py --bbox -46.95 -23.95 -46.40 -23.38 --zoom 10 12
+import argparse
+import io
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import rede
+from feed import gravacao_atomica
+
+DIRETORIO_MOSAICOS = os.path.join('.cache', 'mosaicos')
+LIMITE_BYTES = 256 * 1024 * 1024
+TAMANHO_MOSAICO = 256
+RAIO_TERRA = 6378137.0
+ORIGEM = math.pi * RAIO_TERRA  # metade da largura do mundo em EPSG:3857
+
+PROVEDORES = {
+    'positron': {
+        'url': "https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png",
+        'subdominios': 'abcd',
+        'atribuicao': "(C) OpenStreetMap contributors (C) CARTO",
+    },
+}
+
+
+# --- Geometria dos mosaicos (Web Mercator) ---
+
+def lonlat_para_mercator(lon, lat):
+    x = np.radians(lon) * RAIO_TERRA
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * RAIO_TERRA
+    return x, y
+
+
+def mercator_para_lonlat(x, y):
+    lon = np.degrees(np.asarray(x) / RAIO_TERRA)
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y) / RAIO_TERRA)) - np.pi / 2)
+    return lon, lat
+
+
+def mosaico_do_ponto(x, y, z):
+    # Índices (x, y) do mosaico que contém o ponto (em EPSG:3857) no zoom z
+    n = 2 ** z
+    tx = int(np.clip((x + ORIGEM) / (2 * ORIGEM) * n, 0, n - 1))
+    ty = int(np.clip((ORIGEM - y) / (2 * ORIGEM) * n, 0, n - 1))
+    return tx, ty
+
+
+def limites_mosaico(tx, ty, z):
+    # (x_min, x_max, y_min, y_max) do mosaico em EPSG:3857
+    lado = 2 * ORIGEM / 2 ** z
+    x_min = -ORIGEM + tx * lado
+    y_max = ORIGEM - ty * lado
+    return x_min, x_min + lado, y_max - lado, y_max
+
+
+def zoom_automatico(x_min, x_max, y_min, y_max):
+    # Mesmo critério do zoom='auto' do contextily
+    (w, e), (s, n) = mercator_para_lonlat([x_min, x_max], [y_min, y_max])
+    zoom_lon = np.ceil(np.log2(360 * 2.0 / (e - w)))
+    zoom_lat = np.ceil(np.log2(360 * 2.0 / (n - s)))
+    return int(max(zoom_lon, zoom_lat))
+
+
+def mosaicos_da_area(x_min, x_max, y_min, y_max, z):
+    x0, y0 = mosaico_do_ponto(x_min, y_max, z)
+    x1, y1 = mosaico_do_ponto(x_max, y_min, z)
+    return [(tx, ty) for ty in range(y0, y1 + 1) for tx in range(x0, x1 + 1)]
+
+
+# --- Cache em disco ---
+
+class CacheMosaicos:
+    def __init__(self, provedor='positron', diretorio=DIRETORIO_MOSAICOS, limite_bytes=LIMITE_BYTES):
+        self.nome = provedor
+        self.provedor = PROVEDORES[provedor]
+        self.diretorio = os.path.join(diretorio, provedor)
+        self.limite_bytes = limite_bytes
+        self.acertos = self.baixados = self.faltando = 0
+        self._trava = threading.Lock()
+
+    def _contar(self, evento):
+        with self._trava:
+            setattr(self, evento, getattr(self, evento) + 1)
+
+    def _caminho(self, z, tx, ty):
+        return os.path.join(self.diretorio, str(z), str(tx), f'{ty}.png')
+
+    def _url(self, z, tx, ty):
+        subdominios = self.provedor['subdominios']
+        return self.provedor['url'].format(s=subdominios[(tx + ty) % len(subdominios)], z=z, x=tx, y=ty)
+
+    def obter(self, z, tx, ty, baixar=True):
+        # Bytes do PNG do mosaico (None se não estiver no cache nem puder ser baixado)
+        caminho = self._caminho(z, tx, ty)
+        if os.path.exists(caminho):
+            os.utime(caminho)  # marca como usado recentemente (LRU)
+            self._contar('acertos')
+            with open(caminho, 'rb') as f:
+                return f.read()
+        if not baixar:
+            self._contar('faltando')
+            return None
+        try:
+            resposta = rede.get(self._url(z, tx, ty), timeout=(5, 15))
+            resposta.raise_for_status()
+        except Exception as e:
+            print(f"Mosaico {z}/{tx}/{ty} indisponível: {e}")
+            self._contar('faltando')
+            return None
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with gravacao_atomica(caminho, 'wb') as f:
+            f.write(resposta.content)
+        self._contar('baixados')
+        return resposta.content
+
+    def obter_varios(self, mosaicos, z, baixar=True):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            conteudos = list(executor.map(lambda t: self.obter(z, *t, baixar=baixar), mosaicos))
+        self.limitar()
+        return conteudos
+
+    def limitar(self):
+        # Remove os mosaicos usados há mais tempo até caber no limite
+        arquivos = []
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                if nome.endswith('.png'):
+                    caminho = os.path.join(raiz, nome)
+                    estado = os.stat(caminho)
+                    arquivos.append((estado.st_mtime, estado.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.limite_bytes:
+                break
+            os.remove(caminho)
+            total -= tamanho
+
+    def relatorio(self):
+        return f"Mosaicos {self.nome}: {self.acertos} do cache, {self.baixados} baixados, {self.faltando} faltando"
+
+
+def imagem_da_area(x_min, x_max, y_min, y_max, z, cache):
+    # Junta os mosaicos que cobrem a área; retorna (imagem RGBA, extensão em EPSG:3857)
+    mosaicos = mosaicos_da_area(x_min, x_max, y_min, y_max, z)
+    xs = sorted({tx for tx, _ in mosaicos})
+    ys = sorted({ty for _, ty in mosaicos})
+    imagem = np.zeros((len(ys) * TAMANHO_MOSAICO, len(xs) * TAMANHO_MOSAICO, 4), dtype=np.uint8)
+    for (tx, ty), conteudo in zip(mosaicos, cache.obter_varios(mosaicos, z)):
+        if conteudo is None:
+            continue
+        mosaico = np.asarray(Image.open(io.BytesIO(conteudo)).convert('RGBA').resize((TAMANHO_MOSAICO, TAMANHO_MOSAICO)))
+        i, j = ys.index(ty) * TAMANHO_MOSAICO, xs.index(tx) * TAMANHO_MOSAICO
+        imagem[i:i + TAMANHO_MOSAICO, j:j + TAMANHO_MOSAICO] = mosaico
+    e_min, _, _, n_max = limites_mosaico(xs[0], ys[0], z)
+    _, e_max, n_min, _ = limites_mosaico(xs[-1], ys[-1], z)
+    return imagem, (e_min, e_max, n_min, n_max)
+
+
+def adicionar_mapa_base(ax, zoom='auto', provedor='positron', reset_extent=True, atribuicao=True, cache=None):
+    # Substituto de ctx.add_basemap para eixos em EPSG:3857, lendo do cache
+    cache = cache or CacheMosaicos(provedor)
+    x_min, x_max, y_min, y_max = ax.axis()
+    if zoom == 'auto':
+        zoom = zoom_automatico(x_min, x_max, y_min, y_max)
+    imagem, extensao = imagem_da_area(x_min, x_max, y_min, y_max, zoom, cache)
+    ax.imshow(imagem, extent=extensao, interpolation='bilinear')
+    if reset_extent:
+        ax.axis((x_min, x_max, y_min, y_max))
+    if atribuicao:
+        ax.text(0.005, 0.005, cache.provedor['atribuicao'], transform=ax.transAxes,
+                size=8, ha='left', va='bottom', wrap=True)
+    print(cache.relatorio())
+    return cache
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pré-carrega no cache os mosaicos de uma região.")
+    parser.add_argument('--bbox', nargs=4, type=float, required=True, metavar=('OESTE', 'SUL', 'LESTE', 'NORTE'),
+                        help="região em graus (lon/lat)")
+    parser.add_argument('--zoom', nargs=2, type=int, required=True, metavar=('MIN', 'MAX'))
+    parser.add_argument('--provedor', default='positron', choices=sorted(PROVEDORES))
+    args = parser.parse_args()
+
+    cache = CacheMosaicos(args.provedor)
+    (x_min, x_max), (y_min, y_max) = lonlat_para_mercator(np.array(args.bbox[0::2]), np.array(args.bbox[1::2]))
+    inicio = time.monotonic()
+    for z in range(args.zoom[0], args.zoom[1] + 1):
+        mosaicos = mosaicos_da_area(x_min, x_max, y_min, y_max, z)
+        cache.obter_varios(mosaicos, z)
+        print(f"zoom {z}: {len(mosaicos)} mosaicos")
+    print(f"{cache.relatorio()} em {time.monotonic() - inicio:.1f} s")
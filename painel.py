@@ -0,0 +1,191 @@
+# Painel de séries temporais (graph.png e graph_cge.png)
+#
+# O painel é descrito por uma especificação declarativa: subplots com suas
+# séries, limites e formatadores, e os quadrados de cabeçalho com os valores
+# atuais. atualizaCSV.py e CGE_dados.py desenham o painel uma vez por
+# execução, com o mesmo código para a estação online e offline.
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import matplotlib.ticker as mticker
+import numpy as np
+
+from imagens import salvar_variantes
+
+# Colormaps do cabeçalho - NÃO ALTERAR O COLORMAP
+c1 = plt.cm.Purples(np.linspace(0, 1, 50))
+c2 = plt.cm.turbo(np.linspace(0, 1, 176))
+c3 = plt.get_cmap('PuRd_r')(np.linspace(0, 1, 50))
+cmap_temp = matplotlib.colors.ListedColormap(np.vstack((c1, c2, c3)))
+cmap_hum = matplotlib.colors.ListedColormap(plt.cm.coolwarm(np.linspace(1, 0, 100)))
+cmap_rad = matplotlib.colors.ListedColormap(plt.cm.Blues(np.linspace(0, 1, 50)))
+cor_neutra = cmap_hum(0.5)
+
+
+def cor_temperatura(t):
+    # Normaliza a temperatura dos limites [-10, 45]ºC para o intervalo [0, 1]
+    return cmap_temp(np.clip((t + 10) / 55, 0, 1))
+
+
+def formatador(formato):
+    return mticker.FuncFormatter(lambda x, _: format(x, formato))
+
+
+class PainelSerieTemporal:
+    def __init__(self, spec, fuso):
+        self.spec = spec
+        self.fuso = fuso
+        self.fig, self.axs = plt.subplots(len(spec['paineis']), 1, figsize=spec['tamanho'], sharex=True)
+        fonte = {'fontsize': spec['fonte_suptitulo']} if 'fonte_suptitulo' in spec else {}
+        self.fig.suptitle("Tempo nas últimas 24 horas", **fonte)
+
+    def _cabecalho(self, atual, estado, horario):
+        # Título, estado da estação e quadrados dos valores atuais
+        cab = self.spec['cabecalho']
+        self.fig.text(0.5, 1.15, f"{cab['titulo']} - Atualizado {horario:%d/%m/%Y} às {horario:%H:%M}",
+                      fontsize=cab['fonte_titulo'], ha='center')
+        self.fig.text(0.5, cab['y_estado'], estado, fontsize=16, ha='center',
+                      color='red' if estado == 'Offline' else 'green')
+        for q in cab['quadrados']:
+            v = None if atual is None else atual.get(q['coluna'])
+            if v is None or np.isnan(v):
+                cor, texto, cor_texto = cor_neutra, f"{q['titulo']}:\n NaN {q['unidade']}", 'black'
+            else:
+                cor, texto = q['cor'](v), f"{q['titulo']}:\n {v:{q['formato']}} {q['unidade']}"
+                cor_texto = 'white' if q['texto_branco'](v) else 'black'
+            self.fig.patches.append(plt.Rectangle((q['x'], cab['y_quadrado']), 0.22, cab['altura_quadrado'],
+                                                  transform=self.fig.transFigure, color=cor, lw=0))
+            centro = q['x'] + 0.11
+            self.fig.text(centro, cab['y_valor'], texto, fontsize=cab['fonte_valor'], ha='center', color=cor_texto)
+            if 'rodape' in q:
+                coluna, titulo, formato, unidade = q['rodape']
+                r = None if atual is None else atual.get(coluna)
+                r = 'NaN' if r is None or np.isnan(r) else format(r, formato)
+                self.fig.text(centro, cab['y_rodape'], f"{titulo}: {r}{unidade}", fontsize=cab['fonte_rodape'],
+                              ha='center', color='black')
+
+    def desenhar(self, df, atual, estado, horario, inicio, fim):
+        # df: janela de 24 h; atual: dict com os valores atuais (None se a estação não respondeu)
+        self._cabecalho(atual, estado, horario)
+        tempos = df['Timestamp']
+        for ax, p in zip(self.axs, self.spec['paineis']):
+            for s in p['series']:
+                estilo = {k: v for k, v in s.items() if k not in ('coluna', 'tipo')}
+                valores = df[s['coluna']]
+                if s['tipo'] == 'linha':
+                    ax.plot(tempos, valores, **estilo)
+                elif s['tipo'] == 'pontos':
+                    ax.scatter(tempos, valores, **estilo)
+                else:
+                    ax.bar(tempos, valores, **estilo)
+            ax.set_ylabel(p['rotulo'], fontsize=14)
+            ax.yaxis.set_major_formatter(formatador(p['formato']))
+            if 'legenda' in p:
+                ax.legend(loc=p['legenda'])
+            ax.grid(True)
+            # Só os rótulos já criados, como antes: o espaçamento dos ticks
+            # continua o calculado para a fonte padrão
+            for rotulo in ax.get_yticklabels():
+                rotulo.set_fontsize(14)
+            limites = p['limites']
+            limites = limites(df) if callable(limites) else limites
+            if np.all(np.isfinite(limites)):  # janela vazia: limites automáticos
+                ax.set_ylim(limites)
+
+        # Formatação do eixo X
+        self.axs[-1].xaxis.set_major_formatter(mdates.DateFormatter('%H:%M', tz=self.fuso))
+        self.axs[-1].xaxis.set_major_locator(mdates.HourLocator(interval=2))
+        self.axs[-1].set_xlim([inicio, fim])
+        for rotulo in self.axs[-1].get_xticklabels():
+            rotulo.set_fontsize(14)
+        self.axs[-1].set_xlabel("Hora local", fontsize=14)
+        self.fig.autofmt_xdate()
+        # Layout só depois dos dados, com os rótulos dos ticks definitivos
+        self.fig.tight_layout()
+
+    def salvar(self, caminho, variantes=True):
+        if variantes:
+            salvar_variantes(self.fig, caminho, largura_tv=900, bbox_inches='tight')
+        else:
+            self.fig.savefig(caminho, bbox_inches='tight')
+
+    def fechar(self):
+        plt.close(self.fig)
+
+
+# --- Especificações dos painéis ---
+
+QUADRADO_TEMPERATURA = {'x': 0.15, 'coluna': 'Temperature', 'titulo': 'Temperatura', 'unidade': '°C', 'formato': '.1f',
+                        'cor': cor_temperatura, 'texto_branco': lambda t: t >= 32 or t < 8}
+QUADRADO_UMIDADE = {'x': 0.39, 'coluna': 'Humidity', 'titulo': 'Umidade', 'unidade': '%', 'formato': '.0f',
+                    'cor': lambda h: cmap_hum(h / 100), 'texto_branco': lambda h: h >= 90}
+QUADRADO_CHUVA = {'x': 0.63, 'titulo': 'Chuva acum.', 'unidade': 'mm', 'formato': '.1f',
+                  'cor': lambda p: cmap_rad(p / 50), 'texto_branco': lambda p: p >= 30}
+
+SERIE_TEMPERATURA = {'coluna': 'Temperature', 'tipo': 'linha', 'label': "Temperatura", 'color': 'red', 'marker': 'o'}
+SERIE_ORVALHO = {'coluna': 'Dew Point', 'tipo': 'linha', 'label': "Ponto de orvalho", 'color': "green",
+                 'linestyle': "--", 'marker': 'o', 'markersize': 3}
+SERIE_UMIDADE = {'coluna': 'Humidity', 'tipo': 'linha', 'color': 'blue', 'marker': 'o'}
+SERIE_TAXA_CHUVA = {'coluna': 'Taxa de chuva', 'tipo': 'barras', 'color': 'skyblue', 'label': 'Taxa de precipitação', 'width': 0.02}
+
+
+def limites_temperatura(df):
+    return df['Dew Point'].min() - 2, df['Temperature'].max() + 2
+
+
+def limites_chuva(df):
+    return 0, df['Taxa de chuva'].max() + 5
+
+
+PAINEL_PELLETRON = {
+    'tamanho': (10, 12),
+    'fonte_suptitulo': 18,
+    'cabecalho': {
+        'titulo': "Condições meteorológicas atuais no IFUSP (Pelletron)",
+        'fonte_titulo': 16, 'y_estado': 1.00,
+        'y_quadrado': 1.06, 'altura_quadrado': 0.07,
+        'y_valor': 1.075, 'fonte_valor': 18, 'y_rodape': 1.03, 'fonte_rodape': 11,
+        'quadrados': [
+            dict(QUADRADO_TEMPERATURA, rodape=('Dew Point', 'Ponto de orvalho', '.1f', ' °C')),
+            dict(QUADRADO_UMIDADE, rodape=('Radiation', 'Radiação solar', '.0f', ' W/m²')),
+            dict(QUADRADO_CHUVA, coluna='Precip', rodape=('UV Index', 'Índice UV', '.0f', '')),
+        ],
+    },
+    'paineis': [
+        {'rotulo': "Temperatura (°C)", 'formato': '.1f', 'legenda': 'best',
+         'series': [SERIE_TEMPERATURA, SERIE_ORVALHO], 'limites': limites_temperatura},
+        {'rotulo': "Precipitação (mm)", 'formato': '.1f',
+         'series': [SERIE_TAXA_CHUVA], 'limites': limites_chuva},
+        {'rotulo': "Umidade relativa (%)", 'formato': '.0f',
+         'series': [SERIE_UMIDADE], 'limites': (0, 103)},
+        {'rotulo': "Vento (km/h)", 'formato': '.1f', 'legenda': 'best',
+         'series': [{'coluna': 'Wind Speed', 'tipo': 'linha', 'color': 'navy', 'label': 'Vento', 'marker': 'o'},
+                    {'coluna': 'Wind Gust', 'tipo': 'pontos', 'color': 'orange', 'label': 'Rajadas', 'alpha': 0.7}],
+         'limites': lambda df: (0, df['Wind Gust'].max() + 3)},
+        {'rotulo': "Radiação solar (W/m²)", 'formato': '.0f',
+         'series': [{'coluna': 'Radiation', 'tipo': 'linha', 'color': 'orange', 'marker': 'o'}], 'limites': (0, 1350)},
+    ],
+}
+
+PAINEL_CGE = {
+    'tamanho': (10, 11),
+    'cabecalho': {
+        'titulo': "Condições meteorológicas atuais na USP (Poli)",
+        'fonte_titulo': 18, 'y_estado': 0.99,
+        'y_quadrado': 1.03, 'altura_quadrado': 0.10,
+        'y_valor': 1.055, 'fonte_valor': 20, 'y_rodape': 1.00, 'fonte_rodape': 12,
+        'quadrados': [
+            dict(QUADRADO_TEMPERATURA, rodape=('Dew Point', 'Ponto de orvalho', '.1f', ' °C')),
+            QUADRADO_UMIDADE,
+            dict(QUADRADO_CHUVA, coluna='Rain'),
+        ],
+    },
+    'paineis': [
+        {'rotulo': "Temperatura (°C)", 'formato': '', 'legenda': 'upper left',
+         'series': [SERIE_TEMPERATURA, SERIE_ORVALHO], 'limites': limites_temperatura},
+        {'rotulo': "Umidade relativa (%)", 'formato': '.0f',
+         'series': [SERIE_UMIDADE], 'limites': (0, 102)},
+        {'rotulo': "Chuva (mm)", 'formato': '.1f',
+         'series': [SERIE_TAXA_CHUVA], 'limites': limites_chuva},
+    ],
+}
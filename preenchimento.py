@@ -0,0 +1,137 @@
+# Preenchimento de lacunas da estação do Pelletron com o histórico do WU
+#
+# Uma execução do cron que falha deixa um buraco no gráfico de 24 h. Aqui as
+# lacunas da janela armazenada são detectadas e preenchidas com o endpoint de
+# histórico das PWS (a mesma família de observations/hourly/7day usada em
+# mapa_estacoes.py): uma única requisição por dia local coberto pelas lacunas,
+# em vez de uma requisição por amostra. As amostras são deduplicadas pelo
+# horário da observação antes de entrar no armazém.
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import requests
+
+import rede
+from feed import gravacao_atomica
+
+# Intervalo máximo entre duas amostras antes de considerarmos que há uma lacuna
+INTERVALO_LACUNA = 30 * 60
+# Uma lacuna que chega até agora (estação ainda fora do ar) cresce a cada
+# execução; ela só é buscada de novo quando passar disso além da última tentativa
+ESPERA_LACUNA_ABERTA = 3 * 3600
+
+URL_HISTORICO = "https://api.weather.com/v2/pws/history/all?stationId={estacao}&format=json&units=m&date={data}&numericPrecision=decimal&apiKey={chave}"
+
+
+def detectar_lacunas(ts, inicio, fim, intervalo=INTERVALO_LACUNA):
+    # Intervalos (a, b) sem amostras com duração maior que `intervalo`
+    pontos = np.concatenate([[inicio], np.asarray(ts, dtype='i8'), [fim]])
+    diferencas = np.diff(pontos)
+    indices = np.nonzero(diferencas > intervalo)[0]
+    return [(int(pontos[i]), int(pontos[i + 1])) for i in indices]
+
+
+def _valor(obs, *chaves):
+    for chave in chaves:
+        v = obs.get('metric', {}).get(chave, obs.get(chave))
+        if v is not None:
+            return v
+    return None
+
+
+def converter_observacao(obs):
+    # Observação do histórico das PWS -> colunas do armazém do Pelletron
+    pressao_max, pressao_min = _valor(obs, 'pressureMax'), _valor(obs, 'pressureMin')
+    pressao = None if pressao_max is None or pressao_min is None else (pressao_max + pressao_min) / 2
+    return int(obs['epoch']), {
+        'Temperature': _valor(obs, 'tempAvg'),
+        'Humidity': _valor(obs, 'humidityAvg'),
+        'Pressure': pressao,
+        'Dew Point': _valor(obs, 'dewptAvg'),
+        'Precip': _valor(obs, 'precipTotal'),
+        'Radiation': _valor(obs, 'solarRadiationHigh'),
+        'UV Index': _valor(obs, 'uvHigh'),
+        'Wind Speed': _valor(obs, 'windspeedAvg'),
+        'Wind Dir': _valor(obs, 'winddirAvg'),
+        'Wind Gust': _valor(obs, 'windgustHigh'),
+    }
+
+
+def buscar_dia(estacao, data, chave, timeout=20):
+    # Todas as observações (resolução de 5 min) de um dia local, em uma requisição
+    url = URL_HISTORICO.format(estacao=estacao, data=data, chave=chave)
+    response = rede.get(url, timeout=timeout)
+    if response.status_code == 204:
+        return []
+    response.raise_for_status()
+    return response.json().get('observations', [])
+
+
+def _tentativas(caminho):
+    if os.path.exists(caminho):
+        with open(caminho) as f:
+            return [tuple(t) for t in json.load(f)]
+    return []
+
+
+def _dias(lacuna, fuso):
+    # Dias locais (AAAAMMDD) das pontas de uma lacuna
+    return {datetime.fromtimestamp(t, fuso).strftime('%Y%m%d') for t in lacuna}
+
+
+def preencher_lacunas(armazem, historico, estacao, fuso, agora, janela=24 * 3600, chave=None):
+    # Detecta as lacunas da janela e as preenche com o histórico do WU.
+    # Lacunas já tentadas (estação realmente sem dados) não são repetidas, nem
+    # o prolongamento de uma lacuna aberta por menos de ESPERA_LACUNA_ABERTA.
+    chave = chave or os.getenv('WU_API_KEY')
+    arquivo_tentativas = armazem.caminho + '_lacunas.json'
+    inicio = agora - janela
+    registros = armazem.janela(janela, agora=agora)
+    tentadas = [t for t in _tentativas(arquivo_tentativas) if t[1] > inicio]
+    lacunas = [l for l in detectar_lacunas(registros['ts'], inicio, agora)
+               if not any(a <= l[0] and l[1] <= b + (ESPERA_LACUNA_ABERTA if l[1] == agora else 0)
+                          for a, b in tentadas)]
+    if not lacunas:
+        return 0
+
+    # Uma requisição por dia local coberto por alguma lacuna
+    dias = sorted(set().union(*(_dias(l, fuso) for l in lacunas)))
+    existentes = set(registros['ts'].tolist())
+    amostras = {}
+    falhas = set()
+    for dia in dias:
+        try:
+            observacoes = buscar_dia(estacao, dia, chave)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Só esse dia fica para a próxima execução; os outros seguem
+            print(f"Erro ao buscar o histórico de {dia}:", e)
+            falhas.add(dia)
+            continue
+        for obs in observacoes:
+            try:
+                ts, valores = converter_observacao(obs)
+            except (KeyError, TypeError, ValueError):
+                continue
+            dentro = any(a < ts < b for a, b in lacunas)
+            if dentro and ts not in existentes:
+                amostras[ts] = valores
+
+    novos = np.zeros(len(amostras), dtype=armazem.dtype)
+    for i, ts in enumerate(sorted(amostras)):
+        novos[i]['ts'] = ts
+        for c in armazem.colunas:
+            v = amostras[ts].get(c)
+            novos[i][c] = np.nan if v is None else v
+    inseridos = armazem.mesclar(novos)
+    for ts in sorted(amostras):
+        historico.registrar(ts, amostras[ts], em_ordem=False)
+
+    # Só as lacunas cujos dias foram todos buscados contam como tentadas
+    cobertas = [l for l in lacunas if not _dias(l, fuso) & falhas]
+    with gravacao_atomica(arquivo_tentativas) as f:
+        json.dump(tentadas + cobertas, f)
+    print(f"Preenchimento: {len(lacunas)} lacuna(s), {len(dias)} requisição(ões) ({len(falhas)} com erro), "
+          f"{inseridos} amostra(s) inserida(s)")
+    return inseridos
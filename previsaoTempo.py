@@ -1,5 +1,5 @@
 import numpy as np
-import requests
+import rede
 from datetime import datetime
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
@@ -10,6 +10,8 @@ from datetime import datetime, timezone, timedelta
 import pytz
 from PIL import Image
 import os
+from imagens import salvar_variantes
+from feed import gravar_feed
 
 # Função para quebrar o texto entre palavras com um limite de largura
 def wrap_text(text, width=13):
@@ -43,7 +45,7 @@ sao_paulo_tz = pytz.timezone("America/Sao_Paulo")
 current_time = datetime.now(sao_paulo_tz)
 
 # Faz a requisição para a API do WU
-response = requests.get(url)
+response = rede.get(url)
 if response.status_code == 200:
     # Extrai os dados JSON
     forecast_data = response.json()
@@ -53,7 +55,18 @@ else:
 
 # Requisição Open-Meteo (Ajustado com timezone para SP)
 url_air = f"https://air-quality-api.open-meteo.com/v1/air-quality?latitude={latitude}&longitude={longitude}&hourly=pm2_5&timezone=America%2FSao_Paulo"
-air_data = requests.get(url_air).json()
+resposta_ar = rede.get(url_air)
+air_data = resposta_ar.json()
+
+# Previsão e qualidade do ar iguais às da última execução (cache de rede):
+# a imagem e o feed já publicados continuam valendo
+if response.inalterada and resposta_ar.inalterada and os.path.exists('previsao.png'):
+    print("Previsão inalterada desde a última execução.")
+    raise SystemExit(0)
+# Fonte fora do ar (cópia vencida no cache): mantém a previsão já publicada
+if (response.vencida or resposta_ar.vencida) and os.path.exists('previsao.png'):
+    print("Fonte da previsão fora do ar; mantendo a previsão da última execução.")
+    raise SystemExit(0)
 
 # Processamento de médias diárias de PM2.5
 pm25_hourly = air_data['hourly']['pm2_5']
@@ -203,5 +216,17 @@ plt.text(0.5, -0.45, 'Fontes: Weather Channel e OpenMeteo', ha='center', va='cen
 
 #plt.legend(loc='best')
 plt.tight_layout()
-plt.savefig('previsao.png', bbox_inches='tight')
+salvar_variantes(fig, 'previsao.png', bbox_inches='tight')
 plt.close(fig)
+
+# Feed JSON com a previsão diária (previsao.json)
+gravar_feed('previsao.json', 'previsao', {
+    'local': {'lat': latitude, 'lon': longitude},
+    'atualizado_em': int(current_time.timestamp()),
+    'dias': [{'data': data, 'ts': ts, 'nome': dia, 'temp_max': tmax, 'temp_min': tmin, 'chuva_mm': chuva,
+              'chuva_prob': prob, 'icone': icone, 'narrativa': narrativa,
+              'pm25': pm25, 'qualidade_ar': None if pm25 is None else get_aqi_br(pm25)[0]}
+             for data, ts, dia, tmax, tmin, chuva, prob, icone, narrativa, pm25
+             in zip(datas_previsao, forecast_data['validTimeUtc'], dias, temp_max, temp_min, precip_volume,
+                    precip_prob, icons, narrativas, medias_pm25)],
+})
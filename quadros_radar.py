@@ -0,0 +1,241 @@
+# Cache dos quadros de radar do RainViewer
+#
+# O índice weather-maps.json lista os quadros recentes (past) e, quando há, os
+# de previsão (nowcast), cada um com um `path` que não muda. Cada quadro é
+# baixado uma única vez, decodificado e guardado como RGBA em
+# .cache/radar/<parâmetros da imagem>/<path>.npy; nas execuções seguintes só
+# os quadros novos (normalmente um ou dois) são baixados, em paralelo. Quadros
+# que saíram do índice são apagados. Sem rede (baixar=False), só os quadros
+# já em disco são usados e nada é apagado.
+#
+# No modo mosaico (MosaicoQuadros), em vez do recorte único de 512 px, cada
+# quadro é montado com os mosaicos XYZ padrão de um zoom maior que cobrem a
+# extensão do mapa. Todos os mosaicos de todos os quadros são pedidos de uma
+# vez ao pool de conexões, então o tempo total fica perto da latência de um
+# mosaico; cada mosaico vai para .cache/radar/mosaico_<parâmetros>/<path>/ e
+# é reaproveitado enquanto o path do quadro estiver no índice.
+import glob
+import io
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import rede
+from feed import chave_cache, gravacao_atomica
+from mosaicos import (RAIO_TERRA, TAMANHO_MOSAICO, limites_mosaico, lonlat_para_mercator,
+                      mosaicos_da_area)
+
+DIRETORIO_QUADROS = os.path.join('.cache', 'radar')
+URL_QUADRO = "{host}{path}/{tamanho}/{zoom}/{lat}/{lon}/{esquema}/{opcoes}.png"
+URL_MOSAICO = "{host}{path}/{tamanho}/{zoom}/{x}/{y}/{esquema}/{opcoes}.png"
+HOST_PADRAO = "https://tilecache.rainviewer.com"
+MAX_CONEXOES = 16  # pedidos simultâneos (rede.py limita por host)
+
+
+def _ler_ou_baixar(caminho, url, descricao, baixar=True):
+    # (quadro RGBA uint8 ou None, evento para o relatório)
+    if os.path.exists(caminho):
+        return np.load(caminho), 'acertos'
+    if not baixar:
+        return None, 'faltando'
+    try:
+        resposta = rede.get(url)
+        resposta.raise_for_status()
+        quadro = np.asarray(Image.open(io.BytesIO(resposta.content)).convert('RGBA'))
+    except Exception as e:
+        print(f"{descricao} indisponível: {e}")
+        return None, 'faltando'
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with gravacao_atomica(caminho, 'wb') as f:
+        np.save(f, quadro)
+    return quadro, 'baixados'
+
+
+def quadros_do_indice(indice, previsao=True):
+    # [(time, path, é_previsão), ...] em ordem cronológica
+    radar = indice.get('radar', {})
+    quadros = [(q['time'], q['path'], False) for q in radar.get('past', [])]
+    if previsao:
+        quadros += [(q['time'], q['path'], True) for q in radar.get('nowcast', [])]
+    return quadros
+
+
+class CacheQuadros:
+    def __init__(self, tamanho, zoom, lat, lon, esquema, opcoes, host=HOST_PADRAO, diretorio=DIRETORIO_QUADROS):
+        self.parametros = dict(tamanho=tamanho, zoom=zoom, lat=lat, lon=lon, esquema=esquema, opcoes=opcoes)
+        self.host = host
+        self.diretorio = os.path.join(diretorio, f'{tamanho}_{zoom}_{lat}_{lon}_{esquema}_{opcoes}')
+        self.acertos = self.baixados = self.faltando = 0
+        self._trava = threading.Lock()
+
+    def _contar(self, evento):
+        with self._trava:
+            setattr(self, evento, getattr(self, evento) + 1)
+
+    def _caminho(self, path):
+        return os.path.join(self.diretorio, path.strip('/').replace('/', '_') + '.npy')
+
+    def url(self, path):
+        return URL_QUADRO.format(host=self.host, path=path, **self.parametros)
+
+    def obter(self, path, baixar=True):
+        # Quadro RGBA (uint8) do cache ou baixado; None se não puder ser obtido
+        quadro, evento = _ler_ou_baixar(self._caminho(path), self.url(path), f"Quadro de radar {path}", baixar)
+        self._contar(evento)
+        return quadro
+
+    def obter_varios(self, paths, baixar=True):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            quadros = list(executor.map(lambda p: self.obter(p, baixar), paths))
+        if baixar:
+            self.limitar(paths)
+        return quadros
+
+    def limitar(self, paths):
+        # Apaga os quadros que não estão mais no índice
+        manter = {self._caminho(p) for p in paths}
+        for arquivo in glob.glob(os.path.join(self.diretorio, '*.npy')):
+            if arquivo not in manter:
+                os.remove(arquivo)
+
+    def relatorio(self):
+        return f"Quadros de radar: {self.acertos} do cache, {self.baixados} baixados, {self.faltando} faltando"
+
+    def tabela(self, extensao, forma):
+        return tabela_remapeamento(self.parametros['tamanho'], self.parametros['zoom'], self.parametros['lat'],
+                                   self.parametros['lon'], extensao, forma)
+
+
+class MosaicoQuadros:
+    # Mesma interface de CacheQuadros (url, obter_varios, relatorio, tabela),
+    # com cada quadro montado pelos mosaicos XYZ que cobrem a extensão
+    def __init__(self, zoom, extensao, esquema, opcoes, host=HOST_PADRAO, diretorio=DIRETORIO_QUADROS):
+        self.parametros = dict(tamanho=TAMANHO_MOSAICO, zoom=zoom, esquema=esquema, opcoes=opcoes)
+        self.host = host
+        self.diretorio = os.path.join(diretorio, f'mosaico_{TAMANHO_MOSAICO}_{zoom}_{esquema}_{opcoes}')
+        oeste, leste, sul, norte = extensao
+        x_min, y_min = lonlat_para_mercator(oeste, sul)
+        x_max, y_max = lonlat_para_mercator(leste, norte)
+        self.mosaicos = mosaicos_da_area(x_min, x_max, y_min, y_max, zoom)
+        self.xs = sorted({tx for tx, _ in self.mosaicos})
+        self.ys = sorted({ty for _, ty in self.mosaicos})
+        x0, _, _, y1 = limites_mosaico(self.xs[0], self.ys[0], zoom)
+        _, x1, y0, _ = limites_mosaico(self.xs[-1], self.ys[-1], zoom)
+        self.limites = (x0, x1, y0, y1)  # EPSG:3857 da imagem montada
+        self.acertos = self.baixados = self.faltando = 0
+        self._trava = threading.Lock()
+
+    def _contar(self, evento):
+        with self._trava:
+            setattr(self, evento, getattr(self, evento) + 1)
+
+    def _pasta(self, path):
+        return os.path.join(self.diretorio, path.strip('/').replace('/', '_'))
+
+    def url(self, path, tx='{x}', ty='{y}'):
+        # Sem (tx, ty), o modelo XYZ do quadro (para o feed)
+        return URL_MOSAICO.format(host=self.host, path=path, x=tx, y=ty, **self.parametros)
+
+    def _obter_mosaico(self, tarefa, baixar=True):
+        path, tx, ty = tarefa
+        caminho = os.path.join(self._pasta(path), f'{tx}_{ty}.npy')
+        mosaico, evento = _ler_ou_baixar(caminho, self.url(path, tx, ty),
+                                         f"Mosaico de radar {path} {self.parametros['zoom']}/{tx}/{ty}", baixar)
+        self._contar(evento)
+        return mosaico
+
+    def obter_varios(self, paths, baixar=True):
+        # Um quadro RGBA montado por path (None se nenhum mosaico veio); os que
+        # faltarem ficam transparentes
+        tarefas = [(p, tx, ty) for p in paths for tx, ty in self.mosaicos]
+        with ThreadPoolExecutor(max_workers=MAX_CONEXOES) as executor:
+            resultados = iter(list(executor.map(lambda t: self._obter_mosaico(t, baixar), tarefas)))
+        quadros = []
+        for _ in paths:
+            imagem = np.zeros((len(self.ys) * TAMANHO_MOSAICO, len(self.xs) * TAMANHO_MOSAICO, 4), dtype=np.uint8)
+            algum = False
+            for tx, ty in self.mosaicos:
+                mosaico = next(resultados)
+                if mosaico is None or mosaico.shape[:2] != (TAMANHO_MOSAICO, TAMANHO_MOSAICO):
+                    continue
+                i, j = self.ys.index(ty) * TAMANHO_MOSAICO, self.xs.index(tx) * TAMANHO_MOSAICO
+                imagem[i:i + TAMANHO_MOSAICO, j:j + TAMANHO_MOSAICO] = mosaico
+                algum = True
+            quadros.append(imagem if algum else None)
+        if baixar:
+            self.limitar(paths)
+        return quadros
+
+    def limitar(self, paths):
+        # Apaga as pastas dos quadros que não estão mais no índice
+        manter = {self._pasta(p) for p in paths}
+        for pasta in glob.glob(os.path.join(self.diretorio, '*')):
+            if os.path.isdir(pasta) and pasta not in manter:
+                shutil.rmtree(pasta, ignore_errors=True)
+
+    def relatorio(self):
+        return (f"Mosaicos de radar (zoom {self.parametros['zoom']}, {len(self.mosaicos)} por quadro): "
+                f"{self.acertos} do cache, {self.baixados} baixados, {self.faltando} faltando")
+
+    def tabela(self, extensao, forma):
+        return tabela_limites(self.limites, (len(self.ys) * TAMANHO_MOSAICO, len(self.xs) * TAMANHO_MOSAICO),
+                              extensao, forma)
+
+
+# --- Reprojeção Web Mercator -> lon/lat (PlateCarree) ---
+#
+# A imagem /{tamanho}/{zoom}/{lat}/{lon}/ do RainViewer é um recorte em Web
+# Mercator de tamanho x tamanho pixels, centrado no ponto e com a largura de um
+# mosaico do zoom (2πR / 2^zoom metros). Para cada pixel de uma grade regular em
+# lon/lat sobre a extensão do mapa, a tabela guarda o índice (linha * tamanho +
+# coluna) do pixel do quadro que cai nele, ou tamanho² (transparente) fora do
+# quadro. O quadro montado com mosaicos usa a mesma tabela, pelos seus
+# limites. A tabela só depende da geometria e fica em .cache/radar; reprojetar
+# um quadro é uma única indexação.
+
+def tabela_remapeamento(tamanho, zoom, lat, lon, extensao, forma, diretorio=DIRETORIO_QUADROS):
+    # extensao: (oeste, leste, sul, norte) em graus; forma: (linhas, colunas) da saída
+    metade = np.pi * RAIO_TERRA / 2 ** zoom  # metade da largura do quadro em metros de Mercator
+    cx, cy = lonlat_para_mercator(lon, lat)
+    return tabela_limites((cx - metade, cx + metade, cy - metade, cy + metade), (tamanho, tamanho),
+                          extensao, forma, diretorio)
+
+
+def tabela_limites(limites, forma_origem, extensao, forma, diretorio=DIRETORIO_QUADROS):
+    # Mesma tabela para qualquer imagem em Web Mercator com limites
+    # (x_min, x_max, y_min, y_max) e forma_origem (linhas, colunas), como o
+    # quadro montado com mosaicos; fora dela, o índice linhas * colunas
+    chave = chave_cache([round(float(v), 3) for v in limites], list(forma_origem),
+                        [round(float(v), 6) for v in extensao], list(forma))
+    arquivo = os.path.join(diretorio, 'remapeamento_' + chave + '.npy')
+    if os.path.exists(arquivo):
+        return np.load(arquivo)
+
+    x_min, x_max, y_min, y_max = limites
+    linhas_origem, colunas_origem = forma_origem
+    oeste, leste, sul, norte = extensao
+    linhas, colunas = forma
+    # Centros dos pixels da saída (linha 0 ao norte)
+    lons = oeste + (np.arange(colunas) + 0.5) * (leste - oeste) / colunas
+    lats = norte - (np.arange(linhas) + 0.5) * (norte - sul) / linhas
+    x, _ = lonlat_para_mercator(lons, 0.0)
+    _, y = lonlat_para_mercator(0.0, lats)
+    j = np.floor((x - x_min) / (x_max - x_min) * colunas_origem).astype(np.int64)
+    i = np.floor((y_max - y) / (y_max - y_min) * linhas_origem).astype(np.int64)
+    dentro = (i[:, None] >= 0) & (i[:, None] < linhas_origem) & (j[None, :] >= 0) & (j[None, :] < colunas_origem)
+    tabela = np.where(dentro, i[:, None] * colunas_origem + j[None, :], linhas_origem * colunas_origem).astype(np.int32)
+
+    os.makedirs(diretorio, exist_ok=True)
+    with gravacao_atomica(arquivo, 'wb') as f:
+        np.save(f, tabela)
+    return tabela
+
+
+def reprojetar(quadro, tabela):
+    # Quadro RGBA (tamanho, tamanho, 4) -> grade da tabela; fora do quadro fica transparente
+    planos = np.concatenate([quadro.reshape(-1, quadro.shape[-1]), np.zeros((1, quadro.shape[-1]), quadro.dtype)])
+    return planos[tabela]
@@ -1,16 +1,32 @@
+import argparse
+import os
+import rede
 import requests
 import numpy as np
 import matplotlib.pyplot as plt
-from PIL import Image
-from io import BytesIO
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import cartopy.io.shapereader as shpreader
 from cartopy.geodesic import Geodesic
 from datetime import datetime
 import pytz
 from geopy.distance import geodesic
 import matplotlib.colors as mcolors
+from imagens import salvar_animacao, salvar_variantes
+from feed import gravar_feed, serie_temporal
+from quadros_radar import CacheQuadros, MosaicoQuadros, quadros_do_indice, reprojetar
+import analise_radar
+import extrapolacao_radar
+from armazenamento import abrir_armazem
+from matplotlib.patches import PathPatch
+import fundo_radar
+
+parser = argparse.ArgumentParser(description="Mapa de radar de chuvas (RainViewer).")
+parser.add_argument('--animacao', action='store_true',
+                    help="também grava radar_animado.webp/.gif com todos os quadros do índice")
+parser.add_argument('--mosaico', action='store_true',
+                    help="monta o radar com mosaicos XYZ de zoom maior (mais detalhe sobre a cidade)")
+parser.add_argument('--offline', action='store_true',
+                    help="sem rede: usa o último índice e os quadros já em .cache (inclusive para a extrapolação)")
+args = parser.parse_args()
 
 # Definições do mapa
 LAT_CENTRO, LON_CENTRO = -23.56, -46.73  # São Paulo, Brasil
@@ -18,26 +34,16 @@ ZOOM = 7  # Define o zoom do radar e do mapa
 SIZE = 512  # Resolução do radar
 COLOR_SCHEME = 4  # Paleta de cores do radar
 OPTIONS = "1_1"  # Remove fundo preto do radar
+ZOOM_MOSAICO = 9  # zoom dos mosaicos no modo --mosaico
+RESOLUCAO_MOSAICO = 1024  # pixels por lado da grade lon/lat no modo --mosaico
+QUADROS_EXTRAPOLACAO = 3  # quadros observados usados para estimar o movimento dos ecos
 
-# Tabela de conversão: Zoom → Resolução (m/pixel)
-zoom_to_resolution = {
-    0: 78271.517, 1: 39135.7585, 2: 19567.8792, 3: 9783.9396,
-    4: 4891.9698, 5: 2445.9849, 6: 1222.9925, 7: 611.4962,
-    8: 305.7481, 9: 152.8741, 10: 76.437
-}
-
-# Aproximadamente quantos metros há em 1 grau de latitude
-METROS_POR_GRAU = 111320
-
-# Obter a resolução correspondente ao zoom selecionado (metros/pixel)
-resolucao_metros = zoom_to_resolution.get(ZOOM, 1222.9925)
-
-# Calcular quantos graus aproximadamente representam a resolução do radar
-resolucao_graus = resolucao_metros / METROS_POR_GRAU
-
-# Ajustar a extensão do mapa com base na resolução
-grau_extensao = resolucao_graus * 215  # Assumindo imagem de 256x256 pixels
-delta_lat, delta_lon = grau_extensao, grau_extensao
+# Enquadramento do mapa: graus em volta do centro (o mesmo de antes). A imagem
+# do radar cobre uma área maior, em Web Mercator, e é reprojetada para esta
+# extensão (quadros_radar.reprojetar), em vez de esticada como se os pixels de
+# Mercator tivessem o mesmo tamanho em graus
+MEIA_EXTENSAO = 1.181
+delta_lat, delta_lon = MEIA_EXTENSAO, MEIA_EXTENSAO
 
 # Definição da paleta de cores da chuva usada pelo RainViewer
 rain_colors = [
@@ -50,11 +56,31 @@ rain_colors = [
     (1.0, "purple")       # Chuva extrema
 ]
 
-# Obtém o timestamp mais recente da API
+# Obtém o timestamp mais recente da API. Com --offline, ou com a API fora do
+# ar (índice vencido ou indisponível), segue com o último índice em cache e só
+# com os quadros já em disco: o mapa e a extrapolação saem dos quadros em cache
 rainviewer_url = "https://api.rainviewer.com/public/weather-maps.json"
-response = requests.get(rainviewer_url)
+offline = args.offline
+if not offline:
+    try:
+        response = rede.get(rainviewer_url)
+        offline = response.vencida
+    except requests.exceptions.RequestException as e:
+        print(f"RainViewer indisponível: {e}")
+        offline = True
+if offline:
+    response = rede.copia_em_cache(rainviewer_url)
+    if response is None:
+        raise SystemExit("Modo offline: nenhum índice do RainViewer em cache.")
+    print("Modo offline: último índice e quadros do cache.")
 data = response.json()
 
+# Índice igual ao da última execução (cache de rede): o quadro mais recente já foi desenhado
+saidas = ['radar.png'] + (['radar_animado.webp'] if args.animacao else [])
+if response.inalterada and all(os.path.exists(s) for s in saidas):
+    print("Radar inalterado desde a última execução.")
+    raise SystemExit(0)
+
 if "radar" in data and "past" in data["radar"]:
     latest_timestamp = data["radar"]["past"][-1]["time"]
     path = data["radar"]["past"][-1]["path"]
@@ -66,66 +92,112 @@ utc_time = datetime.utcfromtimestamp(latest_timestamp)
 brt_time = utc_time.replace(tzinfo=pytz.utc).astimezone(pytz.timezone("America/Sao_Paulo"))
 timestamp_brasilia = brt_time.strftime("%d/%b/%Y - %H:%M")
 
-# Constrói a URL da imagem de radar
-radar_image_url = f"https://tilecache.rainviewer.com{path}/{SIZE}/{ZOOM}/{LAT_CENTRO}/{LON_CENTRO}/{COLOR_SCHEME}/{OPTIONS}.png"
-
-# Baixa a imagem de radar
-response = requests.get(radar_image_url)
-if response.status_code == 200:
-    radar_image = Image.open(BytesIO(response.content))
+# Quadros de radar pelo cache em disco (.cache/radar): só os que ainda não
+# foram baixados em execuções anteriores vão para a rede. No modo animação,
+# todos os quadros do índice (passados e de previsão) são obtidos em paralelo.
+# No modo mosaico cada quadro é montado com os mosaicos XYZ de ZOOM_MOSAICO
+# que cobrem o mapa, todos pedidos ao mesmo tempo.
+extensao_mapa = [LON_CENTRO - delta_lon, LON_CENTRO + delta_lon, LAT_CENTRO - delta_lat, LAT_CENTRO + delta_lat]
+host_radar = data.get('host', "https://tilecache.rainviewer.com")
+if args.mosaico:
+    cache_quadros = MosaicoQuadros(ZOOM_MOSAICO, extensao_mapa, COLOR_SCHEME, OPTIONS, host=host_radar)
+    forma_radar = (RESOLUCAO_MOSAICO, RESOLUCAO_MOSAICO)
 else:
+    cache_quadros = CacheQuadros(SIZE, ZOOM, LAT_CENTRO, LON_CENTRO, COLOR_SCHEME, OPTIONS, host=host_radar)
+    forma_radar = (SIZE, SIZE)
+radar_image_url = cache_quadros.url(path)
+# Sem animação, só os últimos quadros observados (para a extrapolação)
+if args.animacao:
+    quadros = quadros_do_indice(data)
+else:
+    quadros = quadros_do_indice(data, previsao=False)[-QUADROS_EXTRAPOLACAO:]
+imagens_quadros = cache_quadros.obter_varios([p for _, p, _ in quadros], baixar=not offline)
+# Reprojeção de Web Mercator para a grade lon/lat do mapa com a tabela em cache
+tabela = cache_quadros.tabela(extensao_mapa, forma_radar)
+imagens_quadros = [None if q is None else reprojetar(q, tabela) for q in imagens_quadros]
+print(cache_quadros.relatorio())
+radar_image = imagens_quadros[[p for _, p, _ in quadros].index(path)]
+if radar_image is None and offline:
+    # Offline, o mapa fica com o quadro observado mais recente que está em disco
+    em_disco = [(ts, p, q) for (ts, p, previsao), q in zip(quadros, imagens_quadros) if q is not None and not previsao]
+    if em_disco:
+        latest_timestamp, path, radar_image = em_disco[-1]
+        radar_image_url = cache_quadros.url(path)
+        timestamp_brasilia = datetime.fromtimestamp(latest_timestamp, pytz.timezone("America/Sao_Paulo")).strftime("%d/%b/%Y - %H:%M")
+if radar_image is None:
     raise ValueError("Erro ao baixar a imagem de radar.")
 
+# Números em volta do IFUSP (analise_radar.py) para cada quadro observado,
+# guardados em dados/radar_ifusp; os de previsão não entram na série
+armazem_radar = abrir_armazem('dados/radar_ifusp', analise_radar.COLUNAS)
+metricas_atuais = None
+observados = []
+try:
+    inversa = analise_radar.tabela_inversa(*analise_radar.paleta(COLOR_SCHEME, offline=offline))
+except Exception as e:
+    print(f"Tabela de cores do radar indisponível, quadros não analisados: {e}")
+    inversa = None
+if inversa is not None:
+    distancia_km, direcao_graus = analise_radar.geometria(extensao_mapa, tabela.shape, LAT_CENTRO, LON_CENTRO)
+    for (ts, _, previsao), quadro in zip(quadros, imagens_quadros):
+        if quadro is None or previsao:
+            continue
+        dbz = analise_radar.decodificar(quadro, inversa)
+        observados.append((ts, dbz))
+        resultado = analise_radar.metricas(dbz, distancia_km, direcao_graus)
+        armazem_radar.anexar(ts, resultado)
+        if ts == latest_timestamp:
+            metricas_atuais = resultado
+    if metricas_atuais:
+        print("Radar no raio de 30 km:", ", ".join(f"{c} = {v:.2f}" for c, v in metricas_atuais.items()))
+
+# Extrapolação do movimento dos ecos para os próximos 60 min (extrapolacao_radar.py)
+extrapolacao = None
+recentes = observados[-QUADROS_EXTRAPOLACAO:]
+if len(recentes) >= 2:
+    extrapolacao = extrapolacao_radar.prever(
+        [dbz for _, dbz in recentes], [ts for ts, _ in recentes], distancia_km, direcao_graus,
+        analise_radar.km_por_pixel(extensao_mapa, tabela.shape, LAT_CENTRO))
+    chegada = extrapolacao['chegada_min']
+    print(f"Ecos se movendo a {extrapolacao['velocidade_kmh']:.0f} km/h para {extrapolacao['direcao_movimento']:.0f}°; "
+          + ("sem chuva prevista no IFUSP em 60 min" if chegada is None else f"chuva no IFUSP em ~{chegada} min"))
+
 # Criar o mapa com Cartopy
 fig, ax = plt.subplots(figsize=(7, 7), subplot_kw={'projection': ccrs.PlateCarree()})
-ax.set_extent([LON_CENTRO - delta_lon, LON_CENTRO + delta_lon, LAT_CENTRO - delta_lat, LAT_CENTRO + delta_lat], crs=ccrs.PlateCarree())
+ax.set_extent(extensao_mapa, crs=ccrs.PlateCarree())
 
-# Adicionar camadas geográficas
-ax.add_feature(cfeature.LAND, facecolor='lightgray')
-ax.add_feature(cfeature.OCEAN, facecolor='lightblue')
-ax.add_feature(cfeature.COASTLINE, linewidth=0.8)
-ax.add_feature(cfeature.BORDERS, linewidth=1.5)
+# Camadas do Natural Earth (10 m) já recortadas à extensão do mapa e a lista
+# de cidades, lidas de .cache/natural_earth (fundo_radar.py). Como o mapa está
+# em PlateCarree, as coordenadas dos Paths (lon, lat) são as do próprio eixo.
+camadas_fundo, cidades = fundo_radar.carregar(extensao_mapa)
+
+
+def adicionar_camada(nome, **estilo):
+    ax.add_patch(PathPatch(camadas_fundo[nome], transform=ax.transData, **estilo))
+
+
+# Adicionar camadas geográficas (preenchimentos abaixo do radar, que fica em zorder 0)
+adicionar_camada('continentes', facecolor='lightgray', edgecolor='none', zorder=-1)
+adicionar_camada('oceano', facecolor='lightblue', edgecolor='none', zorder=-1)
+adicionar_camada('costa', facecolor='none', edgecolor='black', linewidth=0.8)
+adicionar_camada('fronteiras', facecolor='none', edgecolor='black', linewidth=1.5)
 
 # Adicionar fronteiras estaduais com mais destaque
-ax.add_feature(cfeature.NaturalEarthFeature(category='cultural',
-                                            name='admin_1_states_provinces_lines',
-                                            scale='10m',
-                                            facecolor='none',
-                                            edgecolor='black',
-                                            linewidth=1.2))
+adicionar_camada('estados', facecolor='none', edgecolor='black', linewidth=1.2)
 
 # Adicionar estradas principais
-ax.add_feature(cfeature.NaturalEarthFeature(category='cultural',
-                                            name='roads',
-                                            scale='10m',
-                                            facecolor='none',
-                                            edgecolor='gray',
-                                            linewidth=0.8))
+adicionar_camada('estradas', facecolor='none', edgecolor='gray', linewidth=0.8)
 
 # Adicionar áreas urbanas ao mapa
-ax.add_feature(cfeature.NaturalEarthFeature(category='cultural',
-                                            name='urban_areas',
-                                            scale='10m',
-                                            facecolor='dimgrey',  # Cor cinza escuro
-                                            alpha=0.5))  # Transparência para não cobrir tudo
+adicionar_camada('areas_urbanas', facecolor='dimgrey', edgecolor='none', alpha=0.5)  # Transparência para não cobrir tudo
 
 # Adicionar imagem de radar sobre o mapa
-ax.imshow(np.array(radar_image), extent=[LON_CENTRO-delta_lon, LON_CENTRO+delta_lon, LAT_CENTRO-delta_lat, LAT_CENTRO+delta_lat], 
-          transform=ccrs.PlateCarree(), alpha=0.6)
+imagem_radar = ax.imshow(radar_image, extent=extensao_mapa, transform=ccrs.PlateCarree(), alpha=0.6)
 
-# Adicionar cidades importantes
-shapefile = shpreader.natural_earth(resolution='10m', category='cultural', name='populated_places')
-reader = shpreader.Reader(shapefile)
-
-for city in reader.records():
-    lat, lon = city.geometry.y, city.geometry.x
-    nome = city.attributes['NAME']
-    pop = city.attributes['POP_MAX']  # População da cidade
-
-    # Exibir cidades com população relevante dentro da área do mapa
-    if (LAT_CENTRO-delta_lat+0.1 <= lat <= LAT_CENTRO+delta_lat-0.1) and (LON_CENTRO-delta_lon+0.1 <= lon <= LON_CENTRO+delta_lon-0.1) and pop > 100000:
-        ax.scatter(lon, lat, color='red', s=30, transform=ccrs.PlateCarree(), label=nome)
-        ax.text(lon, lat + 0.02, nome, fontsize=9, color='black', transform=ccrs.PlateCarree(), ha='center')
+# Adicionar cidades importantes (com mais de 100 mil habitantes, pré-selecionadas em fundo_radar.py)
+for nome, lon, lat in cidades:
+    ax.scatter(lon, lat, color='red', s=30, transform=ccrs.PlateCarree(), label=nome)
+    ax.text(lon, lat + 0.02, nome, fontsize=9, color='black', transform=ccrs.PlateCarree(), ha='center')
 
 # Adicionar círculo de 30 km ao redor do centro
 geod = Geodesic()
@@ -150,8 +222,8 @@ ax.text((scale_start[1] + scale_end.longitude) / 2, scale_start[0] - 0.07,
         "20 km", fontsize=10, color='black', ha='center', transform=ccrs.PlateCarree())
 
 # Adicionar horário no canto inferior direito
-ax.text(LON_CENTRO+delta_lon*0.85, LAT_CENTRO-delta_lat*0.9, timestamp_brasilia, fontsize=10, color='black', ha='right')
-ax.scatter(LON_CENTRO, LAT_CENTRO, color='blue', s=70, transform=ccrs.PlateCarree(), label=nome)
+texto_horario = ax.text(LON_CENTRO+delta_lon*0.85, LAT_CENTRO-delta_lat*0.9, timestamp_brasilia, fontsize=10, color='black', ha='right')
+ax.scatter(LON_CENTRO, LAT_CENTRO, color='blue', s=70, transform=ccrs.PlateCarree(), label="IFUSP")
 #ax.text(LON_CENTRO, LAT_CENTRO - 0.04, "IFUSP", fontsize=12, color='black', transform=ccrs.PlateCarree(), ha='center')
 
 # Criar colormap personalizado
@@ -181,5 +253,65 @@ ax.text(LON_CENTRO, LAT_CENTRO-delta_lat*1.07, "Atualizado a cada 20 minutos", f
 ax.text(LON_CENTRO, LAT_CENTRO-delta_lat*1.14, "Fonte: RainViewer", fontsize=10, color='black', ha='center')
 plt.subplots_adjust(top=0.95)  # Reduz o espaço superior
 
-plt.savefig('radar.png')
+salvar_variantes(fig, 'radar.png')
+
+
+def horario_quadro(ts, previsao):
+    horario = datetime.fromtimestamp(ts, pytz.timezone("America/Sao_Paulo")).strftime("%d/%b/%Y - %H:%M")
+    return horario + (" (previsão)" if previsao else "")
+
+
+# Animação: o que fica abaixo do radar na ordem de desenho (continentes,
+# oceano, colorbar e títulos) é desenhado uma única vez; em cada quadro só o
+# radar e o que fica por cima dele (zorder maior, ou igual e adicionado depois:
+# fronteiras, estradas, áreas urbanas, cidades, círculo, escala e textos) são
+# redesenhados sobre a cópia do fundo (blitting)
+quadros_animados = []
+if args.animacao:
+    filhos = [a for a in ax.get_children() if a is not ax.patch]
+    posicao_radar = filhos.index(imagem_radar)
+    sobre_radar = [a for i, a in enumerate(filhos)
+                   if a.get_zorder() > imagem_radar.get_zorder()
+                   or (a.get_zorder() == imagem_radar.get_zorder() and i > posicao_radar)]
+    # Mesma ordem do Axes.draw (estável por zorder)
+    sobre_radar = sorted([a for a in sobre_radar if a.get_visible()], key=lambda a: a.get_zorder())
+    for artista in [imagem_radar] + sobre_radar:
+        artista.set_animated(True)
+    fig.canvas.draw()
+    fundo = fig.canvas.copy_from_bbox(fig.bbox)
+
+    imagens_animacao = []
+    for (ts, _, previsao), quadro in zip(quadros, imagens_quadros):
+        if quadro is None:
+            continue
+        fig.canvas.restore_region(fundo)
+        imagem_radar.set_data(quadro)
+        texto_horario.set_text(horario_quadro(ts, previsao))
+        ax.draw_artist(imagem_radar)
+        for artista in sobre_radar:
+            ax.draw_artist(artista)
+        imagens_animacao.append(np.asarray(fig.canvas.buffer_rgba()).copy())
+        quadros_animados.append(ts)
+    salvar_animacao(imagens_animacao, 'radar_animado.webp')
+
 plt.close(fig)
+
+# Feed JSON com os metadados da imagem de radar (radar.json)
+janela_radar = armazem_radar.janela(24 * 3600)
+gravar_feed('radar.json', 'radar', {
+    'fonte': "RainViewer",
+    'observado_em': latest_timestamp,
+    'imagem': radar_image_url,
+    'centro': {'lat': LAT_CENTRO, 'lon': LON_CENTRO},
+    'extensao': [LON_CENTRO - delta_lon, LON_CENTRO + delta_lon, LAT_CENTRO - delta_lat, LAT_CENTRO + delta_lat],
+    'zoom': ZOOM_MOSAICO if args.mosaico else ZOOM,
+    'mosaico': args.mosaico,
+    'quadros': [q['time'] for q in data["radar"]["past"]],
+    'animacao': quadros_animados,
+    'ifusp': {
+        'raio_km': analise_radar.RAIO_ANEL,
+        'atual': metricas_atuais,
+        'serie_24h': serie_temporal(janela_radar['ts'], {c: janela_radar[c] for c in analise_radar.COLUNAS}),
+        'extrapolacao': extrapolacao,
+    },
+})
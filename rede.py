@@ -0,0 +1,362 @@
+# Cliente HTTP compartilhado por todos os scripts
+#
+# Uma única requests.Session com pool de conexões keep-alive, tentativas com
+# recuo exponencial (urllib3 Retry, inclusive para 429/5xx e respeitando o
+# Retry-After), tempo limite sempre definido, limite de requisições
+# simultâneas e de intervalo mínimo por host, e contabilidade de latência e
+# status por host, impressa ao fim da execução.
+#
+# Fontes que mudam menos do que são consultadas (TTL_POR_FONTE) passam por um
+# cache em disco (.cache/http): dentro do TTL a resposta sai do disco sem
+# requisição; depois dele é revalidada com If-None-Match/If-Modified-Since e,
+# se o servidor não suportar, comparada pelo hash do conteúdo. Respostas
+# inalteradas são marcadas (resposta.inalterada) e processar() devolve o
+# resultado já interpretado da última vez, sem interpretar de novo.
+#
+# Com a fonte fora do ar, get() devolve a última cópia marcada como vencida
+# (resposta.vencida), desde que ela tenha menos de IDADE_MAXIMA_VENCIDA; os
+# chamadores tratam uma cópia vencida como dado ausente. processar() levanta
+# CopiaVencida nesse caso, a menos que aceitar_vencida=True. Para rodar sem
+# rede (radar.py --offline), copia_em_cache() devolve a última cópia de
+# qualquer idade, também marcada como vencida.
+#
+# Varreduras com prazo total (ex.: CGE_mapa.py) passam prazo= (instante de
+# time.monotonic()) e repetir=False: o tempo limite de cada requisição é o
+# que falta até o prazo, medido depois de obtida a vez no host, e não há
+# novas tentativas.
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from feed import gravacao_atomica
+
+# Tempo limite padrão (conexão, leitura) em segundos
+TIMEOUT = (5, 20)
+TENTATIVAS = 3
+RECUO = 0.5  # esperas de 0,5 s, 1 s, 2 s...
+STATUS_REPETIR = (429, 500, 502, 503, 504)
+CONCORRENCIA_POR_HOST = 4
+# Hosts consultados em paralelo (varredura das estações do CGE) com limite próprio
+CONCORRENCIA_ESPECIFICA = {
+    'www.cgesp.org': 8,
+    'tilecache.rainviewer.com': 16,  # mosaicos de radar (quadros_radar.MosaicoQuadros)
+}
+# Intervalo mínimo entre o início de duas requisições ao mesmo host (segundos)
+INTERVALO_POR_HOST = {
+    'api.weather.com': 0.1,
+    'www.cgesp.org': 0.05,
+}
+
+DIRETORIO_CACHE = os.path.join('.cache', 'http')
+# Idade máxima (desde a última verificação) de uma cópia servida com a fonte fora do ar
+IDADE_MAXIMA_VENCIDA = 24 * 60 * 60
+# TTL (segundos) por prefixo de host + caminho; outras URLs não passam pelo cache
+TTL_POR_FONTE = {
+    'api.weather.com/v3/wx/forecast/': 30 * 60,
+    'air-quality-api.open-meteo.com/': 60 * 60,
+    'api.rainviewer.com/public/weather-maps.json': 2 * 60,
+    'www.rainviewer.com/files/': 7 * 24 * 60 * 60,
+    'www.cgesp.org/': 2 * 60,
+}
+
+
+class CopiaVencida(requests.exceptions.RequestException):
+    # Fonte fora do ar e só uma cópia antiga no cache
+    pass
+
+
+def ttl_da_fonte(url):
+    partes = urlsplit(url)
+    endereco = partes.hostname + partes.path
+    for prefixo, ttl in TTL_POR_FONTE.items():
+        if endereco.startswith(prefixo):
+            return ttl
+    return None
+
+
+class CacheHTTP:
+    # Um par de arquivos por URL: <sha256>.bin (corpo) e <sha256>.json
+    # (validadores, hash do conteúdo e resultado interpretado). A chave é o
+    # hash da URL completa, então chaves de API não aparecem nos nomes.
+    def __init__(self, diretorio=DIRETORIO_CACHE):
+        self.diretorio = diretorio
+        self.arquivo_estatisticas = os.path.join(diretorio, 'estatisticas.json')
+        self.estatisticas = defaultdict(Counter)
+        self._trava = threading.Lock()
+
+    def _caminhos(self, url):
+        chave = hashlib.sha256(url.encode()).hexdigest()
+        base = os.path.join(self.diretorio, chave[:2], chave)
+        return base + '.json', base + '.bin'
+
+    def ler(self, url):
+        meta, corpo = self._caminhos(url)
+        try:
+            with open(meta) as f:
+                metadados = json.load(f)
+            with open(corpo, 'rb') as f:
+                return metadados, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def gravar_meta(self, url, metadados):
+        meta, _ = self._caminhos(url)
+        with gravacao_atomica(meta) as f:
+            json.dump(metadados, f)
+
+    def gravar(self, url, resposta, hash_conteudo, interpretado=None):
+        meta, corpo = self._caminhos(url)
+        os.makedirs(os.path.dirname(meta), exist_ok=True)
+        with gravacao_atomica(corpo, 'wb') as f:
+            f.write(resposta.content)
+        self.gravar_meta(url, {
+            'verificado_em': time.time(),
+            'hash': hash_conteudo,
+            'etag': resposta.headers.get('ETag'),
+            'last_modified': resposta.headers.get('Last-Modified'),
+            'content_type': resposta.headers.get('Content-Type'),
+            'encoding': resposta.encoding,
+            'interpretado': interpretado,
+        })
+
+    def contar(self, host, evento):
+        with self._trava:
+            self.estatisticas[host][evento] += 1
+
+    def salvar_estatisticas(self):
+        # Acumula as contagens desta execução nas anteriores
+        if not self.estatisticas:
+            return
+        acumuladas = {}
+        if os.path.exists(self.arquivo_estatisticas):
+            with open(self.arquivo_estatisticas) as f:
+                acumuladas = json.load(f)
+        for host, eventos in self.estatisticas.items():
+            total = Counter(acumuladas.get(host, {}))
+            total.update(eventos)
+            acumuladas[host] = dict(total)
+        os.makedirs(self.diretorio, exist_ok=True)
+        with gravacao_atomica(self.arquivo_estatisticas) as f:
+            json.dump(acumuladas, f, indent=1)
+
+
+def _resposta_do_cache(url, metadados, corpo):
+    resposta = requests.Response()
+    resposta._content = corpo
+    resposta.status_code = 200
+    resposta.url = url
+    resposta.encoding = metadados.get('encoding')
+    resposta.headers = CaseInsensitiveDict({'Content-Type': metadados.get('content_type') or ''})
+    return resposta
+
+
+class ClienteHTTP:
+    def __init__(self, timeout=TIMEOUT, tentativas=TENTATIVAS, recuo=RECUO,
+                 concorrencia=CONCORRENCIA_POR_HOST, intervalos=INTERVALO_POR_HOST, cache=None,
+                 concorrencia_especifica=CONCORRENCIA_ESPECIFICA):
+        self.timeout = timeout
+        self.cache = cache or CacheHTTP()
+        self.concorrencia = concorrencia
+        self.concorrencia_especifica = dict(concorrencia_especifica)
+        self.intervalos = dict(intervalos)
+        repetir = Retry(total=tentativas, connect=tentativas, read=tentativas, backoff_factor=recuo,
+                        status_forcelist=STATUS_REPETIR, allowed_methods=frozenset(['GET', 'HEAD']),
+                        respect_retry_after_header=True, raise_on_status=False)
+        self.sessao = self._nova_sessao(repetir)
+        # Para requisições com prazo (repetir=False)
+        self.sessao_sem_repeticao = self._nova_sessao(Retry(0, read=False, raise_on_status=False))
+
+        self._trava = threading.Lock()
+        self._semaforos = {}
+        self._travas_host = defaultdict(threading.Lock)
+        self._proximo_inicio = defaultdict(float)
+        self.latencias = defaultdict(list)
+        self.status = defaultdict(Counter)
+
+    def _nova_sessao(self, repetir):
+        sessao = requests.Session()
+        adaptador = HTTPAdapter(max_retries=repetir, pool_connections=16,
+                                pool_maxsize=max([self.concorrencia, *self.concorrencia_especifica.values()]))
+        sessao.mount('http://', adaptador)
+        sessao.mount('https://', adaptador)
+        return sessao
+
+    def _semaforo(self, host):
+        with self._trava:
+            if host not in self._semaforos:
+                self._semaforos[host] = threading.BoundedSemaphore(self.concorrencia_especifica.get(host, self.concorrencia))
+            return self._semaforos[host]
+
+    def _aguardar_vez(self, host):
+        # Espaça o início das requisições ao mesmo host
+        intervalo = self.intervalos.get(host, 0)
+        if not intervalo:
+            return
+        with self._trava:
+            trava = self._travas_host[host]
+        with trava:
+            espera = self._proximo_inicio[host] - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            self._proximo_inicio[host] = time.monotonic() + intervalo
+
+    def _registrar(self, host, status, segundos):
+        with self._trava:
+            self.latencias[host].append(segundos)
+            self.status[host][status] += 1
+
+    def get(self, url, timeout=None, ttl=None, **opcoes):
+        # Como requests.get, mas pelo pool compartilhado. Exceções de rede
+        # (requests.exceptions.RequestException) continuam sendo levantadas
+        # depois de esgotadas as tentativas. Fontes com TTL (argumento ou
+        # TTL_POR_FONTE) passam pelo cache em disco.
+        ttl = ttl_da_fonte(url) if ttl is None else ttl
+        if ttl is None:
+            resposta = self._baixar(url, timeout, **opcoes)
+            resposta.inalterada = resposta.vencida = False
+            return resposta
+        return self._get_com_cache(url, timeout, ttl, **opcoes)
+
+    def _get_com_cache(self, url, timeout, ttl, **opcoes):
+        host = urlsplit(url).hostname
+        entrada = self.cache.ler(url)
+        if entrada is not None:
+            metadados, corpo = entrada
+            if time.time() - metadados['verificado_em'] < ttl:
+                self.cache.contar(host, 'fresco')
+                resposta = _resposta_do_cache(url, metadados, corpo)
+                resposta.inalterada, resposta.vencida = True, False
+                return resposta
+            # Revalidação condicional
+            cabecalhos = dict(opcoes.pop('headers', None) or {})
+            if metadados.get('etag'):
+                cabecalhos['If-None-Match'] = metadados['etag']
+            if metadados.get('last_modified'):
+                cabecalhos['If-Modified-Since'] = metadados['last_modified']
+            opcoes['headers'] = cabecalhos
+
+        try:
+            resposta = self._baixar(url, timeout, **opcoes)
+        except requests.exceptions.RequestException:
+            if entrada is None or time.time() - entrada[0]['verificado_em'] > IDADE_MAXIMA_VENCIDA:
+                raise
+            # Fonte fora do ar: serve a última cópia, marcada como vencida
+            self.cache.contar(host, 'vencido')
+            resposta = _resposta_do_cache(url, *entrada)
+            resposta.inalterada, resposta.vencida = False, True
+            return resposta
+
+        if resposta.status_code == 304 and entrada is not None:
+            self.cache.contar(host, 'revalidado')
+            metadados['verificado_em'] = time.time()
+            self.cache.gravar_meta(url, metadados)
+            resposta = _resposta_do_cache(url, metadados, entrada[1])
+            resposta.inalterada, resposta.vencida = True, False
+            return resposta
+        resposta.vencida = False
+        if resposta.status_code != 200:
+            resposta.inalterada = False
+            return resposta
+
+        hash_conteudo = hashlib.sha256(resposta.content).hexdigest()
+        inalterada = entrada is not None and entrada[0]['hash'] == hash_conteudo
+        self.cache.contar(host, 'inalterado' if inalterada else 'novo')
+        self.cache.gravar(url, resposta, hash_conteudo, entrada[0].get('interpretado') if inalterada else None)
+        resposta.inalterada = inalterada
+        return resposta
+
+    def processar(self, url, interpretar, timeout=None, ttl=None, aceitar_vencida=False, **opcoes):
+        # Baixa pelo cache e aplica interpretar(resposta). Se o conteúdo não
+        # mudou desde a última vez, devolve o resultado guardado sem baixar
+        # nem interpretar de novo. O resultado precisa ser serializável em
+        # JSON. Retorna (resultado, inalterado). Uma cópia vencida levanta
+        # CopiaVencida, a menos que aceitar_vencida=True.
+        resposta = self.get(url, timeout=timeout, ttl=ttl, **opcoes)
+        if resposta.vencida and not aceitar_vencida:
+            raise CopiaVencida(f"{urlsplit(url).hostname} fora do ar; só há uma cópia vencida no cache")
+        if resposta.inalterada or resposta.vencida:
+            entrada = self.cache.ler(url)
+            if entrada is not None and entrada[0].get('interpretado') is not None:
+                return entrada[0]['interpretado'], True
+        resultado = interpretar(resposta)
+        entrada = self.cache.ler(url)
+        if entrada is not None and resposta.status_code == 200:
+            entrada[0]['interpretado'] = resultado
+            self.cache.gravar_meta(url, entrada[0])
+        return resultado, False
+
+    def copia_em_cache(self, url):
+        # Última cópia guardada, sem consultar a rede; None se não houver
+        entrada = self.cache.ler(url)
+        if entrada is None:
+            return None
+        resposta = _resposta_do_cache(url, *entrada)
+        resposta.inalterada, resposta.vencida = False, True
+        return resposta
+
+    def _baixar(self, url, timeout=None, prazo=None, repetir=True, **opcoes):
+        host = urlsplit(url).hostname
+        timeout = timeout or self.timeout
+        sessao = self.sessao if repetir else self.sessao_sem_repeticao
+        with self._semaforo(host):
+            self._aguardar_vez(host)
+            if prazo is not None:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise requests.exceptions.Timeout(f"Prazo esgotado antes da requisição a {host}")
+                timeout = tuple(min(t, restante) for t in timeout) if isinstance(timeout, tuple) else min(timeout, restante)
+            inicio = time.perf_counter()
+            try:
+                resposta = sessao.get(url, timeout=timeout, **opcoes)
+            except requests.exceptions.RequestException as e:
+                self._registrar(host, type(e).__name__, time.perf_counter() - inicio)
+                raise
+        self._registrar(host, resposta.status_code, time.perf_counter() - inicio)
+        return resposta
+
+    def relatorio(self):
+        linhas = []
+        for host, latencias in sorted(self.latencias.items()):
+            ms = np.asarray(latencias) * 1000
+            status = ", ".join(f"{s}: {n}" for s, n in self.status[host].most_common())
+            linhas.append(f"{host}: {len(ms)} requisição(ões), latência média {ms.mean():.0f} ms, "
+                          f"p95 {np.percentile(ms, 95):.0f} ms, máx {ms.max():.0f} ms ({status})")
+        for host, eventos in sorted(self.cache.estatisticas.items()):
+            acertos = eventos['fresco'] + eventos['revalidado'] + eventos['inalterado'] + eventos['vencido']
+            total = sum(eventos.values())
+            detalhes = ", ".join(f"{e}: {n}" for e, n in eventos.most_common())
+            linhas.append(f"cache {host}: {acertos}/{total} sem mudança ({detalhes})")
+        return "\n".join(linhas)
+
+
+cliente = ClienteHTTP()
+
+
+def get(url, timeout=None, ttl=None, **opcoes):
+    return cliente.get(url, timeout=timeout, ttl=ttl, **opcoes)
+
+
+def processar(url, interpretar, timeout=None, ttl=None, **opcoes):
+    return cliente.processar(url, interpretar, timeout=timeout, ttl=ttl, **opcoes)
+
+
+def copia_em_cache(url):
+    return cliente.copia_em_cache(url)
+
+
+@atexit.register
+def _imprimir_relatorio():
+    if cliente.latencias or cliente.cache.estatisticas:
+        print("Rede:\n" + cliente.relatorio())
+    cliente.cache.salvar_estatisticas()
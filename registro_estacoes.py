@@ -0,0 +1,70 @@
+# Cadastro das estações usadas nos mapas (estacoes.json)
+#
+# Postos do CGE e estações do Weather Underground ficam em um só arquivo, com
+# código, nome, apelidos, se estão ativas, deslocamento do rótulo no mapa (em
+# metros de EPSG:3857) e as coordenadas já projetadas em Web Mercator (x, y).
+# Os mapas leem x e y prontos; a projeção só é refeita quando o cadastro muda:
+#   python registro_estacoes.py      (recalcula x, y e regrava estacoes.json)
+import json
+
+import numpy as np
+
+from feed import gravacao_atomica
+from mosaicos import lonlat_para_mercator
+
+ARQUIVO_ESTACOES = 'estacoes.json'
+VERSAO = 1
+
+_cache = {}
+
+
+def projetar(estacao):
+    x, y = lonlat_para_mercator(estacao['lon'], estacao['lat'])
+    estacao['x'], estacao['y'] = round(float(x), 2), round(float(y), 2)
+    return estacao
+
+
+def carregar(caminho=ARQUIVO_ESTACOES):
+    # Lista de estações do cadastro (lida uma vez por processo)
+    if caminho not in _cache:
+        with open(caminho, encoding='utf-8') as f:
+            dados = json.load(f)
+        for estacao in dados['estacoes']:
+            if 'x' not in estacao or 'y' not in estacao:
+                print(f"Estação {estacao['nome']} sem projeção no cadastro; rode python registro_estacoes.py")
+                projetar(estacao)
+        _cache[caminho] = dados['estacoes']
+    return _cache[caminho]
+
+
+def estacoes(rede, ativas=True, caminho=ARQUIVO_ESTACOES):
+    # Estações de uma rede ('cge' ou 'wu'), na ordem do cadastro
+    return [e for e in carregar(caminho) if e['rede'] == rede and (e['ativa'] or not ativas)]
+
+
+def procurar(identificador, caminho=ARQUIVO_ESTACOES):
+    # Estação pelo código, nome ou apelido (None se não existir)
+    for estacao in carregar(caminho):
+        if identificador == estacao['codigo'] or identificador == estacao['nome'] or identificador in estacao['apelidos']:
+            return estacao
+    return None
+
+
+def coordenadas(lista):
+    # Arrays (x, y) em EPSG:3857 de uma lista de estações
+    return np.array([e['x'] for e in lista]), np.array([e['y'] for e in lista])
+
+
+def gravar(lista, caminho=ARQUIVO_ESTACOES):
+    # Uma estação por linha, para diffs legíveis
+    linhas = ',\n'.join('  ' + json.dumps(projetar(dict(e)), ensure_ascii=False) for e in lista)
+    with gravacao_atomica(caminho) as f:
+        f.write(f'{{"versao": {VERSAO}, "estacoes": [\n{linhas}\n]}}\n')
+    _cache.pop(caminho, None)
+
+
+if __name__ == '__main__':
+    with open(ARQUIVO_ESTACOES, encoding='utf-8') as f:
+        lista = json.load(f)['estacoes']
+    gravar(lista)
+    print(f"{ARQUIVO_ESTACOES}: {len(lista)} estações, {sum(e['ativa'] for e in lista)} ativas")
@@ -0,0 +1,158 @@
+# Posicionamento automático dos nomes das estações nos mapas
+#
+# Cada nome tem oito posições candidatas em volta do marcador (acima, abaixo,
+# à direita, à esquerda e nas diagonais). Os retângulos já ocupados (marcadores,
+# com o valor dentro, e nomes já colocados) ficam em uma grade espacial em
+# pixels, então testar uma posição só olha as células que ela cobre. A escolha
+# é gulosa: os nomes com mais vizinhos são colocados primeiro, cada um na
+# primeira candidata livre (começando pela preferida, se houver) ou, se
+# nenhuma estiver livre, na de menor sobreposição. O tamanho dos textos é
+# medido com as métricas da fonte, sem desenhar a figura.
+#
+# O resultado depende só dos textos, das posições em pixels e dos tamanhos,
+# e fica em .cache/rotulos/<chave>.json.
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import TextToPath
+
+from feed import chave_cache, gravacao_atomica
+
+DIRETORIO_ROTULOS = os.path.join('.cache', 'rotulos')
+MARGEM = 2  # pontos entre o marcador e o nome
+
+# (direção x, direção y, ha, va), na ordem de preferência
+CANDIDATOS = [
+    (0, -1, 'center', 'top'),
+    (0, 1, 'center', 'bottom'),
+    (1, 0, 'left', 'center'),
+    (-1, 0, 'right', 'center'),
+    (1, -1, 'left', 'top'),
+    (-1, -1, 'right', 'top'),
+    (1, 1, 'left', 'bottom'),
+    (-1, 1, 'right', 'bottom'),
+]
+
+_medidor = TextToPath()
+
+
+@lru_cache(maxsize=4096)
+def tamanho_texto(texto, tamanho_fonte, peso='normal'):
+    # Largura e altura do texto em pontos
+    largura, altura, _ = _medidor.get_text_width_height_descent(
+        texto, FontProperties(size=tamanho_fonte, weight=peso), ismath=False)
+    return largura, altura
+
+
+class GradeEspacial:
+    # Índice de retângulos (x0, y0, x1, y1) em células quadradas de lado fixo
+    def __init__(self, lado):
+        self.lado = lado
+        self.celulas = {}
+
+    def _indices(self, r):
+        i0, i1 = int(r[0] // self.lado), int(r[2] // self.lado)
+        j0, j1 = int(r[1] // self.lado), int(r[3] // self.lado)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+    def inserir(self, r):
+        for celula in self._indices(r):
+            self.celulas.setdefault(celula, []).append(r)
+
+    def sobreposicao(self, r):
+        # Área total de interseção com os retângulos já inseridos
+        vistos, area = set(), 0.0
+        for celula in self._indices(r):
+            for outro in self.celulas.get(celula, ()):
+                if id(outro) in vistos:
+                    continue
+                vistos.add(id(outro))
+                dx = min(r[2], outro[2]) - max(r[0], outro[0])
+                dy = min(r[3], outro[3]) - max(r[1], outro[1])
+                if dx > 0 and dy > 0:
+                    area += dx * dy
+        return area
+
+
+def _retangulo(x, y, direcao, largura, altura, distancia):
+    # Retângulo do texto ancorado a `distancia` do ponto, na direção dada
+    dx, dy = direcao
+    if dx and dy:
+        distancia = distancia * 0.75
+    ax, ay = x + dx * distancia, y + dy * distancia
+    x0 = ax - largura / 2 if dx == 0 else (ax if dx > 0 else ax - largura)
+    y0 = ay - altura / 2 if dy == 0 else (ay if dy > 0 else ay - altura)
+    return (x0, y0, x0 + largura, y0 + altura)
+
+
+def posicionar(pontos, textos, raio, tamanho_fonte, preferidos=None, area=None, obstaculos=()):
+    # pontos: (n, 2) em pontos tipográficos (1/72 pol.); raio: raio do marcador
+    # em pontos; preferidos: índice em CANDIDATOS preferido para cada texto;
+    # area: (x0, y0, x1, y1) onde os nomes devem caber. Retorna, para cada
+    # texto, (deslocamento x, deslocamento y, ha, va) em pontos.
+    pontos = np.asarray(pontos, dtype=float).reshape(-1, 2)
+    tamanhos = [tamanho_texto(t, tamanho_fonte) for t in textos]
+    distancia = raio + MARGEM
+    lado = max([distancia * 2] + [l for l, _ in tamanhos])
+    grade = GradeEspacial(lado)
+    for x, y in pontos:
+        grade.inserir((x - raio, y - raio, x + raio, y + raio))
+    for r in obstaculos:
+        grade.inserir(tuple(r))
+
+    # Os mais cercados primeiro (contagem de vizinhos a menos de dois nomes)
+    diferencas = pontos[:, None, :] - pontos[None, :, :]
+    vizinhos = (np.abs(diferencas) < 2 * lado).all(axis=2).sum(axis=1)
+    ordem = np.argsort(-vizinhos, kind='stable')
+
+    escolhas = [None] * len(textos)
+    for i in ordem:
+        x, y = pontos[i]
+        largura, altura = tamanhos[i]
+        candidatos = list(range(len(CANDIDATOS)))
+        if preferidos is not None and preferidos[i] is not None:
+            candidatos.remove(preferidos[i])
+            candidatos.insert(0, preferidos[i])
+        melhor = None
+        for k in candidatos:
+            r = _retangulo(x, y, CANDIDATOS[k][:2], largura, altura, distancia)
+            custo = grade.sobreposicao(r)
+            if area is not None:
+                fora = (max(area[0] - r[0], 0) + max(r[2] - area[2], 0)) * altura \
+                    + (max(area[1] - r[1], 0) + max(r[3] - area[3], 0)) * largura
+                custo += 10 * fora
+            if melhor is None or custo < melhor[0]:
+                melhor = (custo, k, r)
+            if custo == 0:
+                break
+        _, k, r = melhor
+        grade.inserir(r)
+        dx, dy, ha, va = CANDIDATOS[k]
+        fator = 0.75 if dx and dy else 1
+        escolhas[i] = (dx * distancia * fator, dy * distancia * fator, ha, va)
+    return escolhas
+
+
+def posicionar_no_eixo(ax, x, y, textos, raio, tamanho_fonte, preferidos=None, diretorio=DIRETORIO_ROTULOS):
+    # posicionar() para pontos em coordenadas de dados de um eixo já com
+    # limites e layout definidos; guarda o resultado em cache. Os
+    # deslocamentos retornados servem para annotate(..., textcoords='offset points').
+    fig = ax.figure
+    escala = 72 / fig.dpi
+    pontos = ax.transData.transform(np.column_stack([x, y])) * escala
+    area = tuple(np.asarray(ax.bbox.extents) * escala)
+    chave = chave_cache(list(textos), np.round(pontos, 1).tolist(), np.round(area, 1).tolist(),
+                        raio, tamanho_fonte, preferidos)
+    arquivo = os.path.join(diretorio, chave + '.json')
+    if os.path.exists(arquivo):
+        with open(arquivo) as f:
+            return [tuple(e) for e in json.load(f)]
+
+    escolhas = posicionar(pontos, textos, raio, tamanho_fonte, preferidos, area)
+    os.makedirs(diretorio, exist_ok=True)
+    with gravacao_atomica(arquivo) as f:
+        json.dump(escolhas, f)
+    return escolhas